@@ -0,0 +1,161 @@
+"""
+Adaptive admission control
+Caps how many requests per worker process may be working against the
+database at once, so a surge (all traffic landing on a freshly scaled DR
+fleet) is turned away in microseconds instead of queueing on RDS until
+everything times out together.
+
+The limit adapts to observed latency (AIMD):
+- A request slower than ADMISSION_LATENCY_TOLERANCE x its route's baseline
+  (the fastest recent latency), or one that fails with a 5xx, multiplies
+  the limit by ADMISSION_BACKOFF, at most once per ADMISSION_BACKOFF_SECONDS.
+- Fast requests while at least half the limit is in use add 1/limit, so
+  the limit grows by about one per limit's worth of good requests.
+
+Priority classes share the limit: checkout may fill it, browse only
+ADMISSION_BROWSE_SHARE of it and the deep health check (the database probe
+in /health) ADMISSION_HEALTH_SHARE, so checkout keeps headroom while browse
+is shed. Shed requests get 503 with Retry-After; shed health checks answer
+200 without the database probe, so the ALB does not pull a busy task.
+
+gunicorn runs more threads than the limit (SERVER_THREADS), so queued
+connections are picked up and shed quickly instead of waiting behind
+slow requests.
+"""
+import os
+import time
+import functools
+import threading
+
+from flask import jsonify
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true') == 'true'
+ADMISSION_MIN_LIMIT = int(os.environ.get('ADMISSION_MIN_LIMIT', '2'))
+ADMISSION_MAX_LIMIT = int(os.environ.get('ADMISSION_MAX_LIMIT', '8'))
+ADMISSION_LATENCY_TOLERANCE = float(os.environ.get('ADMISSION_LATENCY_TOLERANCE', '3'))
+# Latencies under this never count as congestion (cache hits, tiny baselines)
+ADMISSION_LATENCY_FLOOR = float(os.environ.get('ADMISSION_LATENCY_FLOOR', '0.05'))
+ADMISSION_BACKOFF = float(os.environ.get('ADMISSION_BACKOFF', '0.75'))
+ADMISSION_BACKOFF_SECONDS = float(os.environ.get('ADMISSION_BACKOFF_SECONDS', '1'))
+ADMISSION_BASELINE_WINDOW_SECONDS = float(os.environ.get('ADMISSION_BASELINE_WINDOW_SECONDS', '60'))
+ADMISSION_BROWSE_SHARE = float(os.environ.get('ADMISSION_BROWSE_SHARE', '0.75'))
+ADMISSION_HEALTH_SHARE = float(os.environ.get('ADMISSION_HEALTH_SHARE', '0.5'))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '1'))
+
+CHECKOUT = 'checkout'
+BROWSE = 'browse'
+HEALTH = 'health'
+SHARES = {CHECKOUT: 1.0, BROWSE: ADMISSION_BROWSE_SHARE, HEALTH: ADMISSION_HEALTH_SHARE}
+
+
+class AdaptiveLimiter:
+    """Per-process concurrency limit adjusted from request latency"""
+
+    def __init__(self, min_limit: int = ADMISSION_MIN_LIMIT, max_limit: int = ADMISSION_MAX_LIMIT):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.backed_off_at = 0.0
+        # route -> [window start, min this window, min last window]
+        self.baselines = {}
+        self.admitted = {priority: 0 for priority in SHARES}
+        self.shed = {priority: 0 for priority in SHARES}
+
+    def try_acquire(self, priority: str) -> bool:
+        with self.lock:
+            if self.in_flight >= max(1, int(self.limit * SHARES[priority])):
+                self.shed[priority] += 1
+                return False
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return True
+
+    def _baseline(self, route: str, latency: float, now: float) -> float:
+        window = self.baselines.get(route)
+        if window is None:
+            window = self.baselines[route] = [now, latency, latency]
+        elif now - window[0] >= ADMISSION_BASELINE_WINDOW_SECONDS:
+            window[:] = [now, latency, window[1]]
+        else:
+            window[1] = min(window[1], latency)
+        return min(window[1], window[2])
+
+    def release(self, route: str, latency: float, failed: bool):
+        now = time.monotonic()
+        with self.lock:
+            in_use = self.in_flight
+            self.in_flight -= 1
+            baseline = self._baseline(route, latency, now) if not failed else None
+            congested = failed or (
+                latency > ADMISSION_LATENCY_FLOOR and latency > baseline * ADMISSION_LATENCY_TOLERANCE
+            )
+            if congested:
+                if now - self.backed_off_at >= ADMISSION_BACKOFF_SECONDS:
+                    self.limit = max(self.min_limit, self.limit * ADMISSION_BACKOFF)
+                    self.backed_off_at = now
+            elif in_use * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed)
+            }
+
+    def metrics_lines(self) -> list:
+        """Limiter state in Prometheus text format"""
+        stats = self.snapshot()
+        lines = [
+            '# TYPE admission_limit gauge', f"admission_limit {stats['limit']}",
+            '# TYPE admission_in_flight gauge', f"admission_in_flight {stats['in_flight']}",
+            '# TYPE admission_admitted_total counter'
+        ]
+        lines += [f'admission_admitted_total{{priority="{p}"}} {n}' for p, n in sorted(stats['admitted'].items())]
+        lines.append('# TYPE admission_shed_total counter')
+        lines += [f'admission_shed_total{{priority="{p}"}} {n}' for p, n in sorted(stats['shed'].items())]
+        return lines
+
+
+limiter = AdaptiveLimiter()
+
+
+def shed_response():
+    """503 telling the client to come back shortly"""
+    response = jsonify({'error': 'Server busy, please retry shortly', 'shed': True})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER_SECONDS)
+    # Counted by admission_shed_total instead of the always-logged 5xx path
+    response.shed = True
+    return response
+
+
+def admitted(priority: str, on_shed=shed_response, bypass=None):
+    """Decorator: run the view only if the limiter admits it
+
+    bypass() returning True skips the limiter (e.g. a cached response that
+    needs no database work).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_ENABLED or (bypass is not None and bypass()):
+                return view(*args, **kwargs)
+            if not limiter.try_acquire(priority):
+                return on_shed()
+            start = time.monotonic()
+            failed = True
+            try:
+                result = view(*args, **kwargs)
+                status = result[1] if isinstance(result, tuple) else getattr(result, 'status_code', 200)
+                # 503s are fast refusals (read-only mode), not slow failures
+                failed = status >= 500 and status != 503
+                return result
+            finally:
+                limiter.release(view.__name__, time.monotonic() - start, failed)
+        return wrapper
+    return decorator
@@ -1,65 +1,193 @@
 import os
-import json
+import uuid
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import boto3
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
 
+from db import get_db_connection, release_db_connection, close_pools, prefill_pools, routing_stats, routing_metrics, PoolExhausted
+import admission
+import catalog_snapshot
+import degraded
+import fencing
+import inventory
+import idempotency
+import maintenance
+import outbox
+import serialization
+import structured_logging
+import synthetic
+import telemetry
+import warmup
+from structured_logging import get_logger
+from inventory import InsufficientStock
+from idempotency import IdempotencyConflict
+
 app = Flask(__name__)
 CORS(app)
+telemetry.init_app(app)
+# After telemetry, so compression time is inside the traced request
+serialization.init_app(app)
+telemetry.register_collector(routing_metrics)
+telemetry.register_collector(admission.limiter.metrics_lines)
+telemetry.register_collector(fencing.fence.metrics_lines)
 
 # Get AWS region from environment
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 REGION_TYPE = os.environ.get('REGION_TYPE', 'primary')
 S3_BUCKET = os.environ.get('S3_BUCKET', '')
+MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', 'true') == 'true'
+# Set by gunicorn.conf.py: background threads start in each worker after fork
+SERVER_PREFORK = os.environ.get('SERVER_PREFORK', 'false') == 'true'
+OUTBOX_ENABLED = bool(outbox.OUTBOX_SINK)
+CATALOG_CACHE_SECONDS = float(os.environ.get('CATALOG_CACHE_SECONDS', '5'))
+# How old a cached listing may be when it is served because the database is down
+CATALOG_STALE_SECONDS = float(os.environ.get('CATALOG_STALE_SECONDS', '900'))
+# Per-message cap on request error logs, so an outage does not flood CloudWatch
+ERROR_LOG_RATE = float(os.environ.get('ERROR_LOG_RATE', '5'))
 
-# Get database credentials from Secrets Manager
-def get_db_credentials():
-    secrets_client = boto3.client('secretsmanager', region_name=AWS_REGION)
-    secret_name = os.environ.get('DB_SECRET')
-    
+log = get_logger('app', region=AWS_REGION)
+
+# The catalog listing is served from memory (and precompressed) for a few
+# seconds; stock shown on it is already allowed to trail by replica lag
+catalog_cache = serialization.ResponseCache(CATALOG_CACHE_SECONDS)
+
+# Expired cart holds and idempotency keys are cleaned up in the background
+# (name, fn, writes): tasks that write are skipped on a replica or while
+# this region is passive
+maintenance_tasks = [
+    ('sweep_cart_holds', inventory.sweep_expired, True),
+    ('merge_stock_shards', inventory.merge_shards, True),
+    ('purge_idempotency_keys', idempotency.purge_expired, True),
+    ('purge_shipped_outbox', outbox.purge_shipped, True),
+    ('purge_synthetic_orders', synthetic.purge_orders, True),
+]
+# Static catalog pages in S3 for CDN-served browsing
+if catalog_snapshot.SNAPSHOT_ENABLED:
+    maintenance_tasks.append(('publish_catalog_snapshot', catalog_snapshot.publish_if_changed, False))
+
+# Checkouts queued while the writer was read-only are placed once it is
+# back and this region is active
+if degraded.DEGRADED_ORDER_QUEUE:
+    maintenance_tasks.append((
+        'replay_queued_checkouts',
+        lambda conn: 0 if fencing.fence.passive() else degraded.replay_queued_checkouts(conn, replay_checkout),
+        True
+    ))
+
+# Order events are shipped to the DR region for replay after failover
+shipper = None
+
+
+def background_connection(route: str):
+    """A writer connection for background work and warm-up, which retry on their own; None while the pool is full"""
     try:
-        response = secrets_client.get_secret_value(SecretId=secret_name)
-        secret = json.loads(response['SecretString'])
-        return secret
-    except Exception as e:
-        print(f"Error retrieving secret: {e}")
+        return get_db_connection(route=route)
+    except PoolExhausted:
         return None
 
-# Database connection
-def get_db_connection():
-    creds = get_db_credentials()
-    if not creds:
-        return None
+
+def start_background_workers():
+    """Start maintenance and outbox shipping in this process
     
-    try:
-        conn = psycopg2.connect(
-            host=creds['host'],
-            database=creds['dbname'],
-            user=creds['username'],
-            password=creds['password'],
-            port=creds.get('port', 5432)
+    Threads (and boto3 clients) created in a pre-fork master do not survive
+    the fork, so gunicorn calls this from post_fork in every worker.
+    """
+    global shipper
+    
+    # Writes arriving while this region is passive are forwarded or rejected
+    fencing.fence.start()
+    
+    if MAINTENANCE_ENABLED:
+        maintenance.start(
+            lambda: background_connection('maintenance'),
+            release_db_connection,
+            maintenance_tasks,
+            writable=lambda: fencing.fence.passive() is None
         )
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+    
+    if OUTBOX_ENABLED:
+        shipper = outbox.OutboxShipper(
+            lambda: background_connection('outbox_shipper'),
+            release_db_connection,
+            outbox.sink_from_uri(outbox.OUTBOX_SINK)
+        )
+        shipper.start()
+        telemetry.register_collector(shipper.metrics_lines)
+
+
+def stop_background_workers(timeout: float = 5.0):
+    """Let the shipper finish its batches, then close pools and flush logs"""
+    if shipper:
+        shipper.stop(timeout)
+    fencing.fence.stop()
+    close_pools()
+    structured_logging.flush()
+
+
+if not SERVER_PREFORK:
+    start_background_workers()
+
+def replay_response(status_code: int, body: str):
+    """Return a stored idempotent response verbatim"""
+    return app.response_class(
+        body,
+        status=status_code,
+        mimetype='application/json',
+        headers={'Idempotent-Replayed': 'true'}
+    )
+
+def writes_blocked():
+    """Reason the writer cannot take writes right now, else None"""
+    return degraded.writes_blocked(
+        lambda: get_db_connection(route='writer_check'),
+        release_db_connection
+    )
+
+@app.errorhandler(PoolExhausted)
+def pool_exhausted(e):
+    """Shed the request: a full pool means this process is busy, not that the writer is down"""
+    return admission.shed_response()
+
+def read_only_response(reason: str):
+    """Fast, retryable refusal of a write while the region is read-only"""
+    response = jsonify({
+        'error': 'Writes are temporarily unavailable; browsing still works',
+        'reason': reason,
+        'read_only': True,
+        'region': AWS_REGION
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(degraded.DEGRADED_RETRY_AFTER_SECONDS)
+    return response
 
 # Health check endpoint
+def shallow_health():
+    """Health answer while shedding: the process is up, the database probe is skipped"""
+    return jsonify({
+        'status': 'healthy',
+        'region': AWS_REGION,
+        'region_type': REGION_TYPE,
+        'database': 'not checked (shedding load)',
+        'admission': admission.limiter.snapshot(),
+        'timestamp': datetime.utcnow().isoformat()
+    }), 200
+
 @app.route('/health', methods=['GET'])
+@admission.admitted(admission.HEALTH, on_shed=shallow_health)
 def health():
     """Health check endpoint for ALB target group"""
     db_status = 'healthy'
     
     # Test database connection
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(route='health')
         if conn:
-            conn.close()
+            release_db_connection(conn)
         else:
             db_status = 'unhealthy'
+    except PoolExhausted:
+        return shallow_health()
     except:
         db_status = 'unhealthy'
     
@@ -68,43 +196,71 @@ def health():
         'region': AWS_REGION,
         'region_type': REGION_TYPE,
         'database': db_status,
+        'db_routing': routing_stats(),
+        'writes': degraded.status(),
+        'fencing': fencing.fence.snapshot(),
+        'admission': admission.limiter.snapshot(),
+        'outbox': shipper.snapshot() if shipper else None,
         'timestamp': datetime.utcnow().isoformat()
     }), 200 if db_status == 'healthy' else 503
 
+def load_catalog(conn):
+    """Query the catalog listing into the response cache"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute('''
+        SELECT id, name, description, price, image_url, stock
+        FROM products
+        WHERE stock > 0 AND NOT synthetic
+        ORDER BY name
+    ''')
+    products = cur.fetchall()
+    cur.close()
+    
+    return catalog_cache.put('products', {
+        'products': products,
+        'region': AWS_REGION,
+        'region_type': REGION_TYPE
+    })
+
 # Get all products
 @app.route('/api/products', methods=['GET'])
+@admission.admitted(admission.BROWSE, bypass=lambda: catalog_cache.get('products') is not None)
 def get_products():
     """Get all products from database"""
-    conn = get_db_connection()
+    cached = catalog_cache.get('products')
+    if cached:
+        return serialization.cached_response(app, cached)
+    
+    try:
+        conn = get_db_connection(readonly=True, route='get_products')
+    except PoolExhausted:
+        return stale_catalog() or admission.shed_response()
     if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
+        return stale_catalog() or (jsonify({'error': 'Database connection failed'}), 500)
     
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('''
-            SELECT id, name, description, price, image_url, stock
-            FROM products
-            WHERE stock > 0
-            ORDER BY name
-        ''')
-        products = cur.fetchall()
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            'products': products,
-            'region': AWS_REGION,
-            'region_type': REGION_TYPE
-        }), 200
+        return serialization.cached_response(app, load_catalog(conn))
     except Exception as e:
-        print(f"Error fetching products: {e}")
-        return jsonify({'error': str(e)}), 500
+        log.error('Error fetching products', error=str(e), max_per_second=ERROR_LOG_RATE)
+        return stale_catalog() or (jsonify({'error': str(e)}), 500)
+    finally:
+        release_db_connection(conn)
+
+def stale_catalog():
+    """The last cached listing (up to CATALOG_STALE_SECONDS old), or None"""
+    entry = catalog_cache.get_stale('products', CATALOG_STALE_SECONDS)
+    if entry is None:
+        return None
+    response = serialization.cached_response(app, entry)
+    response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
 
 # Get product by ID
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@admission.admitted(admission.BROWSE)
 def get_product(product_id):
     """Get a single product by ID"""
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True, route='get_product')
     if not conn:
         return jsonify({'error': 'Database connection failed'}), 500
     
@@ -117,7 +273,6 @@ def get_product(product_id):
         ''', (product_id,))
         product = cur.fetchone()
         cur.close()
-        conn.close()
         
         if product:
             return jsonify({
@@ -127,112 +282,249 @@ def get_product(product_id):
         else:
             return jsonify({'error': 'Product not found'}), 404
     except Exception as e:
-        print(f"Error fetching product: {e}")
+        log.error('Error fetching product', error=str(e), max_per_second=ERROR_LOG_RATE)
         return jsonify({'error': str(e)}), 500
+    finally:
+        release_db_connection(conn)
 
-# Add item to cart (session-based for simplicity)
+# Add item to cart (holds stock until the cart expires)
 @app.route('/api/cart', methods=['POST'])
+@fencing.fenced_write
+@admission.admitted(admission.CHECKOUT)
 def add_to_cart():
-    """Add item to cart"""
+    """Add item to cart and reserve its stock"""
     data = request.get_json()
     
     if not data or 'product_id' not in data or 'quantity' not in data:
         return jsonify({'error': 'Missing product_id or quantity'}), 400
     
-    # For simplicity, we'll just validate the product exists
-    conn = get_db_connection()
+    if not isinstance(data['quantity'], int) or data['quantity'] <= 0:
+        return jsonify({'error': 'Quantity must be a positive integer'}), 400
+    
+    cart_id = str(data.get('cart_id') or uuid.uuid4())
+    
+    blocked = writes_blocked()
+    if blocked:
+        return read_only_response(blocked)
+    
+    conn = get_db_connection(route='add_to_cart')
     if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
+        degraded.mark_unavailable('writer unreachable')
+        return read_only_response('writer unreachable')
     
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute('SELECT stock FROM products WHERE id = %s', (data['product_id'],))
+        cur.execute('SELECT id FROM products WHERE id = %s', (data['product_id'],))
         product = cur.fetchone()
         cur.close()
-        conn.close()
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        if product['stock'] < data['quantity']:
-            return jsonify({'error': 'Insufficient stock'}), 400
+        expires_at = inventory.reserve(conn, cart_id, data['product_id'], data['quantity'])
+        conn.commit()
         
         return jsonify({
             'message': 'Item added to cart',
+            'cart_id': cart_id,
             'product_id': data['product_id'],
-            'quantity': data['quantity']
+            'quantity': data['quantity'],
+            'reserved_until': expires_at.isoformat()
         }), 200
+    except InsufficientStock:
+        conn.rollback()
+        return jsonify({'error': 'Insufficient stock'}), 400
     except Exception as e:
-        print(f"Error adding to cart: {e}")
+        log.error('Error adding to cart', error=str(e), max_per_second=ERROR_LOG_RATE)
+        if degraded.note_failure(e, conn):
+            return read_only_response(degraded.status()['reason'])
+        conn.rollback()
         return jsonify({'error': str(e)}), 500
+    finally:
+        release_db_connection(conn)
+
+# Release a cart's stock holds
+@app.route('/api/cart/<cart_id>', methods=['DELETE'])
+@fencing.fenced_write
+@admission.admitted(admission.CHECKOUT)
+def release_cart(cart_id):
+    """Release all stock held by a cart"""
+    blocked = writes_blocked()
+    if blocked:
+        return read_only_response(blocked)
+    
+    conn = get_db_connection(route='release_cart')
+    if not conn:
+        degraded.mark_unavailable('writer unreachable')
+        return read_only_response('writer unreachable')
+    
+    try:
+        released = inventory.release_cart(conn, cart_id)
+        conn.commit()
+        return jsonify({'cart_id': cart_id, 'released': released}), 200
+    except Exception as e:
+        log.error('Error releasing cart', error=str(e), max_per_second=ERROR_LOG_RATE)
+        if degraded.note_failure(e, conn):
+            return read_only_response(degraded.status()['reason'])
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        release_db_connection(conn)
+
+def queue_fenced_checkout(active_region):
+    """Queue a keyed checkout fenced in a DR region that is not yet promoted, else None"""
+    # A passive region whose writer takes writes must not place orders
+    idempotency_key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+    if not (degraded.DEGRADED_ORDER_QUEUE and idempotency_key and writes_blocked()):
+        return None
+    return place_order(request.get_json(silent=True), idempotency_key)
 
 # Create order
 @app.route('/api/orders', methods=['POST'])
+@fencing.fenced_write(fallback=queue_fenced_checkout)
+@admission.admitted(admission.CHECKOUT)
 def create_order():
     """Create a new order"""
-    data = request.get_json()
-    
+    return place_order(request.get_json(), request.headers.get(idempotency.IDEMPOTENCY_HEADER))
+
+def place_order(data, idempotency_key, queue_if_read_only: bool = True):
+    """Validate and place an order (also used to replay queued checkouts)"""
     if not data or 'items' not in data:
         return jsonify({'error': 'Missing items in request'}), 400
     
-    conn = get_db_connection()
+    # Collapse repeated products into one line per product
+    quantities = {}
+    for item in data['items']:
+        if not str(item.get('product_id', '')).isdigit() or not isinstance(item.get('quantity'), int) or item['quantity'] <= 0:
+            return jsonify({'error': 'Each item needs a product_id and a positive integer quantity'}), 400
+        product_id = int(item['product_id'])
+        quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+    
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= idempotency.MAX_KEY_LENGTH:
+        return jsonify({'error': 'Invalid Idempotency-Key'}), 400
+    payload_hash = idempotency.request_hash(data) if idempotency_key else None
+    
+    blocked = writes_blocked()
+    if blocked:
+        # Only keyed checkouts are queued: the key makes the replay safe and
+        # lets the client fetch the order by retrying
+        if queue_if_read_only and degraded.DEGRADED_ORDER_QUEUE and idempotency_key:
+            degraded.queue_checkout(data, idempotency_key)
+            return jsonify({
+                'message': 'Order queued; it will be placed when the database accepts writes',
+                'status': 'queued',
+                'idempotency_key': idempotency_key,
+                'region': AWS_REGION
+            }), 202
+        return read_only_response(blocked)
+    
+    conn = get_db_connection(route='create_order')
     if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
+        degraded.mark_unavailable('writer unreachable')
+        return read_only_response('writer unreachable')
     
     try:
+        # Replay a completed request without touching products or order_items
+        if idempotency_key:
+            replay = idempotency.lookup(conn, idempotency_key, payload_hash)
+            if replay:
+                return replay_response(*replay)
+            
+            if not idempotency.claim(conn, idempotency_key, payload_hash):
+                # A concurrent request with this key committed first
+                conn.rollback()
+                replay = idempotency.lookup(conn, idempotency_key, payload_hash)
+                if replay:
+                    return replay_response(*replay)
+                return jsonify({'error': 'Request with this Idempotency-Key is in progress'}), 409
+        
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Calculate total
-        total = 0
-        for item in data['items']:
-            cur.execute('SELECT price, stock FROM products WHERE id = %s', (item['product_id'],))
-            product = cur.fetchone()
-            if not product:
+        # Fetch all prices in one round trip
+        cur.execute('SELECT id, price FROM products WHERE id = ANY(%s)', (list(quantities),))
+        prices = {row['id']: row['price'] for row in cur.fetchall()}
+        for product_id in quantities:
+            if product_id not in prices:
                 cur.close()
-                conn.close()
-                return jsonify({'error': f'Product {item["product_id"]} not found'}), 404
-            
-            if product['stock'] < item['quantity']:
-                cur.close()
-                conn.close()
-                return jsonify({'error': f'Insufficient stock for product {item["product_id"]}'}), 400
-            
-            total += product['price'] * item['quantity']
+                return jsonify({'error': f'Product {product_id} not found'}), 404
+        
+        # Consume the cart's holds, taking any uncovered quantity directly
+        inventory.checkout_stock(conn, list(quantities.items()), data.get('cart_id'))
+        
+        total = sum(prices[product_id] * quantity for product_id, quantity in quantities.items())
         
-        # Create order
+        # Create order; event_id identifies it to outbox replay
+        event_id = str(uuid.uuid4())
         cur.execute('''
-            INSERT INTO orders (total, status, created_at)
-            VALUES (%s, %s, %s)
+            INSERT INTO orders (total, status, created_at, event_id)
+            VALUES (%s, %s, %s, %s)
             RETURNING id
-        ''', (total, 'pending', datetime.utcnow()))
+        ''', (total, 'pending', datetime.utcnow(), event_id))
         order_id = cur.fetchone()['id']
         
-        # Add order items and update stock
-        for item in data['items']:
-            cur.execute('''
-                INSERT INTO order_items (order_id, product_id, quantity, price)
-                SELECT %s, %s, %s, price FROM products WHERE id = %s
-            ''', (order_id, item['product_id'], item['quantity'], item['product_id']))
-            
-            cur.execute('''
-                UPDATE products SET stock = stock - %s WHERE id = %s
-            ''', (item['quantity'], item['product_id']))
+        # Add order items
+        order_items = [(product_id, quantity, prices[product_id]) for product_id, quantity in quantities.items()]
+        execute_values(cur, '''
+            INSERT INTO order_items (order_id, product_id, quantity, price) VALUES %s
+        ''', [(order_id,) + item for item in order_items])
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        # Same transaction, so the event exists exactly when the order does
+        if OUTBOX_ENABLED:
+            outbox.publish(conn, outbox.build_event(
+                order_id, total, order_items, AWS_REGION, idempotency_key, payload_hash, event_id
+            ))
         
-        return jsonify({
+        response = {
             'message': 'Order created successfully',
             'order_id': order_id,
             'total': float(total),
             'region': AWS_REGION
-        }), 201
+        }
+        if idempotency_key:
+            idempotency.complete(conn, idempotency_key, 201, response)
+        
+        conn.commit()
+        cur.close()
+        
+        return jsonify(response), 201
+    except IdempotencyConflict as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 422
+    except InsufficientStock as e:
+        conn.rollback()
+        return jsonify({'error': f'Insufficient stock for product {e.product_id}'}), 400
     except Exception as e:
-        print(f"Error creating order: {e}")
+        log.error('Error creating order', error=str(e), max_per_second=ERROR_LOG_RATE)
+        if degraded.note_failure(e, conn):
+            return read_only_response(degraded.status()['reason'])
         if conn:
             conn.rollback()
         return jsonify({'error': str(e)}), 500
+    finally:
+        release_db_connection(conn)
+
+def replay_checkout(payload, idempotency_key) -> int:
+    """Place a checkout queued in read-only mode; returns the HTTP status"""
+    with app.app_context():
+        return app.make_response(place_order(payload, idempotency_key, queue_if_read_only=False)).status_code
+
+# Post-promotion warm-up, called by the failover orchestrator before DNS cutover
+@app.route('/api/internal/warmup', methods=['POST'])
+def warm_up():
+    """Refill pools and caches in this process (and optionally prewarm the database)"""
+    if not warmup.authorized(request.headers.get('X-Warmup-Token', '')):
+        return jsonify({'error': 'Not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    result = warmup.run(
+        lambda: background_connection('warmup'),
+        release_db_connection,
+        prefill_pools,
+        load_catalog,
+        with_prewarm=bool(data.get('prewarm'))
+    )
+    result['region'] = AWS_REGION
+    return jsonify(result), 200 if 'error' not in result else 503
 
 if __name__ == '__main__':
     # Run on port 8080 for ECS
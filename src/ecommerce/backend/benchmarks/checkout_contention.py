@@ -0,0 +1,151 @@
+"""
+Checkout Contention Benchmark
+Measures checkout throughput against concurrency when every order buys the
+same SKU, comparing a single stock row with sharded stock counters.
+
+Runs against a local Postgres (never production):
+    BENCH_DATABASE_URL=postgresql://localhost/ecommerce_bench \\
+        python benchmarks/checkout_contention.py --duration 10 --concurrency 1,4,16,64
+
+After each run the remaining stock plus units sold is checked against the
+starting stock, so any oversell or lost update shows up as a failure.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+from migrate import apply_migrations  # noqa: E402
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL', 'postgresql://localhost/ecommerce_bench')
+BENCH_SKU = 'BENCH-HOT-SKU'
+INITIAL_STOCK = 10_000_000
+
+
+def setup_product(conn, shards: int) -> int:
+    """Create (or reset) the benchmark SKU with the given shard count"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO products (sku, name, description, price, stock)
+            VALUES (%s, 'Benchmark Hot SKU', 'Contention benchmark product', 9.99, %s)
+            ON CONFLICT (sku) DO UPDATE SET stock = EXCLUDED.stock
+            RETURNING id
+        ''', (BENCH_SKU, INITIAL_STOCK))
+        product_id = cur.fetchone()[0]
+        cur.execute('DELETE FROM stock_shards WHERE product_id = %s', (product_id,))
+    conn.commit()
+
+    if shards > 1:
+        inventory.shard_product(conn, product_id, shards)
+    return product_id
+
+
+def remaining_stock(conn, product_id: int) -> int:
+    """Total unsold units, whether sharded or not"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT SUM(available) FROM stock_shards WHERE product_id = %s', (product_id,))
+        sharded = cur.fetchone()[0]
+        if sharded is not None:
+            conn.rollback()
+            return sharded
+        cur.execute('SELECT stock FROM products WHERE id = %s', (product_id,))
+        stock = cur.fetchone()[0]
+    conn.rollback()
+    return stock
+
+
+def checkout_worker(product_id: int, deadline: float, latencies: list, errors: list):
+    """Place single-unit orders for the hot SKU until the deadline"""
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    try:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                inventory.checkout_stock(conn, [(product_id, 1)])
+                with conn.cursor() as cur:
+                    cur.execute('''
+                        INSERT INTO orders (total, status) VALUES (9.99, 'bench') RETURNING id
+                    ''')
+                    order_id = cur.fetchone()[0]
+                    cur.execute('''
+                        INSERT INTO order_items (order_id, product_id, quantity, price)
+                        VALUES (%s, %s, 1, 9.99)
+                    ''', (order_id, product_id))
+                conn.commit()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                conn.rollback()
+                errors.append(str(e))
+    finally:
+        conn.close()
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of seconds, in milliseconds"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+def run(conn, shards: int, concurrency: int, duration: float) -> dict:
+    """Run one (shards, concurrency) cell and verify stock accounting"""
+    product_id = setup_product(conn, shards)
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+
+    threads = [
+        threading.Thread(target=checkout_worker, args=(product_id, deadline, latencies, errors))
+        for _ in range(concurrency)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    sold = len(latencies)
+    consistent = remaining_stock(conn, product_id) + sold == INITIAL_STOCK
+    return {
+        'mode': f'{shards} shards' if shards > 1 else 'single row',
+        'concurrency': concurrency,
+        'orders_per_second': sold / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'errors': len(errors),
+        'consistent': consistent
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single-SKU checkout contention benchmark')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per cell')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64')
+    parser.add_argument('--shards', default='1,8', help='Shard counts to compare (1 = single row)')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    apply_migrations(conn)
+
+    print(f"{'mode':<12} {'conc':>5} {'orders/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}  stock")
+    failed = False
+    for shards in [int(s) for s in args.shards.split(',')]:
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            result = run(conn, shards, concurrency, args.duration)
+            failed = failed or not result['consistent']
+            print(
+                f"{result['mode']:<12} {result['concurrency']:>5} "
+                f"{result['orders_per_second']:>10.0f} {result['p50_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['errors']:>7}  "
+                f"{'ok' if result['consistent'] else 'MISMATCH'}"
+            )
+    conn.close()
+    sys.exit(1 if failed else 0)
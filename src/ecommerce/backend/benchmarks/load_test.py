@@ -0,0 +1,569 @@
+"""
+Load and Soak Test Harness
+Drives the backend with a weighted traffic mix from closed-loop virtual
+users and reports throughput, latency percentiles, per-endpoint error
+rates, database connection counts and server CPU per request. From those
+it recommends min_tasks, max_tasks and the CPU target tracking value for
+each traffic profile.
+
+Profiles:
+    browse      catalog-heavy: list and detail reads, occasional checkout
+    checkout    cart and order writes across the catalog
+    flash_sale  most users buying one hot SKU at once
+
+By default the backend is started as a subprocess against a local Postgres
+(never production); --url targets a server that is already running, e.g.
+one started with the container's production command:
+    BENCH_DATABASE_URL=postgresql://localhost/ecommerce_bench \\
+        python benchmarks/load_test.py --profiles browse,flash_sale --users 8,32,64
+    BENCH_DATABASE_URL=... python benchmarks/load_test.py --soak 3600 --users 32
+
+Task recommendations assume CPU scales linearly with request rate. Run the
+server with the task's CPU share (docker run --cpus, or backend_cpu/1024)
+so the latency knee matches what ECS will see.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrate import apply_migrations  # noqa: E402
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL', 'postgresql://localhost/ecommerce_bench')
+SKU_PREFIX = 'LOAD-'
+HOT_SKU = 'LOAD-HOT'
+INITIAL_STOCK = 10_000_000
+RESERVOIR_SIZE = 50_000
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Weighted actions per profile; burst is how far traffic can outgrow the
+# current fleet while target tracking scales out (sets the CPU target)
+PROFILES = {
+    'browse': {
+        'actions': {'list': 60, 'detail': 32, 'cart': 5, 'checkout': 3},
+        'hot_share': 0.0,
+        'burst': 1.3
+    },
+    'checkout': {
+        'actions': {'list': 20, 'detail': 20, 'cart': 25, 'checkout': 35},
+        'hot_share': 0.0,
+        'burst': 1.5
+    },
+    'flash_sale': {
+        'actions': {'list': 10, 'detail': 25, 'cart': 25, 'checkout': 40},
+        'hot_share': 0.9,
+        'burst': 3.0
+    }
+}
+
+
+# -----------------------------------------------------------------------------
+# Database setup and sampling
+# -----------------------------------------------------------------------------
+
+def seed_catalog(conn, products: int) -> tuple:
+    """Create (or restock) the load-test SKUs; returns (product_ids, hot_id)"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO products (sku, name, description, price, image_url, stock)
+            SELECT %s || lpad(n::text, 5, '0'), 'Load Product ' || n,
+                   repeat('Load-test product description. ', 8), (5 + n %% 200) + 0.99,
+                   'https://via.placeholder.com/300x300?text=Load+' || n, %s
+            FROM generate_series(1, %s) AS n
+            ON CONFLICT (sku) DO UPDATE SET stock = EXCLUDED.stock
+        ''', (SKU_PREFIX, INITIAL_STOCK, products))
+        cur.execute('''
+            INSERT INTO products (sku, name, description, price, stock)
+            VALUES (%s, 'Flash Sale SKU', 'Load-test hot product', 19.99, %s)
+            ON CONFLICT (sku) DO UPDATE SET stock = EXCLUDED.stock
+            RETURNING id
+        ''', (HOT_SKU, INITIAL_STOCK))
+        hot_id = cur.fetchone()[0]
+        cur.execute('''
+            SELECT id FROM products WHERE sku LIKE %s AND sku <> %s ORDER BY id LIMIT %s
+        ''', (SKU_PREFIX + '%', HOT_SKU, products))
+        product_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("DELETE FROM cart_reservations WHERE cart_id LIKE 'load-%'")
+    conn.commit()
+    return product_ids, hot_id
+
+
+class ConnectionSampler:
+    """Samples pg_stat_activity once a second while a run is active"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.samples = []
+        self.running = False
+        self.thread = None
+        self.max_connections = None
+
+    def start(self):
+        self.samples = []
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='pg-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> dict:
+        self.running = False
+        self.thread.join()
+        if not self.samples:
+            return {'max_total': 0, 'max_active': 0, 'avg_total': 0.0}
+        return {
+            'max_total': max(s[0] for s in self.samples),
+            'max_active': max(s[1] for s in self.samples),
+            'avg_total': sum(s[0] for s in self.samples) / len(self.samples)
+        }
+
+    def _run(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SHOW max_connections')
+                self.max_connections = int(cur.fetchone()[0])
+                while self.running:
+                    # Excludes this sampler's own connection
+                    cur.execute('''
+                        SELECT count(*), count(*) FILTER (WHERE state = 'active')
+                        FROM pg_stat_activity
+                        WHERE datname = current_database() AND backend_type = 'client backend'
+                          AND pid <> pg_backend_pid()
+                    ''')
+                    self.samples.append(cur.fetchone())
+                    time.sleep(1.0)
+        finally:
+            conn.close()
+
+
+def process_cpu_seconds(pid: int) -> float:
+    """user+system CPU of a process tree, e.g. a pre-fork master and its workers (Linux /proc)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        total = sum(int(v) for v in fields[11:15]) / CLK_TCK
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                for child in f.read().split():
+                    child_seconds = process_cpu_seconds(int(child))
+                    if not math.isnan(child_seconds):
+                        total += child_seconds
+    except OSError:
+        pass
+    return total
+
+
+# -----------------------------------------------------------------------------
+# Traffic
+# -----------------------------------------------------------------------------
+
+class Recorder:
+    """Thread-safe per-endpoint counts and a bounded latency reservoir"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {'count': 0, 'errors': 0, 'rejected': 0, 'latencies': []}
+            stats['count'] += 1
+            if status == 0 or status >= 500:
+                stats['errors'] += 1
+            elif status >= 400:
+                stats['rejected'] += 1
+            latencies = stats['latencies']
+            if len(latencies) < RESERVOIR_SIZE:
+                latencies.append(seconds)
+            else:
+                slot = random.randrange(stats['count'])
+                if slot < RESERVOIR_SIZE:
+                    latencies[slot] = seconds
+
+    def drain(self) -> dict:
+        """Return and reset everything recorded so far"""
+        with self.lock:
+            endpoints, self.endpoints = self.endpoints, {}
+        return endpoints
+
+
+class VirtualUser(threading.Thread):
+    """Closed-loop user issuing weighted actions over one keep-alive connection"""
+
+    def __init__(self, base_url: str, profile: dict, product_ids: list, hot_id: int,
+                 recorder: Recorder, stop: threading.Event, think_ms: float):
+        super().__init__(daemon=True)
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.actions = list(profile['actions'])
+        self.weights = list(profile['actions'].values())
+        self.hot_share = profile['hot_share']
+        self.product_ids = product_ids
+        self.hot_id = hot_id
+        self.recorder = recorder
+        self.stop = stop
+        self.think = think_ms / 1000.0
+        self.conn = None
+
+    def request(self, endpoint: str, method: str, path: str, body: dict = None, headers: dict = None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = dict(headers or {})
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        status, data = 0, None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            raw = response.read()
+            status = response.status
+            if status < 300 and raw:
+                data = json.loads(raw)
+        except (OSError, http.client.HTTPException, ValueError):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+        self.recorder.record(endpoint, status, time.perf_counter() - start)
+        return status, data
+
+    def pick_product(self) -> int:
+        if self.hot_share and random.random() < self.hot_share:
+            return self.hot_id
+        return random.choice(self.product_ids)
+
+    def run(self):
+        while not self.stop.is_set():
+            action = random.choices(self.actions, self.weights)[0]
+            if action == 'list':
+                self.request('GET /api/products', 'GET', '/api/products')
+            elif action == 'detail':
+                self.request('GET /api/products/<id>', 'GET', f'/api/products/{self.pick_product()}')
+            elif action == 'cart':
+                cart_id = f'load-{uuid.uuid4()}'
+                status, _ = self.request('POST /api/cart', 'POST', '/api/cart', {
+                    'cart_id': cart_id, 'product_id': self.pick_product(), 'quantity': 1
+                })
+                if status == 200:
+                    self.request('DELETE /api/cart/<id>', 'DELETE', f'/api/cart/{cart_id}')
+            else:
+                # Reserve, then check out against the hold, as the storefront does
+                cart_id = f'load-{uuid.uuid4()}'
+                product_id = self.pick_product()
+                status, _ = self.request('POST /api/cart', 'POST', '/api/cart', {
+                    'cart_id': cart_id, 'product_id': product_id, 'quantity': 1
+                })
+                if status == 200:
+                    self.request('POST /api/orders', 'POST', '/api/orders', {
+                        'cart_id': cart_id, 'items': [{'product_id': product_id, 'quantity': 1}]
+                    }, {'Idempotency-Key': cart_id})
+            if self.think:
+                time.sleep(random.expovariate(1.0 / self.think))
+        if self.conn is not None:
+            self.conn.close()
+
+
+# -----------------------------------------------------------------------------
+# Reporting
+# -----------------------------------------------------------------------------
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of seconds, in milliseconds"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+def summarize(endpoints: dict, elapsed: float, cpu_seconds: float, connections: dict) -> dict:
+    """Totals and percentiles for one measurement window"""
+    requests = sum(s['count'] for s in endpoints.values())
+    errors = sum(s['errors'] for s in endpoints.values())
+    latencies = [v for s in endpoints.values() for v in s['latencies']]
+    return {
+        'requests': requests,
+        'rps': requests / elapsed if elapsed > 0 else 0.0,
+        'error_rate': errors / requests if requests else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'server_cpu_cores': cpu_seconds / elapsed if elapsed > 0 else float('nan'),
+        'cpu_ms_per_request': 1000 * cpu_seconds / requests if requests else float('nan'),
+        'connections': connections,
+        'endpoints': {
+            name: {
+                'count': s['count'],
+                'error_rate': s['errors'] / s['count'],
+                'rejected': s['rejected'],
+                'p50_ms': percentile(s['latencies'], 50),
+                'p99_ms': percentile(s['latencies'], 99)
+            }
+            for name, s in sorted(endpoints.items())
+        }
+    }
+
+
+def print_step(profile: str, users: int, result: dict):
+    print(
+        f"{profile:<11} {users:>5} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} "
+        f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {100 * result['error_rate']:>6.2f}% "
+        f"{result['server_cpu_cores']:>6.2f} {result['cpu_ms_per_request']:>7.2f} "
+        f"{result['connections']['max_total']:>5}"
+    )
+    for name, ep in result['endpoints'].items():
+        print(
+            f"    {name:<26} {ep['count']:>8} p50 {ep['p50_ms']:>7.1f} p99 {ep['p99_ms']:>7.1f} "
+            f"err {100 * ep['error_rate']:>5.2f}% rejected {ep['rejected']}"
+        )
+
+
+def recommend(profile: str, steps: list, args, max_connections: int) -> dict:
+    """Size the ECS service for this profile from the step results
+
+    The last step that met the p99 SLO with <1% errors gives the CPU cost
+    per request; a task with backend_cpu units serves backend_cpu/1024
+    cores of it. The target tracking value leaves room for the profile's
+    burst while scale-out catches up.
+    """
+    healthy = [(u, r) for u, r in steps if r['p99_ms'] <= args.p99_slo_ms and r['error_rate'] < 0.01]
+    broken = [(u, r) for u, r in steps if (u, r) not in healthy]
+    burst = PROFILES[profile]['burst']
+    target = max(40, min(75, int(100 / burst)))
+
+    if not healthy:
+        return {'profile': profile, 'note': f'no step met p99 <= {args.p99_slo_ms:.0f}ms; reduce --users'}
+
+    users, best = healthy[-1]
+    task_cores = args.backend_cpu / 1024
+    cpu_per_request = best['cpu_ms_per_request'] / 1000
+    if math.isnan(cpu_per_request) or cpu_per_request <= 0:
+        # No server CPU reading (--url): fall back to observed throughput
+        # per server process at the SLO knee
+        task_rps = best['rps']
+        basis = 'throughput at SLO knee'
+    else:
+        task_rps = task_cores / cpu_per_request
+        basis = f"{best['cpu_ms_per_request']:.2f} CPU ms/request"
+
+    per_task_at_target = task_rps * target / 100
+    min_tasks = max(2, math.ceil(args.baseline_rps / per_task_at_target))
+    max_tasks = max(min_tasks, math.ceil(args.peak_rps / per_task_at_target))
+
+    notes = []
+    if broken:
+        # Latency that breaks the SLO before the server's CPU is busy points
+        # at lock contention or pool limits, which more tasks will not fix
+        first_users, first = broken[0]
+        if first['server_cpu_cores'] < 0.5 * best['server_cpu_cores'] * first_users / users:
+            notes.append(f'latency knee at {first_users} users is not CPU bound; check pool size and row locks')
+    from db import DB_POOL_MAX as pool_max
+    if max_connections and max_tasks * pool_max * args.workers > 0.8 * max_connections:
+        notes.append(
+            f'{max_tasks} tasks x {args.workers} workers x {pool_max} connections exceeds 80% of '
+            f'max_connections ({max_connections}); add a pooler or lower DB_POOL_MAX'
+        )
+    return {
+        'profile': profile,
+        'basis': basis,
+        'task_rps_at_100pct': task_rps,
+        'target_value': target,
+        'min_tasks': min_tasks,
+        'max_tasks': max_tasks,
+        'notes': notes
+    }
+
+
+# -----------------------------------------------------------------------------
+# Runner
+# -----------------------------------------------------------------------------
+
+def start_server(port: int) -> subprocess.Popen:
+    """Run the backend in a child process pointed at BENCH_DATABASE_URL"""
+    env = dict(os.environ, LOAD_TEST_PORT=str(port), OUTBOX_SINK='')
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-only'], env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('backend did not start')
+
+
+def serve_only():
+    """Child process: import the app with credentials for the bench database"""
+    dsn = parse_dsn(BENCH_DATABASE_URL)
+    os.environ['DB_SECRET'] = 'load-test'
+    import db
+    db._credentials['load-test'] = {
+        'host': dsn.get('host'),
+        'dbname': dsn.get('dbname'),
+        'username': dsn.get('user'),
+        'password': dsn.get('password'),
+        'port': dsn.get('port', 5432)
+    }
+    from werkzeug.serving import make_server
+    from app import app
+    make_server('127.0.0.1', int(os.environ['LOAD_TEST_PORT']), app, threaded=True).serve_forever()
+
+
+def run_window(base_url: str, profile: str, users: int, duration: float, think_ms: float,
+               product_ids: list, hot_id: int, sampler: ConnectionSampler, server_pid: int,
+               report_every: float = None) -> dict:
+    """Run users virtual users for duration seconds; soak runs report each interval"""
+    recorder = Recorder()
+    stop = threading.Event()
+    workers = [
+        VirtualUser(base_url, PROFILES[profile], product_ids, hot_id, recorder, stop, think_ms)
+        for _ in range(users)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Discard connection setup and pool warm-up
+    time.sleep(min(2.0, duration / 10))
+    recorder.drain()
+
+    totals = {}
+    sampler.start()
+    start = window_start = time.monotonic()
+    cpu_start = window_cpu = process_cpu_seconds(server_pid) if server_pid else float('nan')
+    deadline = start + duration
+    while time.monotonic() < deadline:
+        time.sleep(min(report_every or duration, max(0.0, deadline - time.monotonic())))
+        if report_every:
+            now = time.monotonic()
+            cpu = process_cpu_seconds(server_pid) if server_pid else float('nan')
+            window = recorder.drain()
+            _merge(totals, window)
+            snapshot = {'max_total': sampler.samples[-1][0] if sampler.samples else 0}
+            result = summarize(window, now - window_start, cpu - window_cpu, snapshot)
+            print(
+                f"[{now - start:>7.0f}s] {result['rps']:>8.1f} rps  p99 {result['p99_ms']:>7.1f} ms  "
+                f"errors {100 * result['error_rate']:.2f}%  cpu {result['cpu_ms_per_request']:.2f} ms/req  "
+                f"connections {snapshot['max_total']}"
+            )
+            window_start, window_cpu = now, cpu
+
+    elapsed = time.monotonic() - start
+    cpu_seconds = (process_cpu_seconds(server_pid) - cpu_start) if server_pid else float('nan')
+    connections = sampler.stop()
+    stop.set()
+    for worker in workers:
+        worker.join()
+    _merge(totals, recorder.drain())
+    return summarize(totals, elapsed, cpu_seconds, connections)
+
+
+def _merge(into: dict, window: dict):
+    for name, stats in window.items():
+        target = into.setdefault(name, {'count': 0, 'errors': 0, 'rejected': 0, 'latencies': []})
+        target['count'] += stats['count']
+        target['errors'] += stats['errors']
+        target['rejected'] += stats['rejected']
+        room = RESERVOIR_SIZE - len(target['latencies'])
+        target['latencies'].extend(random.sample(stats['latencies'], min(room, len(stats['latencies']))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backend load and soak test with sizing recommendations')
+    parser.add_argument('--url', help='Backend base URL (default: start one against BENCH_DATABASE_URL)')
+    parser.add_argument('--profiles', default='browse,checkout,flash_sale')
+    parser.add_argument('--users', default='4,16,64', help='Concurrent virtual users per step')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per step')
+    parser.add_argument('--soak', type=float, help='Run one long step of this many seconds per profile')
+    parser.add_argument('--report-interval', type=float, default=60.0, help='Soak progress interval')
+    parser.add_argument('--think-ms', type=float, default=50.0, help='Mean think time between actions')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--p99-slo-ms', type=float, default=500.0)
+    parser.add_argument('--peak-rps', type=float, default=200.0, help='Expected peak requests/s per region')
+    parser.add_argument('--baseline-rps', type=float, default=50.0, help='Expected off-peak requests/s')
+    parser.add_argument('--backend-cpu', type=int, default=256, help='ECS backend_cpu units per task')
+    parser.add_argument('--workers', type=int, default=1, help='Server processes per task')
+    parser.add_argument('--server-pid', type=int, help='PID of the --url server, for CPU per request')
+    parser.add_argument('--json', help='Also write all results to this file')
+    parser.add_argument('--serve-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_only:
+        serve_only()
+        sys.exit(0)
+
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    apply_migrations(conn)
+    product_ids, hot_id = seed_catalog(conn, args.products)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        port = 18080
+        server = start_server(port)
+        base_url = f'http://127.0.0.1:{port}'
+    server_pid = server.pid if server else args.server_pid
+
+    sampler = ConnectionSampler(BENCH_DATABASE_URL)
+    report = {'steps': [], 'recommendations': []}
+    try:
+        for profile in args.profiles.split(','):
+            steps = []
+            print(f"\n{'profile':<11} {'users':>5} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                  f"{'p99 ms':>8} {'errors':>7} {'cores':>6} {'cpu ms':>7} {'conns':>5}")
+            for users in [int(u) for u in args.users.split(',')]:
+                seed_catalog(conn, args.products)
+                result = run_window(
+                    base_url, profile, users, args.soak or args.duration, args.think_ms,
+                    product_ids, hot_id, sampler, server_pid,
+                    args.report_interval if args.soak else None
+                )
+                print_step(profile, users, result)
+                steps.append((users, result))
+                report['steps'].append({'profile': profile, 'users': users, **result})
+            report['recommendations'].append(recommend(profile, steps, args, sampler.max_connections))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        conn.close()
+
+    print(f"\nSizing for backend_cpu={args.backend_cpu}, peak {args.peak_rps:.0f} req/s, "
+          f"baseline {args.baseline_rps:.0f} req/s, p99 SLO {args.p99_slo_ms:.0f} ms")
+    for rec in report['recommendations']:
+        if 'note' in rec:
+            print(f"  {rec['profile']:<11} {rec['note']}")
+            continue
+        print(
+            f"  {rec['profile']:<11} {rec['task_rps_at_100pct']:>7.1f} req/s per task ({rec['basis']})  "
+            f"min_tasks={rec['min_tasks']} max_tasks={rec['max_tasks']} target_value={rec['target_value']}"
+        )
+        for note in rec['notes']:
+            print(f"  {'':<11} ! {note}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
@@ -0,0 +1,105 @@
+"""
+Response Encoding Benchmark
+Bytes on the wire and CPU per request for the catalog listing under each
+serialization path: Flask's stdlib encoder, orjson, orjson with dynamic
+gzip/br compression, and the cached precompressed body. No database or
+AWS access needed:
+    python benchmarks/response_encoding.py --products 200 --requests 5000
+"""
+import os
+import sys
+import time
+import argparse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import serialization  # noqa: E402
+
+
+def build_catalog(products: int) -> dict:
+    """Rows shaped like get_products' RealDictCursor output"""
+    return {
+        'products': [
+            {
+                'id': i,
+                'name': f'Product {i}',
+                'description': 'Premium noise-canceling headphones with 30-hour battery life and '
+                               'a foldable design for travel. ' * 2,
+                'price': Decimal('89.99') + i,
+                'image_url': f'https://via.placeholder.com/300x300?text=Product+{i}',
+                'stock': 50 + i
+            }
+            for i in range(products)
+        ],
+        'region': 'us-east-1',
+        'region_type': 'primary'
+    }
+
+
+def build_app(mode: str, catalog: dict) -> Flask:
+    """App whose /api/products route serializes catalog the given way"""
+    app = Flask(f'bench_{mode}')
+    if mode == 'stdlib':
+        app.json = DefaultJSONProvider(app)
+    else:
+        serialization.init_app(app)
+        if mode == 'orjson':
+            # Drop the compression hook, keep the encoder
+            app.after_request_funcs[None] = []
+    cache = serialization.ResponseCache(3600)
+
+    @app.route('/api/products')
+    def products():
+        if mode == 'cached':
+            entry = cache.get('products') or cache.put('products', catalog)
+            return serialization.cached_response(app, entry)
+        return jsonify(catalog), 200
+
+    return app
+
+
+def measure(app: Flask, requests: int, accept_encoding: str) -> tuple:
+    """(CPU microseconds per request, response bytes)"""
+    client = app.test_client()
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    size = len(client.get('/api/products', headers=headers).data)
+    for _ in range(min(200, requests)):
+        client.get('/api/products', headers=headers)
+    start = time.process_time()
+    for _ in range(requests):
+        client.get('/api/products', headers=headers)
+    return (time.process_time() - start) / requests * 1e6, size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure catalog response size and CPU per encoding path')
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    catalog = build_catalog(args.products)
+    cases = [
+        ('stdlib json', 'stdlib', None),
+        ('orjson', 'orjson', None),
+        ('orjson + gzip', 'dynamic', 'gzip'),
+        ('orjson + br', 'dynamic', 'br'),
+        ('cached + gzip', 'cached', 'gzip'),
+        ('cached + br', 'cached', 'br'),
+    ]
+
+    baseline_cpu = baseline_size = None
+    print(f"{args.products} products, {args.requests} requests per case")
+    print(f"{'path':<15} {'bytes':>9} {'vs base':>8} {'cpu us/req':>11} {'vs base':>8}")
+    for label, mode, encoding in cases:
+        cpu, size = measure(build_app(mode, catalog), args.requests, encoding)
+        if baseline_cpu is None:
+            baseline_cpu, baseline_size = cpu, size
+        print(
+            f"{label:<15} {size:>9} {100 * size / baseline_size:>7.1f}% "
+            f"{cpu:>11.1f} {100 * cpu / baseline_cpu:>7.1f}%"
+        )
+    print("CPU includes the Flask test client's own request handling, which is the same for every path.")
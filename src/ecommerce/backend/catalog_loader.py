@@ -0,0 +1,250 @@
+"""
+Bulk Catalog Loader
+Streams a CSV or JSONL product catalog (local file or S3) into Postgres
+using COPY in bounded batches, upserting by SKU and checkpointing progress
+so an interrupted import resumes where it stopped.
+
+Stock is only set for new SKUs. For existing ones it is owned by checkouts,
+cart holds and stock shards (inventory.py), so a reload never overwrites
+what has been sold or held; restock through inventory instead.
+
+Usage:
+    python catalog_loader.py catalog.csv
+    python catalog_loader.py s3://my-bucket/catalog/products.jsonl
+    python catalog_loader.py catalog/products.jsonl --s3      # key in $S3_BUCKET
+"""
+import os
+import io
+import csv
+import json
+import time
+import argparse
+import psycopg2
+import boto3
+
+from init_db import get_db_credentials
+
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Column order used for the staging table and the COPY stream
+CATALOG_COLUMNS = ['sku', 'name', 'description', 'price', 'image_url', 'stock']
+
+
+def open_source(source: str, use_s3: bool = False):
+    """Return (text stream, fingerprint) for a local path or S3 object"""
+    if source.startswith('s3://') or use_s3:
+        if source.startswith('s3://'):
+            bucket, _, key = source[len('s3://'):].partition('/')
+        else:
+            bucket, key = S3_BUCKET, source
+        if not bucket:
+            raise ValueError('No bucket given and S3_BUCKET is not set')
+
+        s3 = boto3.client('s3', region_name=AWS_REGION)
+        response = s3.get_object(Bucket=bucket, Key=key)
+        # ETag changes whenever the object is replaced, so a checkpoint taken
+        # against an older upload is never applied to a newer one.
+        fingerprint = response['ETag'].strip('"')
+        # A text stream keeps the line endings inside quoted CSV fields
+        lines = io.TextIOWrapper(response['Body'], encoding='utf-8', newline='')
+        return lines, fingerprint
+
+    stat = os.stat(source)
+    fingerprint = f"{stat.st_size}-{int(stat.st_mtime)}"
+
+    def read_lines():
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            yield from f
+
+    return read_lines(), fingerprint
+
+
+def iter_records(lines, fmt: str):
+    """Yield catalog records as dicts from CSV or JSONL lines"""
+    if fmt == 'jsonl':
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        for row in csv.DictReader(lines):
+            yield row
+
+
+def normalize_record(record: dict) -> list:
+    """Validate a record and return it in CATALOG_COLUMNS order"""
+    sku = (record.get('sku') or '').strip()
+    name = (record.get('name') or '').strip()
+    if not sku or not name:
+        raise ValueError(f"Record missing sku or name: {record}")
+
+    return [
+        sku,
+        name,
+        record.get('description') or None,
+        str(record['price']),
+        record.get('image_url') or None,
+        int(record.get('stock') or 0),
+    ]
+
+
+def ensure_checkpoint_table(conn):
+    """Create the import checkpoint table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_import_checkpoints (
+                source VARCHAR(1024) PRIMARY KEY,
+                fingerprint VARCHAR(255) NOT NULL,
+                rows_committed BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+    conn.commit()
+
+
+def load_checkpoint(conn, source: str, fingerprint: str) -> int:
+    """Return the number of rows already committed for this source version"""
+    with conn.cursor() as cur:
+        cur.execute(
+            'SELECT fingerprint, rows_committed FROM catalog_import_checkpoints WHERE source = %s',
+            (source,)
+        )
+        row = cur.fetchone()
+    if row and row[0] == fingerprint:
+        return row[1]
+    return 0
+
+
+def flush_batch(conn, source: str, fingerprint: str, batch: list, rows_committed: int):
+    """COPY one batch into staging, upsert it and advance the checkpoint atomically"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for seq, row in enumerate(batch):
+        writer.writerow([seq] + ['\\N' if v is None else v for v in row])
+    buf.seek(0)
+
+    with conn.cursor() as cur:
+        cur.execute('TRUNCATE catalog_stage')
+        cur.copy_expert(
+            f"COPY catalog_stage (seq, {', '.join(CATALOG_COLUMNS)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buf
+        )
+        # DISTINCT ON keeps the last occurrence of a SKU within the batch;
+        # ON CONFLICT cannot touch the same row twice in one statement.
+        cur.execute('''
+            INSERT INTO products (sku, name, description, price, image_url, stock)
+            SELECT DISTINCT ON (sku) sku, name, description, price, image_url, stock
+            FROM catalog_stage
+            ORDER BY sku, seq DESC
+            ON CONFLICT (sku) DO UPDATE SET
+                name = EXCLUDED.name,
+                description = EXCLUDED.description,
+                price = EXCLUDED.price,
+                image_url = EXCLUDED.image_url
+        ''')
+        cur.execute('''
+            INSERT INTO catalog_import_checkpoints (source, fingerprint, rows_committed, updated_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET
+                fingerprint = EXCLUDED.fingerprint,
+                rows_committed = EXCLUDED.rows_committed,
+                updated_at = EXCLUDED.updated_at
+        ''', (source, fingerprint, rows_committed + len(batch)))
+    conn.commit()
+
+
+def import_catalog(source: str, fmt: str = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                   use_s3: bool = False, restart: bool = False) -> dict:
+    """Stream a catalog file into the products table"""
+    fmt = fmt or ('jsonl' if source.endswith(('.jsonl', '.ndjson')) else 'csv')
+    lines, fingerprint = open_source(source, use_s3)
+
+    creds = get_db_credentials()
+    conn = psycopg2.connect(
+        host=creds['host'],
+        database=creds['dbname'],
+        user=creds['username'],
+        password=creds['password'],
+        port=creds.get('port', 5432)
+    )
+
+    try:
+        ensure_checkpoint_table(conn)
+        with conn.cursor() as cur:
+            cur.execute('''
+                CREATE TEMP TABLE catalog_stage (
+                    seq INTEGER NOT NULL,
+                    sku VARCHAR(64) NOT NULL,
+                    name VARCHAR(255) NOT NULL,
+                    description TEXT,
+                    price DECIMAL(10, 2) NOT NULL,
+                    image_url VARCHAR(500),
+                    stock INTEGER NOT NULL
+                )
+            ''')
+        conn.commit()
+
+        skip = 0 if restart else load_checkpoint(conn, source, fingerprint)
+        if skip:
+            print(f"Resuming {source} after {skip} committed rows")
+
+        rows_committed = skip
+        rows_seen = 0
+        batch = []
+        start = time.monotonic()
+
+        for record in iter_records(lines, fmt):
+            rows_seen += 1
+            if rows_seen <= skip:
+                continue
+            batch.append(normalize_record(record))
+
+            if len(batch) >= batch_size:
+                batch_start = time.monotonic()
+                flush_batch(conn, source, fingerprint, batch, rows_committed)
+                rows_committed += len(batch)
+                elapsed = time.monotonic() - start
+                print(
+                    f"Committed {rows_committed} rows "
+                    f"(batch {len(batch) / (time.monotonic() - batch_start):.0f} rows/s, "
+                    f"overall {(rows_committed - skip) / elapsed:.0f} rows/s)"
+                )
+                batch = []
+
+        if batch:
+            flush_batch(conn, source, fingerprint, batch, rows_committed)
+            rows_committed += len(batch)
+
+        elapsed = time.monotonic() - start
+        loaded = rows_committed - skip
+        rate = loaded / elapsed if elapsed > 0 else 0.0
+        print(f"Catalog import complete: {loaded} rows in {elapsed:.1f}s ({rate:.0f} rows/s)")
+
+        return {
+            'source': source,
+            'rows_loaded': loaded,
+            'rows_skipped': skip,
+            'rows_committed': rows_committed,
+            'duration_seconds': elapsed,
+            'rows_per_second': rate
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load a product catalog into Postgres')
+    parser.add_argument('source', help='Local path, s3://bucket/key, or a key in $S3_BUCKET with --s3')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--s3', action='store_true', help='Treat source as a key in $S3_BUCKET')
+    parser.add_argument('--restart', action='store_true', help='Ignore any saved checkpoint')
+    args = parser.parse_args()
+
+    import_catalog(args.source, args.format, args.batch_size, args.s3, args.restart)
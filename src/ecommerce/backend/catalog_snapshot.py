@@ -0,0 +1,241 @@
+"""
+Catalog Snapshot Publisher
+Renders the product catalog to the regional bucket as static JSON, so the
+storefront can browse from S3 (or a CDN in front of it) instead of Flask
+and RDS. The standby region publishes from its own replica, so browsing
+keeps working from the DR bucket during failover while the small DR
+fleet only serves cart and order writes.
+
+Layout under s3://$S3_BUCKET/catalog/<region>/:
+    manifest.json           short-lived; lists the current pages
+    pages/<hash>.json.gz    immutable, content-addressed pages of products
+
+Pages hold products by id range (id // SNAPSHOT_PAGE_SIZE), so a price
+change rewrites only its own page and only pages whose hash is not
+already published are uploaded. Pages that drop out are deleted one
+publish later, so clients holding the previous manifest can still load
+them. The storefront filters and sorts the merged pages itself.
+
+Publishing runs as a maintenance task in every backend task; an advisory
+lock lets one of them render, and only when catalog_change_seq (bumped by
+row triggers on products when a catalog field changes, not on stock-only
+checkouts) has moved since the published manifest. A replica only sees
+the sequence advance in WAL-logged steps of 32, so snapshots are also
+re-rendered every CATALOG_SNAPSHOT_MAX_AGE_SECONDS, which is also when
+stock levels are refreshed; unchanged pages are not uploaded again.
+
+Usage:
+    python catalog_snapshot.py publish            # from $DB_SECRET into $S3_BUCKET
+    python catalog_snapshot.py publish --force
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+from psycopg2.extras import RealDictCursor
+
+from serialization import dumps
+
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'true') == 'true' and bool(S3_BUCKET)
+SNAPSHOT_PREFIX = os.environ.get('CATALOG_SNAPSHOT_PREFIX', 'catalog')
+SNAPSHOT_PAGE_SIZE = int(os.environ.get('CATALOG_SNAPSHOT_PAGE_SIZE', '100'))
+MANIFEST_MAX_AGE_SECONDS = int(os.environ.get('CATALOG_MANIFEST_MAX_AGE_SECONDS', '15'))
+SNAPSHOT_MAX_AGE_SECONDS = int(os.environ.get('CATALOG_SNAPSHOT_MAX_AGE_SECONDS', '300'))
+
+SNAPSHOT_LOCK_KEY = 727275
+PAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def render_pages(conn, page_size: int = SNAPSHOT_PAGE_SIZE) -> list:
+    """Return [(key_hash, gzipped_body, product_count, first_id)] in id order"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute('''
+            SELECT id, name, description, price, image_url, stock
+            FROM products
+            WHERE NOT synthetic
+            ORDER BY id
+        ''')
+        rows = cur.fetchall()
+    conn.rollback()
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(row['id'] // page_size, []).append(row)
+
+    pages = []
+    for _, products in sorted(groups.items()):
+        body = dumps({'products': products})
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # mtime=0 keeps the gzip bytes identical for identical content
+        pages.append((digest, gzip.compress(body, compresslevel=9, mtime=0), len(products), products[0]['id']))
+    return pages
+
+
+def change_marker(conn) -> int:
+    """Current catalog_change_seq value (readable on the replica too)"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT last_value FROM catalog_change_seq')
+        marker = cur.fetchone()[0]
+    conn.rollback()
+    return marker
+
+
+class SnapshotPublisher:
+    """Publishes catalog pages and the manifest for one region"""
+
+    def __init__(self, bucket: str = S3_BUCKET, region: str = AWS_REGION,
+                 prefix: str = SNAPSHOT_PREFIX, s3=None):
+        self.bucket = bucket
+        self.region = region
+        self.base = f"{prefix.strip('/')}/{region}"
+        self.s3 = s3 or boto3.client('s3', region_name=region)
+        self.manifest = None
+
+    def page_key(self, digest: str) -> str:
+        return f"{self.base}/pages/{digest}.json.gz"
+
+    def load_manifest(self):
+        """The published manifest, fetched once and then tracked locally"""
+        if self.manifest is None:
+            try:
+                response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.base}/manifest.json")
+                self.manifest = json.loads(response['Body'].read())
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                    raise
+                self.manifest = {}
+        return self.manifest
+
+    def is_current(self, manifest: dict, marker: int) -> bool:
+        """True if manifest was rendered at marker and is not too old"""
+        if manifest.get('change_marker') != marker:
+            return False
+        age = time.time() - manifest.get('published_at', 0)
+        return age < SNAPSHOT_MAX_AGE_SECONDS
+
+    def publish(self, conn, force: bool = False):
+        """Publish if the catalog changed; returns a summary or None"""
+        marker = change_marker(conn)
+        if not force and self.manifest and self.is_current(self.manifest, marker):
+            return None
+
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_try_advisory_lock(%s)', (SNAPSHOT_LOCK_KEY,))
+            locked = cur.fetchone()[0]
+        conn.rollback()
+        if not locked:
+            return None
+
+        try:
+            # Another task may have published since this one last looked
+            self.manifest = None
+            previous = self.load_manifest()
+            if not force and self.is_current(previous, marker):
+                return None
+            return self._publish(conn, previous, marker)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_advisory_unlock(%s)', (SNAPSHOT_LOCK_KEY,))
+            conn.rollback()
+
+    def _publish(self, conn, previous: dict, marker: int) -> dict:
+        start = time.monotonic()
+        pages = render_pages(conn)
+
+        published = {page['key'] for page in previous.get('pages', [])}
+        uploaded = 0
+        for digest, body, _, _ in pages:
+            key = self.page_key(digest)
+            if key in published:
+                continue
+            self.s3.put_object(
+                Bucket=self.bucket, Key=key, Body=body,
+                ContentType='application/json', ContentEncoding='gzip',
+                CacheControl=PAGE_CACHE_CONTROL
+            )
+            uploaded += 1
+
+        current = {self.page_key(digest) for digest, _, _, _ in pages}
+        manifest = {
+            'format': 1,
+            'region': self.region,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'published_at': time.time(),
+            'change_marker': marker,
+            'page_size': SNAPSHOT_PAGE_SIZE,
+            'total': sum(count for _, _, count, _ in pages),
+            'pages': [
+                {
+                    'key': self.page_key(digest),
+                    'path': f'pages/{digest}.json.gz',
+                    'count': count,
+                    'first_id': first_id
+                }
+                for digest, _, count, first_id in pages
+            ],
+            # Still referenced by the manifest clients may have cached
+            'retired': sorted(published - current)
+        }
+        self.s3.put_object(
+            Bucket=self.bucket, Key=f"{self.base}/manifest.json", Body=dumps(manifest),
+            ContentType='application/json',
+            CacheControl=f'public, max-age={MANIFEST_MAX_AGE_SECONDS}'
+        )
+        self.manifest = manifest
+
+        # Pages retired by the previous publish are no longer in any live manifest
+        expired = [key for key in previous.get('retired', []) if key not in current]
+        for i in range(0, len(expired), 1000):
+            self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in expired[i:i + 1000]], 'Quiet': True}
+            )
+
+        return {
+            'products': manifest['total'],
+            'pages': len(pages),
+            'uploaded': uploaded,
+            'deleted': len(expired),
+            'change_marker': marker,
+            'seconds': round(time.monotonic() - start, 3)
+        }
+
+
+_publisher = None
+
+
+def publish_if_changed(conn):
+    """Maintenance task: publish a new snapshot when products changed"""
+    global _publisher
+    if _publisher is None:
+        _publisher = SnapshotPublisher()
+    return _publisher.publish(conn)
+
+
+if __name__ == '__main__':
+    from migrate import connect
+
+    parser = argparse.ArgumentParser(description='Publish the catalog snapshot to S3')
+    parser.add_argument('command', choices=['publish'])
+    parser.add_argument('--force', action='store_true', help='Publish even if nothing changed')
+    parser.add_argument('--bucket', default=S3_BUCKET)
+    parser.add_argument('--region', default=AWS_REGION, help='Region prefix to publish under')
+    args = parser.parse_args()
+
+    if not args.bucket:
+        parser.error('No bucket given and S3_BUCKET is not set')
+
+    conn = connect()
+    try:
+        result = SnapshotPublisher(args.bucket, args.region).publish(conn, force=args.force)
+        print(json.dumps(result or {'published': False, 'reason': 'unchanged or locked'}))
+    finally:
+        conn.close()
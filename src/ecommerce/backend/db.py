@@ -0,0 +1,314 @@
+"""
+Database access for the e-commerce backend
+Keeps separate connection pools for the writer (DB_SECRET) and an optional
+reader endpoint (DB_READER_SECRET, the local replica) and routes catalog
+reads to the reader unless its replication lag exceeds MAX_REPLICA_LAG_SECONDS.
+
+Each worker's writer pool has room for every admitted request
+(ADMISSION_MAX_LIMIT), every in-flight outbox batch (OUTBOX_MAX_IN_FLIGHT)
+and DB_POOL_HEADROOM more for maintenance, the order a queued-checkout
+replay places while maintenance holds its connection, the writer probe and
+warm-up. A checkout from a full pool waits up to DB_POOL_WAIT_SECONDS and
+then raises PoolExhausted: the process is busy, which is not the same as
+the writer being unreachable (get_db_connection returns None for that).
+"""
+import os
+import json
+import time
+import threading
+import boto3
+from psycopg2 import pool
+
+from admission import ADMISSION_MAX_LIMIT
+from outbox import OUTBOX_MAX_IN_FLIGHT
+from telemetry import span, TracingConnection, TELEMETRY_ENABLED
+from structured_logging import get_logger
+
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+DB_SECRET = os.environ.get('DB_SECRET')
+DB_READER_SECRET = os.environ.get('DB_READER_SECRET', '')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_HEADROOM = int(os.environ.get('DB_POOL_HEADROOM', '4'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', str(ADMISSION_MAX_LIMIT + OUTBOX_MAX_IN_FLIGHT + DB_POOL_HEADROOM)))
+DB_POOL_WAIT_SECONDS = float(os.environ.get('DB_POOL_WAIT_SECONDS', '2'))
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+MAX_REPLICA_LAG_SECONDS = float(os.environ.get('MAX_REPLICA_LAG_SECONDS', '30'))
+REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', '5'))
+
+_lock = threading.Lock()
+_pools = {}
+# One slot per connection the pool may open; psycopg2 raises at once when full
+_slots = {}
+_conn_routes = {}
+_credentials = {}
+_replica_state = {'checked_at': 0.0, 'lag_seconds': None, 'stale': False}
+_route_counts = {}
+_exhausted_counts = {}
+
+log = get_logger('db', region=AWS_REGION)
+
+
+class PoolExhausted(Exception):
+    """Every connection in the pool stayed checked out for DB_POOL_WAIT_SECONDS"""
+
+
+def get_db_credentials(secret_name: str = None):
+    """Get database credentials from Secrets Manager (cached per secret)"""
+    secret_name = secret_name or DB_SECRET
+    if secret_name in _credentials:
+        return _credentials[secret_name]
+
+    region = secret_name.split(':')[3] if secret_name and secret_name.startswith('arn:') else AWS_REGION
+    secrets_client = boto3.client('secretsmanager', region_name=region)
+
+    try:
+        with span('secret_fetch'):
+            response = secrets_client.get_secret_value(SecretId=secret_name)
+        secret = json.loads(response['SecretString'])
+        _credentials[secret_name] = secret
+        return secret
+    except Exception as e:
+        log.error('Error retrieving secret', secret=secret_name, error=str(e), max_per_second=1)
+        return None
+
+
+def _get_pool(target: str):
+    """Return (creating on first use) the pool for 'writer' or 'reader'"""
+    if target in _pools:
+        return _pools[target]
+
+    with _lock:
+        if target not in _pools:
+            secret_name = DB_READER_SECRET if target == 'reader' else DB_SECRET
+            creds = get_db_credentials(secret_name)
+            if not creds:
+                return None
+            # Before the pool: other threads take the fast path once it is set
+            _slots[target] = threading.BoundedSemaphore(DB_POOL_MAX)
+            _pools[target] = pool.ThreadedConnectionPool(
+                DB_POOL_MIN,
+                DB_POOL_MAX,
+                host=creds['host'],
+                database=creds['dbname'],
+                user=creds['username'],
+                password=creds['password'],
+                port=creds.get('port', 5432),
+                connect_timeout=DB_CONNECT_TIMEOUT,
+                connection_factory=TracingConnection if TELEMETRY_ENABLED else None
+            )
+        return _pools[target]
+
+
+def _checkout(target: str, db_pool, wait: float = DB_POOL_WAIT_SECONDS):
+    """getconn that waits up to wait seconds for a free slot instead of failing"""
+    if not _slots[target].acquire(timeout=wait):
+        with _lock:
+            _exhausted_counts[target] = _exhausted_counts.get(target, 0) + 1
+        raise PoolExhausted(f'{target} pool: all {DB_POOL_MAX} connections in use for {wait}s')
+    try:
+        return db_pool.getconn()
+    except Exception:
+        _slots[target].release()
+        raise
+
+
+def _checkin(target: str, db_pool, conn, close: bool = False):
+    db_pool.putconn(conn, close=close)
+    _slots[target].release()
+
+
+def _count_route(route: str, target: str):
+    """Record which endpoint a query for this route went to"""
+    key = f"{route}:{target}"
+    with _lock:
+        _route_counts[key] = _route_counts.get(key, 0) + 1
+
+
+def _replica_is_stale(conn) -> bool:
+    """Check (at most every REPLICA_LAG_CHECK_SECONDS) whether the replica lags too far"""
+    now = time.monotonic()
+    if now - _replica_state['checked_at'] < REPLICA_LAG_CHECK_SECONDS:
+        return _replica_state['stale']
+
+    with conn.cursor() as cur:
+        # An idle primary produces no new transactions, so replay timestamp
+        # age only counts as lag while WAL is still waiting to be replayed.
+        cur.execute('''
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            END
+        ''')
+        lag = cur.fetchone()[0]
+    conn.rollback()
+
+    lag = float(lag) if lag is not None else None
+    stale = lag is None or lag > MAX_REPLICA_LAG_SECONDS
+    if stale and not _replica_state['stale']:
+        log.warning('Replica lag exceeds limit, routing reads to writer', lag_seconds=lag, max_lag_seconds=MAX_REPLICA_LAG_SECONDS)
+
+    _replica_state.update({'checked_at': now, 'lag_seconds': lag, 'stale': stale})
+    return stale
+
+
+def get_db_connection(readonly: bool = False, route: str = 'unknown'):
+    """Check out a pooled connection; reads prefer the reader endpoint
+
+    Returns None if the writer cannot be reached and raises PoolExhausted
+    if it can but every pooled connection is busy. A full reader pool falls
+    back to the writer without waiting.
+    """
+    target = 'writer'
+
+    if readonly and DB_READER_SECRET:
+        conn = None
+        broken = False
+        try:
+            reader_pool = _get_pool('reader')
+            if reader_pool:
+                with span('connect'):
+                    conn = _checkout('reader', reader_pool, wait=0)
+                if not _replica_is_stale(conn):
+                    _conn_routes[id(conn)] = 'reader'
+                    _count_route(route, 'reader')
+                    return conn
+        except Exception as e:
+            log.warning('Reader connection error, falling back to writer', error=str(e), max_per_second=1)
+            broken = True
+        if conn is not None:
+            _checkin('reader', _pools['reader'], conn, close=broken or bool(conn.closed))
+        target = 'writer_fallback'
+
+    try:
+        writer_pool = _get_pool('writer')
+        if not writer_pool:
+            return None
+        with span('connect'):
+            conn = _checkout('writer', writer_pool)
+        _conn_routes[id(conn)] = 'writer'
+        _count_route(route, target)
+        return conn
+    except PoolExhausted:
+        raise
+    except Exception as e:
+        log.error('Database connection error', error=str(e), max_per_second=1)
+        return None
+
+
+def release_db_connection(conn, discard: bool = False):
+    """Return a connection to its pool, closing it if broken or discarded"""
+    if conn is None:
+        return
+    target = _conn_routes.pop(id(conn), 'writer')
+    db_pool = _pools.get(target)
+    if db_pool is None:
+        conn.close()
+        return
+
+    if not conn.closed and not discard:
+        try:
+            conn.rollback()
+        except Exception:
+            discard = True
+    _checkin(target, db_pool, conn, close=discard or bool(conn.closed))
+
+
+def prefill_pools() -> dict:
+    """Open and validate DB_POOL_MIN idle connections in each pool
+
+    A promotion restarts the instance, which breaks every connection the
+    pools opened before it; those are replaced here instead of failing the
+    first requests after cutover.
+    """
+    targets = ['writer'] + (['reader'] if DB_READER_SECRET else [])
+    result = {}
+    for target in targets:
+        db_pool = _get_pool(target)
+        if db_pool is None:
+            result[target] = {'error': 'no credentials'}
+            continue
+        conns, replaced = [], 0
+        try:
+            while len(conns) < DB_POOL_MIN:
+                conn = _checkout(target, db_pool)
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT 1')
+                    conn.rollback()
+                except Exception:
+                    _checkin(target, db_pool, conn, close=True)
+                    replaced += 1
+                    if replaced > DB_POOL_MIN:
+                        raise
+                    continue
+                conns.append(conn)
+        except Exception as e:
+            result[target] = {'error': str(e)}
+        else:
+            result[target] = {'connections': len(conns), 'replaced': replaced}
+        finally:
+            for conn in conns:
+                _checkin(target, db_pool, conn, close=bool(conn.closed))
+    return result
+
+
+def close_pools():
+    """Close every pooled connection (worker shutdown)"""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        _slots.clear()
+        _conn_routes.clear()
+    for db_pool in pools:
+        db_pool.closeall()
+
+
+def _reset_after_fork():
+    """Forget pools inherited from the parent; their sockets belong to it"""
+    global _lock
+    _lock = threading.Lock()
+    _pools.clear()
+    _slots.clear()
+    _conn_routes.clear()
+    _replica_state['checked_at'] = 0.0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def routing_stats() -> dict:
+    """Per-route query counts and the last observed replica lag"""
+    with _lock:
+        counts = dict(_route_counts)
+        exhausted = dict(_exhausted_counts)
+    return {
+        'reader_configured': bool(DB_READER_SECRET),
+        'replica_lag_seconds': _replica_state['lag_seconds'],
+        'replica_stale': _replica_state['stale'],
+        'max_replica_lag_seconds': MAX_REPLICA_LAG_SECONDS,
+        'queries': counts,
+        'pool_max': DB_POOL_MAX,
+        'pool_exhausted': exhausted
+    }
+
+
+def routing_metrics() -> list:
+    """Routing counters and replica lag in Prometheus text format"""
+    stats = routing_stats()
+    lines = [
+        '# HELP db_queries_routed_total Connections checked out per route and target',
+        '# TYPE db_queries_routed_total counter'
+    ]
+    for key, count in sorted(stats['queries'].items()):
+        route, target = key.rsplit(':', 1)
+        lines.append(f'db_queries_routed_total{{route="{route}",target="{target}"}} {count}')
+    lines += [
+        '# HELP db_replica_lag_seconds Last observed replica lag',
+        '# TYPE db_replica_lag_seconds gauge',
+        f"db_replica_lag_seconds {stats['replica_lag_seconds'] if stats['replica_lag_seconds'] is not None else 'NaN'}",
+        '# HELP db_pool_exhausted_total Checkouts that found the pool full for DB_POOL_WAIT_SECONDS',
+        '# TYPE db_pool_exhausted_total counter'
+    ]
+    lines += [f'db_pool_exhausted_total{{target="{t}"}} {n}' for t, n in sorted(stats['pool_exhausted'].items())]
+    return lines
@@ -0,0 +1,186 @@
+"""
+Read-only degraded mode
+While the writer is unusable (the DR database before promotion finishes,
+or an unreachable primary), write routes answer 503 with Retry-After at
+once instead of each waiting out a connect or failing deep inside a
+transaction. Catalog reads keep working from the replica, or from the
+last cached listing if the database cannot be reached at all.
+
+The state starts read-only in the DR region (REGION_TYPE=dr), whose writer
+is a replica until promoted. It is refreshed at most every
+WRITER_CHECK_SECONDS by asking the writer pg_is_in_recovery(), and set
+read-only immediately when a write fails on a read-only transaction or a
+lost connection.
+
+With DEGRADED_ORDER_QUEUE set (a local JSONL path), checkouts that carry an
+Idempotency-Key are accepted with 202 while read-only and appended to that
+file. The replay_queued_checkouts maintenance task submits them through
+the normal order path once the writer takes writes again; a retry with the
+same key then returns the stored order. The file lives on the task's own
+disk, so checkouts queued in a task that is stopped before replay are lost.
+
+In the DR region the write fence sees a checkout first, as the region is
+passive until promoted. Unless forward mode sends it to the active region,
+a fenced keyed checkout is still queued while the database is in recovery,
+and replay waits until the region is active. If no failover follows, the
+queue is not replayed; a retry with the same key that reaches the active
+region places the order there.
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+
+import psycopg2
+from psycopg2 import errors
+
+from structured_logging import get_logger
+
+REGION_TYPE = os.environ.get('REGION_TYPE', 'primary')
+DEGRADED_MODE_ENABLED = os.environ.get('DEGRADED_MODE_ENABLED', 'true') == 'true'
+WRITER_CHECK_SECONDS = float(os.environ.get('WRITER_CHECK_SECONDS', '5'))
+DEGRADED_RETRY_AFTER_SECONDS = int(os.environ.get('DEGRADED_RETRY_AFTER_SECONDS', '30'))
+DEGRADED_ORDER_QUEUE = os.environ.get('DEGRADED_ORDER_QUEUE', '')
+
+log = get_logger('degraded')
+
+_lock = threading.Lock()
+_state = {
+    'checked_at': 0.0,
+    'read_only': DEGRADED_MODE_ENABLED and REGION_TYPE == 'dr',
+    'reason': 'database promotion pending' if REGION_TYPE == 'dr' else None
+}
+
+
+def _set(read_only: bool, reason: str = None):
+    if read_only != _state['read_only']:
+        if read_only:
+            log.warning('Entering read-only mode', reason=reason)
+        else:
+            log.info('Leaving read-only mode', previous_reason=_state['reason'])
+    _state.update({'checked_at': time.monotonic(), 'read_only': read_only, 'reason': reason})
+
+
+def _probe(get_conn, release_conn):
+    conn = get_conn()
+    if conn is None:
+        _set(True, 'writer unreachable')
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_is_in_recovery()')
+            in_recovery = cur.fetchone()[0]
+        conn.rollback()
+    except Exception as e:
+        release_conn(conn, discard=True)
+        _set(True, f'writer check failed: {e}')
+        return
+    release_conn(conn)
+    _set(in_recovery, 'database promotion pending' if in_recovery else None)
+
+
+def writes_blocked(get_conn, release_conn):
+    """Why writes are refused right now, or None if the writer takes them
+
+    Only one thread probes at a time; the others use the last result.
+    """
+    if not DEGRADED_MODE_ENABLED:
+        return None
+    if time.monotonic() - _state['checked_at'] >= WRITER_CHECK_SECONDS and _lock.acquire(blocking=False):
+        try:
+            _probe(get_conn, release_conn)
+        finally:
+            _lock.release()
+    return _state['reason'] if _state['read_only'] else None
+
+
+def mark_unavailable(reason: str):
+    """Refuse writes until the next successful probe"""
+    if DEGRADED_MODE_ENABLED:
+        _set(True, reason)
+
+
+def mark_available():
+    """Take writes again (the writer was just seen out of recovery)"""
+    _set(False, None)
+
+
+def note_failure(e: Exception, conn=None) -> bool:
+    """Mark read-only if a write failed because the writer cannot take it"""
+    if isinstance(e, errors.ReadOnlySqlTransaction):
+        mark_unavailable('database promotion pending')
+        return DEGRADED_MODE_ENABLED
+    # Only a dropped connection; timeouts and deadlocks are OperationalErrors too
+    if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and (conn is None or conn.closed):
+        mark_unavailable('writer connection lost')
+        return DEGRADED_MODE_ENABLED
+    return False
+
+
+def status() -> dict:
+    return {
+        'mode': 'read_only' if _state['read_only'] else 'read_write',
+        'reason': _state['reason'],
+        'queue_orders': bool(DEGRADED_ORDER_QUEUE)
+    }
+
+
+def queue_checkout(payload: dict, idempotency_key: str, path: str = DEGRADED_ORDER_QUEUE):
+    """Append a checkout for replay once the writer is back"""
+    line = json.dumps({'payload': payload, 'idempotency_key': idempotency_key, 'ts': time.time()},
+                      separators=(',', ':')) + '\n'
+    with open(path, 'a', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def replay_queued_checkouts(conn, submit, path: str = DEGRADED_ORDER_QUEUE) -> int:
+    """Submit queued checkouts once the writer is out of recovery
+
+    submit(payload, idempotency_key) returns the HTTP status of the order
+    attempt. The file is locked for the whole drain, so workers sharing it
+    do not submit the same lines concurrently; lines that still get a 5xx
+    are kept for the next run.
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_is_in_recovery()')
+        in_recovery = cur.fetchone()[0]
+    conn.rollback()
+    if in_recovery:
+        return 0
+    mark_available()
+
+    submitted = 0
+    with open(path, 'r+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        lines = [line for line in f if line.strip()]
+        remaining = []
+        for line in lines:
+            record = json.loads(line)
+            try:
+                status_code = submit(record['payload'], record['idempotency_key'])
+            except Exception as e:
+                log.error('Queued checkout replay failed', idempotency_key=record['idempotency_key'], error=str(e))
+                status_code = 500
+            if status_code >= 500:
+                remaining.append(line)
+                continue
+            submitted += 1
+            if status_code != 201:
+                log.warning(
+                    'Queued checkout rejected on replay', idempotency_key=record['idempotency_key'],
+                    status=status_code, queued_seconds=round(time.time() - record['ts'], 1)
+                )
+        f.seek(0)
+        f.writelines(remaining)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    if not remaining and submitted:
+        log.info('Queued checkouts replayed', count=submitted)
+    return submitted
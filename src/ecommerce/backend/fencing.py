@@ -0,0 +1,234 @@
+"""
+Active-region write fencing
+The failover and failback orchestrators record the active region in an SSM
+parameter (ACTIVE_REGION_PARAM) in the control plane and mirror it into both
+application regions; tasks read their own region's copy through the VPC's
+SSM endpoint. Tasks in the passive region keep receiving writes from
+clients whose resolvers still hold the old DNS answer; those writes would
+land in a database that is about to be demoted or discarded. A failover
+moves the DR region's copy as soon as the database is promoted, before
+warm-up, so its warm-up and validation checkouts are not fenced.
+
+Each worker caches the parameter and a background thread refreshes it every
+FENCING_REFRESH_SECONDS, so requests never call SSM. If the cache is older
+than FENCING_TTL_SECONDS (the refresher died or SSM is failing), one request
+refreshes inline while the others keep the last value. Until the parameter
+has been read once, nothing is fenced: an SSM outage must not stop
+checkout in the active region.
+
+A write arriving while this region is passive is, by FENCING_MODE:
+- reject: refused with 503 and Retry-After, so the client retries after
+  its resolver has caught up.
+- forward: sent on to the other region's ALB (FENCING_PEER_URL) and its
+  answer relayed; a forwarded request is never forwarded again, and a
+  failed forward falls back to reject. Needs internet egress from the
+  task subnets, which have only VPC endpoints by default.
+- off: not fenced.
+
+A route may pass fenced_write a fallback, which gets a write that would
+otherwise be rejected; checkout uses it to queue keyed orders in a DR
+region whose database is not yet promoted (see degraded.py).
+"""
+import os
+import time
+import functools
+import threading
+import urllib.request
+import urllib.error
+
+import boto3
+from botocore.config import Config
+from flask import Response, jsonify, request
+
+from structured_logging import get_logger
+
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+ACTIVE_REGION_PARAM = os.environ.get('ACTIVE_REGION_PARAM', '')
+ACTIVE_REGION_PARAM_REGION = os.environ.get('ACTIVE_REGION_PARAM_REGION', AWS_REGION)
+FENCING_MODE = os.environ.get('FENCING_MODE', 'reject')
+FENCING_REFRESH_SECONDS = float(os.environ.get('FENCING_REFRESH_SECONDS', '5'))
+FENCING_TTL_SECONDS = float(os.environ.get('FENCING_TTL_SECONDS', '30'))
+FENCING_PEER_URL = os.environ.get('FENCING_PEER_URL', '').rstrip('/')
+FENCING_FORWARD_TIMEOUT_SECONDS = float(os.environ.get('FENCING_FORWARD_TIMEOUT_SECONDS', '10'))
+FENCING_RETRY_AFTER_SECONDS = int(os.environ.get('FENCING_RETRY_AFTER_SECONDS', '5'))
+
+# Marks a request one region already forwarded
+FORWARDED_HEADER = 'X-Fenced-From'
+FORWARDED_REQUEST_HEADERS = ('Content-Type', 'Idempotency-Key', 'Accept', 'traceparent')
+FORWARDED_RESPONSE_HEADERS = ('Retry-After', 'Idempotent-Replayed')
+
+log = get_logger('fencing', region=AWS_REGION)
+
+
+class ActiveRegionFence:
+    """Cached active region and counters of fenced requests"""
+
+    def __init__(self, param: str = ACTIVE_REGION_PARAM, local_region: str = AWS_REGION):
+        self.param = param
+        self.local_region = local_region
+        self.active_region = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.ssm = None
+        self.refresh_errors = 0
+        self.fenced = {'forwarded': 0, 'rejected': 0, 'forward_failed': 0, 'fallback': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return FENCING_MODE != 'off' and bool(self.param)
+
+    def refresh(self) -> bool:
+        """Read the parameter once; the last value is kept on failure"""
+        try:
+            if self.ssm is None:
+                # Short timeouts: a slow SSM must not hold the inline refresh
+                self.ssm = boto3.client('ssm', region_name=ACTIVE_REGION_PARAM_REGION, config=Config(
+                    connect_timeout=1, read_timeout=2, retries={'max_attempts': 1}
+                ))
+            region = self.ssm.get_parameter(Name=self.param)['Parameter']['Value']
+        except Exception as e:
+            with self.lock:
+                self.refresh_errors += 1
+            log.warning('Active region refresh failed', param=self.param, error=str(e), max_per_second=0.1)
+            return False
+        with self.lock:
+            if region != self.active_region:
+                log.info('Active region changed', previous=self.active_region, active_region=region,
+                         local_region=self.local_region)
+            self.active_region = region
+            self.fetched_at = time.monotonic()
+        return True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.refresh()
+            self.stopping.wait(FENCING_REFRESH_SECONDS)
+
+    def start(self):
+        """Refresh in a daemon thread (call after fork)"""
+        if not self.enabled or (self.thread and self.thread.is_alive()):
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name='active-region-refresh', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def passive(self):
+        """The active region if it is not this one, else None"""
+        if not self.enabled:
+            return None
+        if time.monotonic() - self.fetched_at >= FENCING_TTL_SECONDS and self.refreshing.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self.refreshing.release()
+        active = self.active_region
+        return active if active and active != self.local_region else None
+
+    def count(self, action: str):
+        with self.lock:
+            self.fenced[action] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'mode': FENCING_MODE if self.enabled else 'off',
+                'active_region': self.active_region,
+                'local_active': self.active_region in (None, self.local_region),
+                'age_seconds': round(time.monotonic() - self.fetched_at, 1) if self.fetched_at else None,
+                'fenced': dict(self.fenced),
+                'refresh_errors': self.refresh_errors
+            }
+
+    def metrics_lines(self) -> list:
+        """Fencing state in Prometheus text format"""
+        stats = self.snapshot()
+        lines = [
+            '# TYPE fencing_local_active gauge', f"fencing_local_active {int(stats['local_active'])}",
+            '# TYPE fencing_cache_age_seconds gauge', f"fencing_cache_age_seconds {stats['age_seconds'] or 0}",
+            '# TYPE fencing_refresh_errors_total counter', f"fencing_refresh_errors_total {stats['refresh_errors']}",
+            '# TYPE fenced_requests_total counter'
+        ]
+        lines += [f'fenced_requests_total{{action="{a}"}} {n}' for a, n in sorted(stats['fenced'].items())]
+        return lines
+
+
+fence = ActiveRegionFence()
+
+
+def rejected_response(active_region: str):
+    """503 pointing the client at a retry once its DNS has caught up"""
+    response = jsonify({
+        'error': f'This region is not active; writes go to {active_region}',
+        'fenced': True,
+        'region': fence.local_region,
+        'active_region': active_region
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(FENCING_RETRY_AFTER_SECONDS)
+    # Counted by fenced_requests_total instead of the always-logged 5xx path
+    response.shed = True
+    return response
+
+
+def forward(active_region: str):
+    """Send the request to the peer region's ALB and relay its answer, or None"""
+    req = urllib.request.Request(
+        f"{FENCING_PEER_URL}{request.full_path.rstrip('?')}",
+        data=request.get_data(),
+        method=request.method
+    )
+    for name in FORWARDED_REQUEST_HEADERS:
+        if name in request.headers:
+            req.add_header(name, request.headers[name])
+    req.add_header(FORWARDED_HEADER, fence.local_region)
+    try:
+        with urllib.request.urlopen(req, timeout=FENCING_FORWARD_TIMEOUT_SECONDS) as upstream:
+            status, body, headers = upstream.status, upstream.read(), upstream.headers
+    except urllib.error.HTTPError as e:
+        status, body, headers = e.code, e.read(), e.headers
+    except Exception as e:
+        log.warning('Forward to active region failed', active_region=active_region, error=str(e),
+                    max_per_second=1)
+        return None
+    response = Response(body, status=status, content_type=headers.get('Content-Type', 'application/json'))
+    for name in FORWARDED_RESPONSE_HEADERS:
+        if name in headers:
+            response.headers[name] = headers[name]
+    response.headers['X-Forwarded-To-Region'] = active_region
+    return response
+
+
+def fenced_write(view=None, *, fallback=None):
+    """Decorator: forward or reject the write while this region is passive
+
+    fallback(active_region), if given, is tried before rejecting; it returns
+    a response to take the write, or None to let it be rejected.
+    """
+    if view is None:
+        return functools.partial(fenced_write, fallback=fallback)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        active_region = fence.passive()
+        if active_region is None:
+            return view(*args, **kwargs)
+        if FENCING_MODE == 'forward' and FENCING_PEER_URL and FORWARDED_HEADER not in request.headers:
+            response = forward(active_region)
+            if response is not None:
+                fence.count('forwarded')
+                return response
+            fence.count('forward_failed')
+        if fallback is not None:
+            response = fallback(active_region)
+            if response is not None:
+                fence.count('fallback')
+                return response
+        fence.count('rejected')
+        return rejected_response(active_region)
+    return wrapper
@@ -0,0 +1,64 @@
+"""
+Gunicorn settings for the backend container
+The app is imported once in the master (preload_app) and forked into
+workers sized from the task's CPU allocation. Each worker opens its own
+database pools and starts its own outbox shipper and maintenance thread
+after fork.
+
+ECS stops a task only after its ALB target has drained, then sends
+SIGTERM: workers stop accepting connections and finish in-flight requests
+for up to graceful_timeout seconds (the container's stopTimeout must be
+longer), so scale-down during failover does not drop orders.
+"""
+import os
+import math
+
+# Read by app.py at import: defer background threads to post_fork
+os.environ['SERVER_PREFORK'] = 'true'
+
+
+def cpu_limit() -> float:
+    """CPUs this container may use (cgroup quota), not the host's count"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return float(os.cpu_count() or 1)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+preload_app = True
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY') or max(2, math.ceil(cpu_limit() * 2)))
+# More threads than admission.ADMISSION_MAX_LIMIT (8): the spare threads pick
+# up queued connections and shed them at once when the limit is full
+threads = int(os.environ.get('SERVER_THREADS', '12'))
+timeout = int(os.environ.get('SERVER_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', '30'))
+# Longer than the ALB idle timeout (60s), so the ALB closes idle
+# connections first and never reuses one the worker just closed (502s)
+keepalive = int(os.environ.get('SERVER_KEEPALIVE', '65'))
+# Requests are logged by telemetry's sampled access log
+accesslog = None
+
+
+def post_fork(server, worker):
+    from app import start_background_workers
+    start_background_workers()
+
+
+def worker_exit(server, worker):
+    from app import stop_background_workers
+    stop_background_workers()
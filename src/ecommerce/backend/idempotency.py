@@ -0,0 +1,99 @@
+"""
+Idempotency keys for order submission
+A client (or the ALB, or a retry during a DNS flip) that repeats
+POST /api/orders with the same Idempotency-Key gets the stored response of
+the first successful attempt instead of a second order.
+
+The key is claimed inside the order transaction, so it commits (and
+replicates to the DR region) atomically with the order it describes.
+"""
+import os
+import json
+import hashlib
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+MAX_KEY_LENGTH = 255
+PURGE_BATCH_SIZE = 1000
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused with a different request body"""
+
+
+def request_hash(payload) -> str:
+    """Stable hash of a JSON request body"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def lookup(conn, key: str, payload_hash: str):
+    """Return (status_code, response_body) for a completed key, else None
+
+    This is the replay fast path: a single primary-key read that never
+    touches products or order_items.
+    """
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT request_hash, status_code, response_body
+            FROM idempotency_keys
+            WHERE key = %s AND expires_at > LOCALTIMESTAMP
+        ''', (key,))
+        row = cur.fetchone()
+    conn.rollback()
+
+    if not row or row[1] is None:
+        return None
+    if row[0] != payload_hash:
+        raise IdempotencyConflict(f'Idempotency key {key} was used with a different request')
+    return row[1], row[2]
+
+
+def claim(conn, key: str, payload_hash: str, ttl: int = IDEMPOTENCY_TTL_SECONDS) -> bool:
+    """Claim a key inside the caller's transaction
+
+    A concurrent request with the same key blocks on the primary key until
+    this transaction ends, then either sees the committed response or
+    (after a rollback) claims the key itself. Expired keys are reused.
+    Returns False if the key is already owned by a committed request.
+    """
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO idempotency_keys (key, request_hash, expires_at)
+            VALUES (%s, %s, LOCALTIMESTAMP + make_interval(secs => %s))
+            ON CONFLICT (key) DO UPDATE SET
+                request_hash = EXCLUDED.request_hash,
+                status_code = NULL,
+                response_body = NULL,
+                created_at = CURRENT_TIMESTAMP,
+                expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at <= LOCALTIMESTAMP
+            RETURNING key
+        ''', (key, payload_hash, ttl))
+        return cur.fetchone() is not None
+
+
+def complete(conn, key: str, status_code: int, body: dict):
+    """Store the response for a claimed key; caller commits"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE idempotency_keys SET status_code = %s, response_body = %s
+            WHERE key = %s
+        ''', (status_code, json.dumps(body, default=str), key))
+
+
+def purge_expired(conn, limit: int = PURGE_BATCH_SIZE) -> int:
+    """Delete a batch of expired keys"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            DELETE FROM idempotency_keys
+            WHERE key IN (
+                SELECT key FROM idempotency_keys
+                WHERE expires_at <= LOCALTIMESTAMP
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+        ''', (limit,))
+        purged = cur.rowcount
+    conn.commit()
+    return purged
@@ -3,10 +3,14 @@ import json
 import psycopg2
 import boto3
 
-def get_db_credentials():
+def get_db_credentials(secret_name: str = None):
     """Get database credentials from Secrets Manager"""
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
-    secret_name = os.environ.get('DB_SECRET')
+    secret_name = secret_name or os.environ.get('DB_SECRET')
+    
+    # A full ARN names its own region (e.g. the DR secret read from the primary)
+    if secret_name and secret_name.startswith('arn:'):
+        AWS_REGION = secret_name.split(':')[3]
     
     secrets_client = boto3.client('secretsmanager', region_name=AWS_REGION)
     
@@ -41,10 +45,14 @@ def init_database():
             price DECIMAL(10, 2) NOT NULL,
             image_url VARCHAR(500),
             stock INTEGER NOT NULL DEFAULT 0,
+            sku VARCHAR(64) UNIQUE,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     ''')
     
+    # Natural key used by the bulk catalog loader (catalog_loader.py)
+    cur.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS sku VARCHAR(64) UNIQUE')
+    
     cur.execute('''
         CREATE TABLE IF NOT EXISTS orders (
             id SERIAL PRIMARY KEY,
@@ -9,9 +9,13 @@ CREATE TABLE IF NOT EXISTS products (
     price DECIMAL(10, 2) NOT NULL,
     image_url VARCHAR(500),
     stock INTEGER NOT NULL DEFAULT 0,
+    sku VARCHAR(64) UNIQUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Natural key used by the bulk catalog loader (catalog_loader.py)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS sku VARCHAR(64) UNIQUE;
+
 CREATE TABLE IF NOT EXISTS orders (
     id SERIAL PRIMARY KEY,
     total DECIMAL(10, 2) NOT NULL,
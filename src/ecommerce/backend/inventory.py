@@ -0,0 +1,302 @@
+"""
+Inventory Reservation Engine
+Time-limited cart holds and contention-free stock decrements for the
+e-commerce backend.
+
+Stock is only ever taken with a conditional decrement (available >= qty),
+so concurrent checkouts can never oversell. Hot products can be split into
+stock_shards rows: a checkout locks one random shard with SKIP LOCKED
+instead of queueing on a single products row, and a background merge keeps
+products.stock (used for catalog display) in sync with the shard totals.
+
+Usage:
+    python inventory.py shard <product_id> [--shards 8]
+    python inventory.py unshard <product_id>
+    python inventory.py sweep
+"""
+import os
+import argparse
+
+CART_HOLD_SECONDS = int(os.environ.get('CART_HOLD_SECONDS', '900'))
+HOT_SKU_SHARDS = int(os.environ.get('HOT_SKU_SHARDS', '8'))
+SWEEP_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """Raised when a product does not have enough unreserved stock"""
+
+    def __init__(self, product_id):
+        super().__init__(f'Insufficient stock for product {product_id}')
+        self.product_id = product_id
+
+
+def take_stock(conn, product_id: int, quantity: int) -> list:
+    """Atomically take quantity units; returns [(shard, taken), ...]
+
+    Unsharded products use a conditional UPDATE on products. Sharded
+    products first try a single random shard that is not locked by another
+    checkout, then fall back to locking all shards in a fixed order.
+    """
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE products SET stock = stock - %(qty)s
+            WHERE id = %(pid)s AND stock >= %(qty)s
+              AND NOT EXISTS (SELECT 1 FROM stock_shards WHERE product_id = %(pid)s)
+            RETURNING id
+        ''', {'pid': product_id, 'qty': quantity})
+        if cur.fetchone():
+            return [(None, quantity)]
+
+        # Fast path: one shard with enough stock that nobody else holds
+        cur.execute('''
+            UPDATE stock_shards s SET available = s.available - %(qty)s
+            FROM (
+                SELECT shard FROM stock_shards
+                WHERE product_id = %(pid)s AND available >= %(qty)s
+                ORDER BY random()
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ) pick
+            WHERE s.product_id = %(pid)s AND s.shard = pick.shard
+            RETURNING s.shard
+        ''', {'pid': product_id, 'qty': quantity})
+        row = cur.fetchone()
+        if row:
+            return [(row[0], quantity)]
+
+        # Slow path: every shard is busy or none holds enough on its own.
+        # Locking in shard order keeps concurrent slow paths deadlock-free.
+        cur.execute('''
+            SELECT shard, available FROM stock_shards
+            WHERE product_id = %s
+            ORDER BY shard
+            FOR UPDATE
+        ''', (product_id,))
+        shards = cur.fetchall()
+        if not shards or sum(available for _, available in shards) < quantity:
+            raise InsufficientStock(product_id)
+
+        taken = []
+        remaining = quantity
+        for shard, available in sorted(shards, key=lambda s: -s[1]):
+            if remaining == 0:
+                break
+            part = min(available, remaining)
+            if part:
+                cur.execute('''
+                    UPDATE stock_shards SET available = available - %s
+                    WHERE product_id = %s AND shard = %s
+                ''', (part, product_id, shard))
+                taken.append((shard, part))
+                remaining -= part
+        return taken
+
+
+def return_stock(conn, product_id: int, shard, quantity: int):
+    """Give quantity units back to the shard (or product) they came from"""
+    with conn.cursor() as cur:
+        if shard is not None:
+            cur.execute('''
+                UPDATE stock_shards SET available = available + %s
+                WHERE product_id = %s AND shard = %s
+            ''', (quantity, product_id, shard))
+            if cur.rowcount:
+                return
+        # Unsharded product, or the product was unsharded since the hold
+        cur.execute('UPDATE products SET stock = stock + %s WHERE id = %s', (quantity, product_id))
+
+
+def reserve(conn, cart_id: str, product_id: int, quantity: int, ttl: int = CART_HOLD_SECONDS):
+    """Hold stock for a cart until it expires; caller commits. Returns expires_at"""
+    taken = take_stock(conn, product_id, quantity)
+    with conn.cursor() as cur:
+        expires_at = None
+        for shard, part in taken:
+            cur.execute('''
+                INSERT INTO cart_reservations (cart_id, product_id, shard, quantity, expires_at)
+                VALUES (%s, %s, %s, %s, LOCALTIMESTAMP + make_interval(secs => %s))
+                RETURNING expires_at
+            ''', (cart_id, product_id, shard, part, ttl))
+            expires_at = cur.fetchone()[0]
+    return expires_at
+
+
+def release_cart(conn, cart_id: str) -> int:
+    """Drop every hold for a cart and return its stock; caller commits"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            DELETE FROM cart_reservations WHERE cart_id = %s
+            RETURNING product_id, shard, quantity
+        ''', (cart_id,))
+        holds = cur.fetchall()
+    for product_id, shard, quantity in holds:
+        return_stock(conn, product_id, shard, quantity)
+    return len(holds)
+
+
+def checkout_stock(conn, items: list, cart_id: str = None):
+    """Take stock for [(product_id, quantity), ...]; caller commits
+
+    Live holds for cart_id are consumed first, anything not covered by a
+    hold is taken directly and unused holds are returned. Raises
+    InsufficientStock, after which the caller must roll back.
+    """
+    holds = {}
+    if cart_id:
+        with conn.cursor() as cur:
+            cur.execute('''
+                DELETE FROM cart_reservations
+                WHERE cart_id = %s AND expires_at > LOCALTIMESTAMP
+                RETURNING product_id, shard, quantity
+            ''', (cart_id,))
+            for product_id, shard, quantity in cur.fetchall():
+                holds.setdefault(product_id, []).append([shard, quantity])
+
+    # Fixed product order so concurrent multi-item checkouts cannot deadlock
+    for product_id, quantity in sorted(items):
+        for hold in holds.get(product_id, []):
+            used = min(hold[1], quantity)
+            hold[1] -= used
+            quantity -= used
+        if quantity:
+            take_stock(conn, product_id, quantity)
+
+    for product_id, product_holds in holds.items():
+        for shard, unused in product_holds:
+            if unused:
+                return_stock(conn, product_id, shard, unused)
+
+
+def sweep_expired(conn, limit: int = SWEEP_BATCH_SIZE) -> int:
+    """Return stock for expired holds; safe to run from every task"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            DELETE FROM cart_reservations
+            WHERE id IN (
+                SELECT id FROM cart_reservations
+                WHERE expires_at <= LOCALTIMESTAMP
+                ORDER BY expires_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING product_id, shard, quantity
+        ''', (limit,))
+        expired = cur.fetchall()
+
+    # One UPDATE per (product, shard) instead of one per hold
+    totals = {}
+    for product_id, shard, quantity in expired:
+        totals[(product_id, shard)] = totals.get((product_id, shard), 0) + quantity
+    for (product_id, shard), quantity in sorted(totals.items(), key=lambda t: (t[0][0], t[0][1] or 0)):
+        return_stock(conn, product_id, shard, quantity)
+
+    conn.commit()
+    return len(expired)
+
+
+def merge_shards(conn) -> int:
+    """Refresh products.stock from shard totals and rebalance drained shards"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE products p SET stock = s.total
+            FROM (
+                SELECT product_id, SUM(available) AS total
+                FROM stock_shards GROUP BY product_id
+            ) s
+            WHERE p.id = s.product_id AND p.stock <> s.total
+        ''')
+        merged = cur.rowcount
+
+        # An empty shard forces single-unit checkouts onto the slow path
+        cur.execute('''
+            SELECT product_id FROM stock_shards
+            GROUP BY product_id
+            HAVING MIN(available) = 0 AND SUM(available) >= COUNT(*)
+        ''')
+        skewed = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    for product_id in skewed:
+        rebalance_shards(conn, product_id)
+    return merged
+
+
+def rebalance_shards(conn, product_id: int):
+    """Spread a product's available stock evenly over its shards"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT shard, available FROM stock_shards
+            WHERE product_id = %s
+            ORDER BY shard
+            FOR UPDATE
+        ''', (product_id,))
+        shards = cur.fetchall()
+        total = sum(available for _, available in shards)
+        for i, (shard, _) in enumerate(shards):
+            share = total // len(shards) + (1 if i < total % len(shards) else 0)
+            cur.execute('''
+                UPDATE stock_shards SET available = %s
+                WHERE product_id = %s AND shard = %s
+            ''', (share, product_id, shard))
+    conn.commit()
+
+
+def shard_product(conn, product_id: int, shards: int = HOT_SKU_SHARDS):
+    """Move a hot product's stock into shard counters"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT stock FROM products WHERE id = %s FOR UPDATE', (product_id,))
+        row = cur.fetchone()
+        if not row:
+            raise ValueError(f'Product {product_id} not found')
+        cur.execute('SELECT 1 FROM stock_shards WHERE product_id = %s LIMIT 1', (product_id,))
+        if cur.fetchone():
+            raise ValueError(f'Product {product_id} is already sharded')
+
+        stock = row[0]
+        for shard in range(shards):
+            share = stock // shards + (1 if shard < stock % shards else 0)
+            cur.execute('''
+                INSERT INTO stock_shards (product_id, shard, available)
+                VALUES (%s, %s, %s)
+            ''', (product_id, shard, share))
+    conn.commit()
+    print(f"Product {product_id}: {stock} units split over {shards} shards")
+
+
+def unshard_product(conn, product_id: int):
+    """Fold shard counters back into products.stock (e.g. before a restock)"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT id FROM products WHERE id = %s FOR UPDATE', (product_id,))
+        cur.execute('''
+            DELETE FROM stock_shards WHERE product_id = %s
+            RETURNING available
+        ''', (product_id,))
+        total = sum(row[0] for row in cur.fetchall())
+        cur.execute('UPDATE products SET stock = %s WHERE id = %s', (total, product_id))
+        # Holds keep their shard number; return_stock falls back to products
+    conn.commit()
+    print(f"Product {product_id}: shards merged back, stock = {total}")
+
+
+if __name__ == '__main__':
+    from migrate import connect
+
+    parser = argparse.ArgumentParser(description='Inventory shard and hold maintenance')
+    parser.add_argument('command', choices=['shard', 'unshard', 'sweep'])
+    parser.add_argument('product_id', type=int, nargs='?')
+    parser.add_argument('--shards', type=int, default=HOT_SKU_SHARDS)
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.command == 'sweep':
+            print(f"Released {sweep_expired(conn)} expired cart holds")
+            print(f"Merged {merge_shards(conn)} sharded products")
+        elif args.product_id is None:
+            parser.error('product_id is required')
+        elif args.command == 'shard':
+            shard_product(conn, args.product_id, args.shards)
+        else:
+            unshard_product(conn, args.product_id)
+    finally:
+        conn.close()
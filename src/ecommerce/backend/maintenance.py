@@ -0,0 +1,72 @@
+"""
+Background maintenance for the e-commerce backend
+Runs periodic database housekeeping tasks (expired cart holds, shard
+merges, idempotency key TTL) in a daemon thread. Every task must be safe
+to run concurrently from all tasks and workers.
+
+Tasks are (name, fn, writes). Once per cycle the thread checks whether
+its database is a writer (not pg_is_in_recovery()) and whether the
+writable() callback allows writes (this region is active); if not, tasks
+that write are skipped and only read-only ones (the catalog snapshot) run.
+"""
+import os
+import time
+import threading
+
+from structured_logging import get_logger
+
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', '30'))
+
+log = get_logger('maintenance')
+
+
+def in_recovery(conn) -> bool:
+    """True if the database is a read replica"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_is_in_recovery()')
+        recovering = cur.fetchone()[0]
+    conn.rollback()
+    return recovering
+
+
+def run_tasks(conn, tasks: list, writable: bool = True):
+    """Run each (name, fn, writes) task once, isolating failures"""
+    for name, task, writes in tasks:
+        if writes and not writable:
+            continue
+        start = time.monotonic()
+        try:
+            result = task(conn)
+            if result:
+                log.info('Maintenance task', task=name, result=result, duration=time.monotonic() - start)
+        except Exception as e:
+            log.error('Maintenance task error', task=name, error=str(e))
+            conn.rollback()
+
+
+def start(get_connection, release_connection, tasks: list, interval: int = MAINTENANCE_INTERVAL_SECONDS,
+          writable=None):
+    """Run tasks every interval seconds in a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            conn = get_connection()
+            if not conn:
+                continue
+            try:
+                try:
+                    replica = in_recovery(conn)
+                except Exception as e:
+                    log.error('Maintenance role check error', error=str(e))
+                    conn.rollback()
+                    continue
+                passive = writable is not None and not writable()
+                if replica or passive:
+                    log.debug('Skipping maintenance writes', replica=replica, passive=passive)
+                run_tasks(conn, tasks, writable=not (replica or passive))
+            finally:
+                release_connection(conn)
+
+    thread = threading.Thread(target=loop, name='maintenance', daemon=True)
+    thread.start()
+    return thread
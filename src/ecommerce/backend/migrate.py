@@ -0,0 +1,360 @@
+"""
+Schema Migration Engine
+Applies the ordered, checksummed SQL files in migrations/ and records them
+in the schema_migrations table.
+
+Files are named NNNN_description.sql and applied in version order. A file
+whose first line is "-- migrate:no-transaction" runs statement by statement
+in autocommit mode, which CREATE INDEX CONCURRENTLY requires.
+
+Usage:
+    python migrate.py                 # primary ($DB_SECRET)
+    python migrate.py --target all    # primary, then DR ($DR_DB_SECRET)
+    python migrate.py --status
+    python migrate.py --on-start      # container start, before gunicorn
+
+--on-start is what the backend image runs before gunicorn, so a deploy
+applies pending migrations before new code serves traffic. It migrates
+only this task's own database and only if it is a writer (a replica gets
+the DDL through replication), and skips a database it cannot reach so a
+task can still start in read-only mode during a writer outage. A failed
+migration exits non-zero and the task does not start.
+"""
+import os
+import re
+import time
+import hashlib
+import argparse
+import psycopg2
+
+from init_db import get_db_credentials
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+DR_DB_SECRET = os.environ.get('DR_DB_SECRET', '')
+MIGRATE_ON_START = os.environ.get('MIGRATE_ON_START', 'true').lower() == 'true'
+
+NO_TRANSACTION_MARKER = '-- migrate:no-transaction'
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+CONCURRENT_INDEX_RE = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)',
+    re.IGNORECASE
+)
+
+# Serializes migrators across tasks/hosts (arbitrary constant key)
+ADVISORY_LOCK_KEY = 727274
+# A migrator waiting for another one polls the lock this often, and gives up
+# (the task fails and is restarted) after the timeout
+LOCK_RETRY_SECONDS = float(os.environ.get('MIGRATE_LOCK_RETRY_SECONDS', '2'))
+LOCK_TIMEOUT_SECONDS = float(os.environ.get('MIGRATE_LOCK_TIMEOUT_SECONDS', '900'))
+
+
+class MigrationError(Exception):
+    """Raised when migrations cannot be applied safely"""
+
+
+def load_migrations() -> list:
+    """Read migration files from disk in version order"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), 'rb') as f:
+            raw = f.read()
+        sql = raw.decode('utf-8')
+        migrations.append({
+            'version': int(match.group(1)),
+            'name': match.group(2),
+            'checksum': hashlib.sha256(raw).hexdigest(),
+            'sql': sql,
+            'transactional': not sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+        })
+
+    versions = [m['version'] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def split_statements(sql: str) -> list:
+    """Split a migration file into individual statements"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+
+def connect(secret_name: str = None):
+    """Open a connection using credentials from Secrets Manager"""
+    creds = get_db_credentials(secret_name)
+    return psycopg2.connect(
+        host=creds['host'],
+        database=creds['dbname'],
+        user=creds['username'],
+        password=creds['password'],
+        port=creds.get('port', 5432)
+    )
+
+
+def is_replica(conn) -> bool:
+    """Return True if the database is a read replica (in recovery)"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_is_in_recovery()')
+        in_recovery = cur.fetchone()[0]
+    conn.rollback()
+    return in_recovery
+
+
+def ensure_migrations_table(conn):
+    """Create the tracking table if it does not exist"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                checksum CHAR(64) NOT NULL,
+                execution_ms INTEGER NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+    conn.commit()
+
+
+def applied_migrations(conn) -> dict:
+    """Return {version: checksum} for migrations already applied"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT to_regclass('schema_migrations') IS NOT NULL
+        ''')
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {}
+        cur.execute('SELECT version, checksum FROM schema_migrations ORDER BY version')
+        rows = cur.fetchall()
+    conn.rollback()
+    return {version: checksum.strip() for version, checksum in rows}
+
+
+def verify_checksums(migrations: list, applied: dict):
+    """Refuse to run if an applied migration file was edited afterwards"""
+    for migration in migrations:
+        recorded = applied.get(migration['version'])
+        if recorded and recorded != migration['checksum']:
+            raise MigrationError(
+                f"Checksum mismatch for migration {migration['version']}_{migration['name']}: "
+                f"applied {recorded[:12]}, file {migration['checksum'][:12]}"
+            )
+
+
+def drop_invalid_index(cur, index_name: str):
+    """Drop an index left INVALID by an interrupted concurrent build"""
+    cur.execute('''
+        SELECT 1 FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    ''', (index_name,))
+    if cur.fetchone():
+        print(f"Dropping invalid index {index_name} from an interrupted build")
+        cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+
+
+def record_migration(cur, migration: dict, execution_ms: int):
+    """Insert the tracking row for an applied migration"""
+    cur.execute('''
+        INSERT INTO schema_migrations (version, name, checksum, execution_ms)
+        VALUES (%s, %s, %s, %s)
+    ''', (migration['version'], migration['name'], migration['checksum'], execution_ms))
+
+
+def apply_migration(conn, migration: dict):
+    """Apply a single migration and record it"""
+    start = time.monotonic()
+
+    if migration['transactional']:
+        with conn.cursor() as cur:
+            cur.execute(migration['sql'])
+            record_migration(cur, migration, int((time.monotonic() - start) * 1000))
+        conn.commit()
+    else:
+        # Every statement is its own transaction; they must be idempotent
+        # (IF NOT EXISTS) so a rerun after a partial failure is safe.
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in split_statements(migration['sql']):
+                    match = CONCURRENT_INDEX_RE.search(statement)
+                    if match:
+                        drop_invalid_index(cur, match.group(1))
+                    cur.execute(statement)
+                record_migration(cur, migration, int((time.monotonic() - start) * 1000))
+        finally:
+            conn.autocommit = False
+
+    duration = time.monotonic() - start
+    print(f"Applied migration {migration['version']}_{migration['name']} in {duration:.2f}s")
+
+
+def acquire_lock(conn, timeout: float = LOCK_TIMEOUT_SECONDS, interval: float = LOCK_RETRY_SECONDS):
+    """Take the migration lock, holding no transaction while waiting
+
+    A session blocked in pg_advisory_lock() keeps its statement's snapshot
+    open, and CREATE INDEX CONCURRENTLY in the lock holder waits for every
+    older snapshot to finish: tasks starting together would deadlock the
+    one migrating. Waiters poll pg_try_advisory_lock() in autocommit instead.
+    """
+    deadline = time.monotonic() + timeout
+    conn.autocommit = True
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute('SELECT pg_try_advisory_lock(%s)', (ADVISORY_LOCK_KEY,))
+                if cur.fetchone()[0]:
+                    return
+            if time.monotonic() > deadline:
+                raise MigrationError(f"Another migrator still holds the migration lock after {timeout:.0f}s")
+            print(f"Another migrator holds the migration lock; retrying in {interval:.0f}s")
+            time.sleep(interval)
+    finally:
+        conn.autocommit = False
+
+
+def apply_migrations(conn) -> list:
+    """Apply all pending migrations to a writable database"""
+    migrations = load_migrations()
+
+    acquire_lock(conn)
+    try:
+        ensure_migrations_table(conn)
+        applied = applied_migrations(conn)
+        verify_checksums(migrations, applied)
+
+        pending = [m for m in migrations if m['version'] not in applied]
+        for migration in pending:
+            apply_migration(conn, migration)
+
+        if not pending:
+            print("Schema is up to date")
+        return [m['version'] for m in pending]
+    finally:
+        # A failed transactional migration leaves the transaction aborted,
+        # and the unlock would fail with InFailedSqlTransaction
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_unlock(%s)', (ADVISORY_LOCK_KEY,))
+        conn.commit()
+
+
+def wait_for_replica(conn, version: int, timeout: int = 600, interval: int = 5):
+    """Wait until a read replica has replayed migrations up to version"""
+    migrations = load_migrations()
+    deadline = time.monotonic() + timeout
+
+    while True:
+        applied = applied_migrations(conn)
+        latest = max(applied) if applied else 0
+        if latest >= version:
+            verify_checksums(migrations, applied)
+            print(f"Replica has replayed migrations up to {latest}")
+            return latest
+        if time.monotonic() > deadline:
+            raise MigrationError(
+                f"Replica still at migration {latest} after {timeout}s (expected {version})"
+            )
+        time.sleep(interval)
+
+
+def migrate_targets(targets: list, replica_timeout: int = 600) -> dict:
+    """Apply migrations to writers first, then verify replicas replayed them
+
+    Physical replicas cannot run DDL: they receive it through replication.
+    A promoted DR instance is a writer again and is migrated directly.
+    """
+    connections = {name: connect(secret) for name, secret in targets}
+    results = {}
+
+    try:
+        roles = {name: is_replica(conn) for name, conn in connections.items()}
+        writers = [name for name, _ in targets if not roles[name]]
+        replicas = [name for name, _ in targets if roles[name]]
+
+        expected = max((m['version'] for m in load_migrations()), default=0)
+
+        for name in writers:
+            print(f"Migrating {name} (writer)")
+            results[name] = {'role': 'writer', 'applied': apply_migrations(connections[name])}
+
+        for name in replicas:
+            print(f"Waiting for {name} (replica) to replay migrations")
+            results[name] = {
+                'role': 'replica',
+                'version': wait_for_replica(connections[name], expected, replica_timeout)
+            }
+        return results
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+def migrate_on_start(secret_name: str = None):
+    """Migrate this task's database if it is a reachable writer"""
+    if not MIGRATE_ON_START:
+        print("MIGRATE_ON_START is off; not migrating")
+        return
+    try:
+        conn = connect(secret_name)
+    except Exception as e:
+        print(f"Database unreachable, starting without migrating: {e}")
+        return
+    try:
+        if is_replica(conn):
+            print("Database is a read replica; migrations arrive through replication")
+            return
+        apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+def print_status(secret_name: str = None):
+    """Print applied and pending migrations for one database"""
+    conn = connect(secret_name)
+    try:
+        applied = applied_migrations(conn)
+        for migration in load_migrations():
+            recorded = applied.get(migration['version'])
+            if recorded is None:
+                state = 'pending'
+            elif recorded != migration['checksum']:
+                state = 'CHECKSUM MISMATCH'
+            else:
+                state = 'applied'
+            print(f"{migration['version']:04d}_{migration['name']}: {state}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--target', choices=['primary', 'dr', 'all'], default='primary')
+    parser.add_argument('--status', action='store_true', help='Show migration status and exit')
+    parser.add_argument('--on-start', action='store_true',
+                        help="Migrate $DB_SECRET if it is a reachable writer (container start)")
+    parser.add_argument('--replica-timeout', type=int, default=600,
+                        help='Seconds to wait for a replica to replay migrations')
+    args = parser.parse_args()
+
+    if args.on_start:
+        migrate_on_start(os.environ.get('DB_SECRET'))
+        raise SystemExit(0)
+
+    targets = []
+    if args.target in ('primary', 'all'):
+        targets.append(('primary', os.environ.get('DB_SECRET')))
+    if args.target in ('dr', 'all'):
+        if not DR_DB_SECRET:
+            parser.error('DR_DB_SECRET must be set for --target dr/all')
+        targets.append(('dr', DR_DB_SECRET))
+
+    if args.status:
+        for name, secret in targets:
+            print(f"== {name} ==")
+            print_status(secret)
+    else:
+        migrate_targets(targets, args.replica_timeout)
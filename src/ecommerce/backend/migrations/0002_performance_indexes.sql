@@ -0,0 +1,11 @@
+-- migrate:no-transaction
+-- Indexes for FK checks, order lookups and the catalog listing.
+-- Built CONCURRENTLY so writes to these tables are never blocked.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_product_id ON order_items (product_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_name ON products (name);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_created_at ON orders (created_at);
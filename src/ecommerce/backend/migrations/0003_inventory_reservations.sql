@@ -0,0 +1,25 @@
+-- Time-limited cart holds and sharded stock counters for hot products.
+-- products.stock is the unreserved quantity; for products with rows in
+-- stock_shards the shards are authoritative and products.stock is the
+-- periodically merged total used for catalog display.
+
+CREATE TABLE IF NOT EXISTS cart_reservations (
+    id BIGSERIAL PRIMARY KEY,
+    cart_id VARCHAR(64) NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    shard SMALLINT,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cart_reservations_cart_id ON cart_reservations (cart_id);
+
+CREATE INDEX IF NOT EXISTS idx_cart_reservations_expires_at ON cart_reservations (expires_at);
+
+CREATE TABLE IF NOT EXISTS stock_shards (
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    shard SMALLINT NOT NULL,
+    available INTEGER NOT NULL CHECK (available >= 0),
+    PRIMARY KEY (product_id, shard)
+);
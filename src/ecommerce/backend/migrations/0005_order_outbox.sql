@@ -0,0 +1,12 @@
+-- Durable outbox of order events, written in the order transaction and
+-- shipped to the DR region so failover can replay what replication missed.
+
+CREATE TABLE IF NOT EXISTS order_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    shipped_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_outbox_unshipped ON order_outbox (id) WHERE shipped_at IS NULL;
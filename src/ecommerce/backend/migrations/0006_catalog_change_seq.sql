@@ -0,0 +1,17 @@
+-- Bumped once per statement that changes products, so the catalog
+-- snapshot publisher can tell whether anything changed without scanning.
+-- A sequence takes no row locks, so concurrent checkouts do not queue on it.
+
+CREATE SEQUENCE IF NOT EXISTS catalog_change_seq;
+
+CREATE OR REPLACE FUNCTION bump_catalog_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM nextval('catalog_change_seq');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_catalog_change ON products;
+CREATE TRIGGER products_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_change();
@@ -0,0 +1,20 @@
+-- Marked test SKU for the health checker's synthetic checkout journeys.
+-- Synthetic products are hidden from the catalog listing and snapshots,
+-- and their orders are purged by the backend's maintenance task.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS synthetic BOOLEAN NOT NULL DEFAULT false;
+
+-- Fixed id, so the prober can address it in every environment; the stock
+-- covers one checkout per minute per region for centuries
+INSERT INTO products (id, name, description, price, image_url, stock, sku, synthetic)
+VALUES (
+    2000000000,
+    'Synthetic probe',
+    'Not for sale. Checked out by synthetic monitoring.',
+    0.01,
+    NULL,
+    1000000000,
+    'synthetic-probe',
+    true
+)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,5 @@
+-- pg_prewarm lets the post-promotion warm-up (warmup.py) load hot tables
+-- and indexes into shared_buffers before traffic moves to the DR region.
+-- CREATE EXTENSION is WAL-logged, so the DR replica has it too.
+
+CREATE EXTENSION IF NOT EXISTS pg_prewarm;
@@ -0,0 +1,5 @@
+-- Identity of the order event an order was created from, so outbox replay
+-- can tell a replicated or already replayed order from a different order
+-- that the promoted database gave the same serial id.
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS event_id UUID;
@@ -0,0 +1,5 @@
+-- migrate:no-transaction
+-- Replay looks orders up by event id. Built CONCURRENTLY so checkouts are
+-- never blocked; orders from before 0009 have no event id.
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_event_id ON orders (event_id);
@@ -0,0 +1,27 @@
+-- The statement trigger from 0006 also fired on stock-only and zero-row
+-- UPDATEs (every checkout and shard merge), so the snapshot publisher
+-- re-rendered every cycle. Bump catalog_change_seq only for rows whose
+-- catalog fields changed; stock reaches the snapshot with the periodic
+-- re-render (CATALOG_SNAPSHOT_MAX_AGE_SECONDS).
+
+DROP TRIGGER IF EXISTS products_catalog_change ON products;
+
+DROP TRIGGER IF EXISTS products_catalog_insert_delete ON products;
+CREATE TRIGGER products_catalog_insert_delete
+    AFTER INSERT OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION bump_catalog_change();
+
+-- UPDATE OF skips statements that do not set these columns (take_stock,
+-- merge_shards) without evaluating WHEN at all
+DROP TRIGGER IF EXISTS products_catalog_update ON products;
+CREATE TRIGGER products_catalog_update
+    AFTER UPDATE OF name, description, price, image_url, synthetic ON products
+    FOR EACH ROW
+    WHEN (
+        OLD.name IS DISTINCT FROM NEW.name
+        OR OLD.description IS DISTINCT FROM NEW.description
+        OR OLD.price IS DISTINCT FROM NEW.price
+        OR OLD.image_url IS DISTINCT FROM NEW.image_url
+        OR OLD.synthetic IS DISTINCT FROM NEW.synthetic
+    )
+    EXECUTE FUNCTION bump_catalog_change();
@@ -0,0 +1,438 @@
+"""
+Order Event Outbox
+create_order writes a compact event to order_outbox in the same
+transaction as the order. A background shipper drains unshipped events in
+batches to a sink, keeping several batches in flight, so an order committed
+inside the replica-lag window can be replayed into the promoted DR database
+after failover. In AWS the sink is the primary's own bucket: the task
+subnets reach S3 only through the same-region gateway endpoint, and S3
+cross-region replication copies order-outbox/ to the DR bucket (usually
+within seconds, 15 minutes at most under Replication Time Control).
+
+The shipper's lag gauges (outbox_last_ship_lag_seconds_*) end at the sink's
+acknowledgement, i.e. the local PUT: arrival in the DR region is later by
+the bucket's replication latency, which S3 reports per rule as the
+ReplicationLatency and OperationsPendingReplication CloudWatch metrics.
+
+Sinks (OUTBOX_SINK):
+    s3://bucket/prefix/     one gzipped JSONL object per batch
+    file:///path/out.jsonl  appended JSONL, fsynced per batch
+    queue://                in-process queue (tests and local runs)
+
+Usage:
+    python outbox.py replay s3://dr-bucket/order-outbox/   # into $DB_SECRET
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import queue
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from structured_logging import get_logger
+
+OUTBOX_SINK = os.environ.get('OUTBOX_SINK', '')
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_MAX_IN_FLIGHT = int(os.environ.get('OUTBOX_MAX_IN_FLIGHT', '4'))
+OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', '0.5'))
+OUTBOX_RETENTION_SECONDS = int(os.environ.get('OUTBOX_RETENTION_SECONDS', '3600'))
+
+log = get_logger('outbox')
+
+
+def build_event(order_id: int, total, items: list, region: str,
+                idempotency_key: str = None, request_hash: str = None, event_id: str = None) -> dict:
+    """Compact order event: items are [product_id, quantity, price]
+
+    event_id is the order's orders.event_id, which replay deduplicates on.
+    """
+    return {
+        'event_id': event_id,
+        'order_id': order_id,
+        'total': str(total),
+        'items': [[product_id, quantity, str(price)] for product_id, quantity, price in items],
+        'region': region,
+        'idempotency_key': idempotency_key,
+        'request_hash': request_hash,
+        'ts': time.time()
+    }
+
+
+def publish(conn, event: dict):
+    """Add an event to the outbox inside the caller's transaction"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO order_outbox (order_id, payload) VALUES (%s, %s)
+        ''', (event['order_id'], json.dumps(event, separators=(',', ':'))))
+
+
+# -----------------------------------------------------------------------------
+# Sinks
+# -----------------------------------------------------------------------------
+
+class Sink(ABC):
+    """Destination for shipped event batches"""
+
+    @abstractmethod
+    def send(self, batch_id: str, events: list) -> int:
+        """Durably store a batch; returns bytes written"""
+
+    @abstractmethod
+    def read_all(self):
+        """Yield every stored event (used for replay)"""
+
+
+class S3Sink(Sink):
+    """One gzipped JSONL object per batch in a (same-region, replicated) bucket"""
+
+    def __init__(self, bucket: str, prefix: str = ''):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3 = boto3.client('s3')
+
+    def send(self, batch_id: str, events: list) -> int:
+        body = gzip.compress('\n'.join(json.dumps(e, separators=(',', ':')) for e in events).encode('utf-8'))
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{batch_id}.jsonl.gz",
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
+        )
+        return len(body)
+
+    def read_all(self):
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                body = self.s3.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'].read()
+                for line in gzip.decompress(body).decode('utf-8').splitlines():
+                    if line:
+                        yield json.loads(line)
+
+
+class FileSink(Sink):
+    """Appends JSONL to a local file (stand-in for tests and drills)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, batch_id: str, events: list) -> int:
+        data = ''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in events).encode('utf-8')
+        with self.lock, open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def read_all(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class LocalQueueSink(Sink):
+    """In-process queue (stand-in for tests)"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def send(self, batch_id: str, events: list) -> int:
+        for event in events:
+            self.queue.put(event)
+        return 0
+
+    def read_all(self):
+        while not self.queue.empty():
+            yield self.queue.get_nowait()
+
+
+def sink_from_uri(uri: str) -> Sink:
+    """Build a sink from an OUTBOX_SINK style URI"""
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3Sink(bucket, prefix)
+    if uri.startswith('file://'):
+        return FileSink(uri[len('file://'):])
+    if uri.startswith('queue://'):
+        return LocalQueueSink()
+    raise ValueError(f'Unsupported outbox sink: {uri}')
+
+
+# -----------------------------------------------------------------------------
+# Shipper
+# -----------------------------------------------------------------------------
+
+class OutboxShipper:
+    """Drains order_outbox to a sink with several batches in flight
+
+    Each in-flight batch holds its rows with FOR UPDATE SKIP LOCKED on its
+    own connection until the sink acknowledges, so concurrent shippers (all
+    tasks and workers run one) never send the same event twice except after
+    a crash between send and commit. Replay is idempotent by event_id.
+    """
+
+    def __init__(self, get_connection, release_connection, sink: Sink,
+                 batch_size: int = OUTBOX_BATCH_SIZE, max_in_flight: int = OUTBOX_MAX_IN_FLIGHT):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.stats = {
+            'batches': 0,
+            'events': 0,
+            'bytes': 0,
+            'errors': 0,
+            'last_batch_events': 0,
+            'last_batch_seconds': 0.0,
+            'last_batch_events_per_second': 0.0,
+            'last_ship_lag_seconds_max': 0.0,
+            'last_ship_lag_seconds_avg': 0.0
+        }
+
+    def ship_batch(self) -> int:
+        """Claim, send and mark one batch; returns the number of events"""
+        conn = self.get_connection()
+        if not conn:
+            return 0
+        try:
+            start = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT id, payload, EXTRACT(EPOCH FROM LOCALTIMESTAMP - created_at)
+                    FROM order_outbox
+                    WHERE shipped_at IS NULL
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ''', (self.batch_size,))
+                rows = cur.fetchall()
+                if not rows:
+                    conn.rollback()
+                    return 0
+
+                events = [json.loads(payload) for _, payload, _ in rows]
+                written = self.sink.send(f"{rows[0][0]:020d}-{rows[-1][0]:020d}", events)
+
+                cur.execute('''
+                    UPDATE order_outbox SET shipped_at = LOCALTIMESTAMP WHERE id = ANY(%s)
+                ''', ([row[0] for row in rows],))
+            conn.commit()
+
+            elapsed = time.monotonic() - start
+            # Ship lag: commit in create_order -> acknowledged by the sink
+            # (the local PUT; replication to the DR bucket comes after)
+            lags = [float(lag) + elapsed for _, _, lag in rows]
+            with self.lock:
+                self.stats['batches'] += 1
+                self.stats['events'] += len(rows)
+                self.stats['bytes'] += written
+                self.stats['last_batch_events'] = len(rows)
+                self.stats['last_batch_seconds'] = elapsed
+                self.stats['last_batch_events_per_second'] = len(rows) / elapsed if elapsed > 0 else 0.0
+                self.stats['last_ship_lag_seconds_max'] = max(lags)
+                self.stats['last_ship_lag_seconds_avg'] = sum(lags) / len(lags)
+            return len(rows)
+        except Exception as e:
+            log.error('Outbox shipping error', error=str(e), max_per_second=1)
+            conn.rollback()
+            with self.lock:
+                self.stats['errors'] += 1
+            return 0
+        finally:
+            self.release_connection(conn)
+
+    def run(self, poll_interval: float = OUTBOX_POLL_SECONDS):
+        """Keep up to max_in_flight batches shipping; sleep when drained"""
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='outbox') as executor:
+            while not self.stopping.is_set():
+                futures = [executor.submit(self.ship_batch) for _ in range(self.max_in_flight)]
+                shipped = sum(f.result() for f in futures)
+                if shipped < self.batch_size:
+                    self.stopping.wait(poll_interval)
+
+    def start(self):
+        """Run the shipper in a daemon thread"""
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name='outbox-shipper', daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self, timeout: float = None):
+        """Finish the batches in flight and stop; unsent events stay queued"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        """Copy of the shipper metrics"""
+        with self.lock:
+            return dict(self.stats)
+
+    def metrics_lines(self) -> list:
+        """Shipper metrics in Prometheus text format"""
+        stats = self.snapshot()
+        lines = []
+        for key in ('batches', 'events', 'bytes', 'errors'):
+            lines += [f'# TYPE outbox_{key}_total counter', f'outbox_{key}_total {stats[key]}']
+        for key in ('last_batch_events_per_second', 'last_ship_lag_seconds_max', 'last_ship_lag_seconds_avg'):
+            lines += [f'# TYPE outbox_{key} gauge', f'outbox_{key} {stats[key]}']
+        return lines
+
+
+def purge_shipped(conn, retention: int = OUTBOX_RETENTION_SECONDS) -> int:
+    """Delete events that were shipped more than retention seconds ago"""
+    with conn.cursor() as cur:
+        cur.execute('''
+            DELETE FROM order_outbox
+            WHERE shipped_at < LOCALTIMESTAMP - make_interval(secs => %s)
+        ''', (retention,))
+        purged = cur.rowcount
+    conn.commit()
+    return purged
+
+
+# -----------------------------------------------------------------------------
+# Replay (run against the promoted DR database after failover)
+# -----------------------------------------------------------------------------
+
+def same_order(cur, event: dict) -> bool:
+    """Whether the order stored under the event's id has its total and items"""
+    cur.execute('SELECT total FROM orders WHERE id = %s', (event['order_id'],))
+    row = cur.fetchone()
+    if row is None or row[0] != Decimal(event['total']):
+        return False
+    cur.execute('''
+        SELECT product_id, quantity, price FROM order_items WHERE order_id = %s
+    ''', (event['order_id'],))
+    stored = sorted((product_id, quantity, price) for product_id, quantity, price in cur.fetchall())
+    shipped = sorted((product_id, quantity, Decimal(price)) for product_id, quantity, price in event['items'])
+    return stored == shipped
+
+
+def replay(conn, events) -> dict:
+    """Insert orders the promoted database is missing; idempotent by event_id
+
+    An order whose event_id is already present (replicated, or replayed
+    before) is skipped. If the promoted database has meanwhile given the
+    order's id to a different order, the event is inserted under a new id
+    and listed in 'remapped' as [old_id, new_id]. Events shipped before
+    orders had an event_id can only be matched by id: one whose id is taken
+    by an order with the same total and items was replicated and is
+    skipped; any other is not replayed but listed in 'unverified' for a
+    manual check.
+    """
+    from inventory import take_stock, InsufficientStock
+
+    result = {'seen': 0, 'replayed': 0, 'remapped': [], 'unverified': [], 'oversold': []}
+    for event in events:
+        result['seen'] += 1
+        event_id = event.get('event_id')
+        with conn.cursor() as cur:
+            if event_id:
+                cur.execute('SELECT 1 FROM orders WHERE event_id = %s', (event_id,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+
+            cur.execute('''
+                INSERT INTO orders (id, total, status, created_at, event_id)
+                VALUES (%s, %s, 'pending', to_timestamp(%s) AT TIME ZONE 'UTC', %s)
+                ON CONFLICT (id) DO NOTHING
+                RETURNING id
+            ''', (event['order_id'], event['total'], event['ts'], event_id))
+            row = cur.fetchone()
+            if not row and not event_id:
+                replicated = same_order(cur, event)
+                conn.rollback()
+                if not replicated:
+                    result['unverified'].append(event['order_id'])
+                continue
+            if not row:
+                # The id belongs to an order placed here after promotion
+                cur.execute('''
+                    INSERT INTO orders (total, status, created_at, event_id)
+                    VALUES (%s, 'pending', to_timestamp(%s) AT TIME ZONE 'UTC', %s)
+                    RETURNING id
+                ''', (event['total'], event['ts'], event_id))
+                row = cur.fetchone()
+                result['remapped'].append([event['order_id'], row[0]])
+            order_id = row[0]
+
+            for product_id, quantity, price in event['items']:
+                cur.execute('''
+                    INSERT INTO order_items (order_id, product_id, quantity, price)
+                    VALUES (%s, %s, %s, %s)
+                ''', (order_id, product_id, quantity, price))
+                try:
+                    cur.execute('SAVEPOINT take_stock')
+                    take_stock(conn, product_id, quantity)
+                    cur.execute('RELEASE SAVEPOINT take_stock')
+                except InsufficientStock:
+                    # The order was paid for in the old primary; keep it and flag it
+                    cur.execute('ROLLBACK TO SAVEPOINT take_stock')
+                    result['oversold'].append([order_id, product_id, quantity])
+
+            if event.get('idempotency_key'):
+                cur.execute('''
+                    INSERT INTO idempotency_keys (key, request_hash, status_code, response_body, expires_at)
+                    VALUES (%s, %s, 201, %s, LOCALTIMESTAMP + interval '1 day')
+                    ON CONFLICT (key) DO NOTHING
+                ''', (
+                    event['idempotency_key'],
+                    event['request_hash'],
+                    json.dumps({
+                        'message': 'Order created successfully',
+                        'order_id': order_id,
+                        'total': float(event['total']),
+                        'region': event['region']
+                    })
+                ))
+        conn.commit()
+        result['replayed'] += 1
+
+    # New orders must not collide with replayed ids
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT setval(pg_get_serial_sequence('orders', 'id'), (SELECT MAX(id) FROM orders))
+            WHERE EXISTS (SELECT 1 FROM orders)
+        ''')
+    conn.commit()
+    return result
+
+
+if __name__ == '__main__':
+    from migrate import connect
+
+    parser = argparse.ArgumentParser(description='Order outbox tools')
+    parser.add_argument('command', choices=['replay'])
+    parser.add_argument('sink', help='Sink URI the primary shipped to (s3:// or file://)')
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        result = replay(conn, sink_from_uri(args.sink).read_all())
+        print(json.dumps(result))
+        if result['oversold']:
+            print(f"WARNING: {len(result['oversold'])} replayed lines exceeded available stock", file=sys.stderr)
+        if result['remapped']:
+            print(f"WARNING: {len(result['remapped'])} replayed orders got new ids (old id already taken)",
+                  file=sys.stderr)
+        if result['unverified']:
+            print(f"WARNING: {len(result['unverified'])} events without event_id collided with different orders; "
+                  f"check them by hand", file=sys.stderr)
+    finally:
+        conn.close()
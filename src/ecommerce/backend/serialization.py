@@ -0,0 +1,196 @@
+"""
+Response serialization and compression for the backend
+jsonify() goes through orjson, which encodes datetimes, UUIDs and
+dataclasses natively (Decimal prices still come out as strings, as with
+Flask's encoder). JSON and text responses above COMPRESS_MIN_BYTES are
+compressed with br or gzip, whichever the client prefers.
+
+Responses built from a ResponseCache entry are compressed once per
+encoding and reused until the entry expires, and carry an ETag so a
+repeat browser request is answered with 304.
+"""
+import os
+import gzip
+import time
+import hashlib
+import threading
+from decimal import Decimal
+
+import brotli
+import orjson
+from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL_GZIP = int(os.environ.get('COMPRESS_LEVEL_GZIP', '6'))
+COMPRESS_LEVEL_BR = int(os.environ.get('COMPRESS_LEVEL_BR', '5'))
+
+# Cached bodies are compressed once, so they can afford the slower levels
+CACHED_LEVEL_GZIP = 9
+CACHED_LEVEL_BR = 9
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+SUPPORTED_ENCODINGS = ('br', 'gzip')
+
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+
+def _default(o):
+    """Types orjson does not encode natively"""
+    if isinstance(o, Decimal):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    """Encode obj as compact, key-sorted JSON bytes"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # indent, ensure_ascii and friends need the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+# -----------------------------------------------------------------------------
+# Compression
+# -----------------------------------------------------------------------------
+
+def negotiate(accept_encoding: str):
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values"""
+    if not accept_encoding:
+        return None
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        candidates = SUPPORTED_ENCODINGS if name == '*' else (name,)
+        for candidate in candidates:
+            if candidate not in SUPPORTED_ENCODINGS or q <= 0:
+                continue
+            # Equal q-values prefer br, which is listed first
+            if q > best_q or (q == best_q and SUPPORTED_ENCODINGS.index(candidate) < SUPPORTED_ENCODINGS.index(best)):
+                best, best_q = candidate, q
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """Compress body with the negotiated encoding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=CACHED_LEVEL_BR if cached else COMPRESS_LEVEL_BR)
+    return gzip.compress(body, compresslevel=CACHED_LEVEL_GZIP if cached else COMPRESS_LEVEL_GZIP, mtime=0)
+
+
+class CachedBody:
+    """A serialized response body plus lazily built compressed variants"""
+
+    def __init__(self, body: bytes, expires_at: float):
+        self.body = body
+        self.expires_at = expires_at
+        self.etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.variants = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        # Two threads may race to build a variant; both results are identical
+        variant = self.variants.get(encoding)
+        if variant is None:
+            variant = self.variants[encoding] = compress(self.body, encoding, cached=True)
+        return variant
+
+
+class ResponseCache:
+    """Short-lived per-process cache of serialized responses"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        return entry
+
+    def get_stale(self, key, max_stale: float):
+        """An entry up to max_stale seconds past its expiry (database outages)"""
+        entry = self.entries.get(key)
+        if entry is None or entry.expires_at + max_stale <= time.monotonic():
+            return None
+        return entry
+
+    def put(self, key, obj) -> CachedBody:
+        entry = CachedBody(dumps(obj), time.monotonic() + self.ttl)
+        if self.ttl > 0:
+            with self.lock:
+                self.entries[key] = entry
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+
+def cached_response(app: Flask, entry: CachedBody, status: int = 200):
+    """Response for a cached body; 304 when the client already has it"""
+    if request.if_none_match.contains(entry.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(entry.body, status=status, mimetype='application/json')
+        response.precompressed = entry
+    response.set_etag(entry.etag)
+    return response
+
+
+def init_app(app: Flask):
+    """Use the orjson provider and compress eligible responses"""
+    if not isinstance(app.json, FastJSONProvider):
+        app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code >= 300 or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        entry = getattr(response, 'precompressed', None)
+        if entry is not None:
+            response.set_data(entry.encoded(encoding))
+        else:
+            response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,240 @@
+"""
+Structured logging shared by the backend and the control-plane lambdas
+Every record is one JSON line carrying the logger name, level and any bound
+context (run_id, step, region, ...). Lines are buffered and written to
+stdout in batches; in Lambda the buffer is flushed at the end of each
+invocation (see flush_after), elsewhere by a background writer thread.
+
+Noisy paths can be sampled per call (sample_rate) or rate limited per
+message (max_per_second); suppressed repeats are counted on the next
+emitted record. metric() writes CloudWatch Embedded Metric Format, so
+durations become CloudWatch metrics straight from the log stream without
+PutMetricData calls.
+
+The lambdas package this file next to their handler (see control-plane
+main.tf), so it must only depend on the standard library.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), 20)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DRPlatform')
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '0.25'))
+LOG_BUFFER_LINES = int(os.environ.get('LOG_BUFFER_LINES', '256'))
+
+# Lambda freezes background threads between invocations
+IN_LAMBDA = bool(os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+
+class _Emitter:
+    """Buffers JSON lines and writes them to stdout in batches"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def emit(self, line: str):
+        with self.lock:
+            self.buffer.append(line)
+            full = len(self.buffer) >= LOG_BUFFER_LINES
+        if IN_LAMBDA:
+            if full:
+                self.flush()
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self._start()
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+    def _start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            # Also covers a forked worker, which inherits no running thread
+            self.thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(LOG_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+_emitter = _Emitter()
+atexit.register(_emitter.flush)
+
+
+def _reset_after_fork():
+    # The writer thread does not survive fork and may have held the lock
+    _emitter.lock = threading.Lock()
+    _emitter.wakeup = threading.Event()
+    _emitter.thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def flush():
+    """Write out everything buffered so far"""
+    _emitter.flush()
+
+
+def flush_after(handler):
+    """Decorator for Lambda handlers: flush logs before returning"""
+    def wrapper(event, context):
+        try:
+            return handler(event, context)
+        finally:
+            _emitter.flush()
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+
+class _RateLimiter:
+    """Per-key token bucket that counts what it suppresses"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = {}
+
+    def allow(self, key: str, per_second: float):
+        """Return (allowed, suppressed_since_last_allowed)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last, suppressed = self.state.get(key, (1.0, now, 0))
+            tokens = min(1.0, tokens + (now - last) * per_second)
+            if tokens >= 1.0:
+                self.state[key] = (tokens - 1.0, now, 0)
+                return True, suppressed
+            self.state[key] = (tokens, now, suppressed + 1)
+            return False, 0
+
+
+_limiter = _RateLimiter()
+_context = threading.local()
+
+
+def set_context(**fields):
+    """Replace the fields added to every record from this thread (run_id, ...)"""
+    _context.fields = fields
+
+
+class StructuredLogger:
+    """JSON logger with bound context fields"""
+
+    def __init__(self, name: str, context: dict = None):
+        self.name = name
+        self.context = context or {}
+
+    def bind(self, **fields) -> 'StructuredLogger':
+        """Child logger that adds fields to every record"""
+        return StructuredLogger(self.name, {**self.context, **fields})
+
+    def _log(self, level: str, msg: str, sample_rate: float = None, max_per_second: float = None, **fields):
+        if LEVELS[level] < LOG_LEVEL:
+            return
+        if sample_rate is not None and random.random() >= sample_rate:
+            return
+        suppressed = 0
+        if max_per_second is not None:
+            allowed, suppressed = _limiter.allow(f"{self.name}:{msg}", max_per_second)
+            if not allowed:
+                return
+
+        record = {
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'level': level,
+            'logger': self.name,
+            'msg': msg,
+            **getattr(_context, 'fields', {}),
+            **self.context,
+            **fields
+        }
+        if sample_rate is not None:
+            record['sample_rate'] = sample_rate
+        if suppressed:
+            record['suppressed'] = suppressed
+        _emitter.emit(json.dumps(record, default=str, separators=(',', ':')))
+
+    def debug(self, msg: str, **fields):
+        self._log('DEBUG', msg, **fields)
+
+    def info(self, msg: str, **fields):
+        self._log('INFO', msg, **fields)
+
+    def warning(self, msg: str, **fields):
+        self._log('WARNING', msg, **fields)
+
+    def error(self, msg: str, **fields):
+        self._log('ERROR', msg, **fields)
+
+    def metric(self, name: str, value: float, unit: str = 'Seconds', dimensions: dict = None,
+               msg: str = 'metric', level: str = 'INFO', **fields):
+        """Emit one CloudWatch Embedded Metric Format value (never sampled)
+
+        The record is also an ordinary log line, so a step's own log record
+        can carry its duration instead of writing a second line.
+        """
+        self.metrics({name: value}, {name: unit}, dimensions, msg=msg, level=level, **fields)
+
+    def metrics(self, values: dict, units: dict = None, dimensions: dict = None,
+                msg: str = 'metric', level: str = 'INFO', **fields):
+        """Emit several EMF values sharing one set of dimensions"""
+        units = units or {}
+        dimensions = dimensions or {}
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [list(dimensions.keys())],
+                    'Metrics': [{'Name': name, 'Unit': units.get(name, 'None')} for name in values]
+                }]
+            },
+            'level': level,
+            'logger': self.name,
+            'msg': msg,
+            **getattr(_context, 'fields', {}),
+            **self.context,
+            **fields,
+            **dimensions,
+            **values
+        }
+        _emitter.emit(json.dumps(record, default=str, separators=(',', ':')))
+
+    @contextmanager
+    def timed(self, name: str, dimensions: dict = None, **fields):
+        """Emit the duration of a block as an EMF metric"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.metric(name, time.monotonic() - start, 'Seconds', dimensions, **fields)
+
+
+def get_logger(name: str, **context) -> StructuredLogger:
+    """Logger for a module, optionally with static context fields"""
+    return StructuredLogger(name, context)
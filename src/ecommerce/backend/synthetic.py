@@ -0,0 +1,42 @@
+"""
+Synthetic probe orders
+The health checker's synthetic journeys check out the marked test SKU
+(products.synthetic) in the active region every minute, through the real
+cart and order path. Their orders are deleted here once they are older
+than SYNTHETIC_ORDER_RETENTION_HOURS, so they never pile up in reports.
+"""
+import os
+
+SYNTHETIC_ORDER_RETENTION_HOURS = int(os.environ.get('SYNTHETIC_ORDER_RETENTION_HOURS', '24'))
+PURGE_BATCH_SIZE = 500
+
+
+def purge_orders(conn, limit: int = PURGE_BATCH_SIZE) -> int:
+    """Delete a batch of old orders that contain only synthetic products"""
+    with conn.cursor() as cur:
+        # order_items goes in the same statement; the FK is checked at its end
+        cur.execute('''
+            WITH doomed AS (
+                SELECT o.id FROM orders o
+                WHERE o.id IN (
+                    SELECT oi.order_id FROM order_items oi
+                    JOIN products p ON p.id = oi.product_id
+                    WHERE p.synthetic
+                )
+                AND o.created_at < LOCALTIMESTAMP - make_interval(hours => %s)
+                AND NOT EXISTS (
+                    SELECT 1 FROM order_items oi
+                    JOIN products p ON p.id = oi.product_id
+                    WHERE oi.order_id = o.id AND NOT p.synthetic
+                )
+                ORDER BY o.id
+                LIMIT %s
+                FOR UPDATE OF o SKIP LOCKED
+            ), items AS (
+                DELETE FROM order_items WHERE order_id IN (SELECT id FROM doomed)
+            )
+            DELETE FROM orders WHERE id IN (SELECT id FROM doomed)
+        ''', (SYNTHETIC_ORDER_RETENTION_HOURS, limit))
+        purged = cur.rowcount
+    conn.commit()
+    return purged
@@ -0,0 +1,512 @@
+"""
+Request tracing, query timing and sampled profiling for the backend
+A REQUEST_SAMPLE_RATE fraction of requests is timed and recorded, and the
+request histogram scales its counts back up by 1/REQUEST_SAMPLE_RATE
+(as StatsD sample rates do). Every statement is timed under a normalized
+fingerprint. A TRACE_SAMPLE_RATE fraction of requests is also traced: it
+records how long it spent in each phase (secret_fetch, connect, query,
+commit, serialize) and returns the breakdown to the caller in a
+Server-Timing header. Everything is aggregated into fixed-bucket
+histograms served in Prometheus text format at /metrics.
+
+The per-request cost is kept to one wrapper around Flask's dispatch (no
+before/after/teardown hooks). A request outside every sample pays for one
+random draw and a status check: clocks, spans, request lookups and
+histogram updates happen only on sampled requests, and on failed ones.
+benchmarks/telemetry_overhead.py checks the total against a budget.
+
+The stack profiler samples request threads every PROFILER_INTERVAL_MS and
+can be switched on and off at runtime through /debug/profiler (not routed
+by the ALB, and only with the warm-up token in X-Warmup-Token). Requests
+only register their thread while it is running.
+"""
+import os
+import re
+import sys
+import random
+import time
+import bisect
+import threading
+from collections import deque
+
+from flask import Flask, request, jsonify
+from psycopg2.extensions import connection as _pg_connection, cursor as _pg_cursor
+from psycopg2.extras import RealDictCursor
+
+import warmup
+from serialization import FastJSONProvider, dumps as _dumps
+from structured_logging import get_logger
+
+TELEMETRY_ENABLED = os.environ.get('TELEMETRY_ENABLED', 'true') == 'true'
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false') == 'true'
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '20'))
+# Fraction of requests recorded in http_request_duration_seconds
+REQUEST_SAMPLE_RATE = float(os.environ.get('REQUEST_SAMPLE_RATE', '0.02'))
+# Fraction of requests whose phases are timed and returned in Server-Timing
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+# Fraction of ordinary requests written to the access log; 5xx responses
+# are always logged, and so are timed (sampled) requests slower than
+# ACCESS_LOG_SLOW_SECONDS
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '0.001'))
+ACCESS_LOG_SLOW_SECONDS = float(os.environ.get('ACCESS_LOG_SLOW_SECONDS', '1.0'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Observations queued before a request thread folds them into the buckets
+HISTOGRAM_BATCH_SIZE = 256
+FINGERPRINT_CACHE_SIZE = 1024
+PROFILE_MAX_STACKS = 5000
+
+_local = threading.local()
+# Threads serving a traced request; while it is empty (almost always) span
+# lookups skip the thread-local
+_traced_threads = set()
+access_log = get_logger('access')
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a label tuple
+
+    observe() only appends to a queue (deque appends are thread-safe); the
+    queue is folded into the buckets every HISTOGRAM_BATCH_SIZE observations
+    and before rendering, so a request pays for the lock and bucket search
+    once per batch instead of once per observation. A histogram fed a
+    sample of events renders its counts and sum multiplied by weight.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS,
+                 weight: float = 1.0):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.weight = weight
+        self.lock = threading.Lock()
+        self.series = {}
+        self.pending = deque()
+
+    def observe(self, labels: tuple, value: float):
+        self.pending.append((labels, value))
+        if len(self.pending) >= HISTOGRAM_BATCH_SIZE:
+            self.fold()
+
+    def fold(self):
+        """Move queued observations into the buckets"""
+        pending = self.pending
+        buckets = self.buckets
+        with self.lock:
+            while True:
+                try:
+                    labels, value = pending.popleft()
+                except IndexError:
+                    return
+                series = self.series.get(labels)
+                if series is None:
+                    series = self.series[labels] = [[0] * len(buckets), 0.0, 0]
+                i = bisect.bisect_left(buckets, value)
+                if i < len(buckets):
+                    series[0][i] += 1
+                series[1] += value
+                series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        self.fold()
+        with self.lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self.series.items()]
+        weight = self.weight
+        for labels, counts, total, count in items:
+            base = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, labels))
+            sep = ',' if base else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {round(cumulative * weight)}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {round(count * weight)}')
+            lines.append(f'{self.name}_sum{{{base}}} {total * weight:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {round(count * weight)}')
+        return lines
+
+
+def _escape(value) -> str:
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route (sampled, scaled to all requests)',
+    ('method', 'route', 'status'), weight=1 / REQUEST_SAMPLE_RATE if REQUEST_SAMPLE_RATE > 0 else 0.0
+)
+PHASE_LATENCY = Histogram(
+    'http_request_phase_seconds', 'Time spent per request phase',
+    ('route', 'phase')
+)
+QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Statement latency by fingerprint',
+    ('fingerprint',)
+)
+
+_collectors = []
+
+
+def register_collector(collector):
+    """Add a function returning extra Prometheus text lines for /metrics"""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    for histogram in (REQUEST_LATENCY, PHASE_LATENCY, QUERY_LATENCY):
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            lines.append(f"# collector error: {_escape(e)}")
+    return '\n'.join(lines) + '\n'
+
+
+# -----------------------------------------------------------------------------
+# Spans
+# -----------------------------------------------------------------------------
+
+class _Span:
+    """Adds the time spent in a with block to the trace's phase"""
+
+    __slots__ = ('trace', 'phase', 'start')
+
+    def __init__(self, trace: dict, phase: str):
+        self.trace = trace
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace[self.phase] = self.trace.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(phase: str):
+    """Time a phase of the current request (no-op if it is not traced)"""
+    if not _traced_threads:
+        return _NO_SPAN
+    trace = getattr(_local, 'trace', None)
+    return _NO_SPAN if trace is None else _Span(trace, phase)
+
+
+_fingerprints = {}
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_VALUES_RE = re.compile(r'\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql) -> str:
+    """Normalize a statement: literals and parameters become ?, VALUES lists collapse"""
+    cached = _fingerprints.get(sql)
+    if cached is not None:
+        return cached
+    text = sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else str(sql)
+    text = _SPACE_RE.sub(' ', text).strip()
+    text = _LITERAL_RE.sub('?', text)
+    text = _VALUES_RE.sub('(...)', text)
+    text = text[:160]
+    if len(_fingerprints) >= FINGERPRINT_CACHE_SIZE:
+        _fingerprints.clear()
+    _fingerprints[sql] = text
+    return text
+
+
+class _TracingCursorMixin:
+    """Times execute() under the statement fingerprint and the query phase"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            QUERY_LATENCY.observe((fingerprint(query),), elapsed)
+            trace = getattr(_local, 'trace', None) if _traced_threads else None
+            if trace is not None:
+                trace['query'] = trace.get('query', 0.0) + elapsed
+
+    def copy_expert(self, sql, file, size=8192):
+        with span('query'):
+            return super().copy_expert(sql, file, size)
+
+
+class TracingCursor(_TracingCursorMixin, _pg_cursor):
+    pass
+
+
+class TracingRealDictCursor(_TracingCursorMixin, RealDictCursor):
+    pass
+
+
+_TRACED_CURSORS = {None: TracingCursor, _pg_cursor: TracingCursor, RealDictCursor: TracingRealDictCursor}
+
+
+class TracingConnection(_pg_connection):
+    """psycopg2 connection whose cursors and commits are timed"""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory')
+        kwargs['cursor_factory'] = _TRACED_CURSORS.get(factory, factory)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        with span('commit'):
+            return super().commit()
+
+
+class TracingJSONProvider(FastJSONProvider):
+    """Times jsonify() as the serialize phase"""
+
+    def response(self, *args, **kwargs):
+        # FastJSONProvider.response inlined: jsonify runs on most requests
+        trace = getattr(_local, 'trace', None) if _traced_threads else None
+        if trace is None:
+            return self._app.response_class(_dumps(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+        with _Span(trace, 'serialize'):
+            return super().response(*args, **kwargs)
+
+
+# -----------------------------------------------------------------------------
+# Sampling profiler
+# -----------------------------------------------------------------------------
+
+class StackProfiler:
+    """Samples request-thread stacks into folded (flamegraph) counts"""
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.lock = threading.Lock()
+        self.stacks = {}
+        self.samples = 0
+        self.thread = None
+        # running is read on every request; stopping wakes the sampler at once
+        self.running = False
+        self.stopping = threading.Event()
+        self.control = threading.Lock()
+        self.labels = {}
+
+    def start(self, interval_ms: float = None):
+        if interval_ms:
+            self.interval = interval_ms / 1000.0
+        with self.control:
+            if self.running:
+                return
+            # A stopped sampler may still be finishing its last sample
+            if self.thread is not None:
+                self.thread.join()
+            self.stopping.clear()
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='stack-profiler', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.control:
+            self.running = False
+            self.stopping.set()
+
+    def reset(self):
+        with self.lock:
+            self.stacks = {}
+            self.samples = 0
+
+    def label(self, code) -> str:
+        """file:function for a code object, formatted once per code object"""
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return label
+
+    def _run(self):
+        # Every sample holds the GIL; keep it short by storing stacks as
+        # tuples of code objects and formatting them only in folded()
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own or thread_id not in _active_threads:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame.f_code)
+                        frame = frame.f_back
+                    key = tuple(stack)
+                    if key in self.stacks or len(self.stacks) < PROFILE_MAX_STACKS:
+                        self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        with self.lock:
+            items = sorted(self.stacks.items(), key=lambda kv: -kv[1])
+        return ''.join(
+            f"{';'.join(self.label(code) for code in reversed(stack))} {count}\n" for stack, count in items
+        )
+
+
+profiler = StackProfiler()
+_active_threads = set()
+
+
+def _reset_after_fork():
+    """Resume sampling in a forked worker if the parent was profiling"""
+    profiler.lock = threading.Lock()
+    profiler.control = threading.Lock()
+    profiler.stopping = threading.Event()
+    profiler.thread = None
+    _active_threads.clear()
+    _traced_threads.clear()
+    if profiler.running:
+        profiler.running = False
+        profiler.reset()
+        profiler.start()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -----------------------------------------------------------------------------
+# Flask integration
+# -----------------------------------------------------------------------------
+
+def finish_sampled(req, route: str, status: int, response, elapsed, trace: dict,
+                   logged: bool, always: bool):
+    """Phases and Server-Timing of a traced request, and its access log line"""
+    if trace is not None:
+        for phase, seconds in trace.items():
+            PHASE_LATENCY.observe((route, phase), seconds)
+        if response is not None:
+            response.headers['Server-Timing'] = ', '.join(
+                [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in trace.items()] +
+                [f"total;dur={elapsed * 1000:.2f}"]
+            )
+    if logged:
+        fields = {'phases': {phase: round(seconds, 6) for phase, seconds in trace.items()}} if trace else {}
+        access_log.info(
+            'request', method=req.method, route=route, status=status,
+            duration=round(elapsed, 6) if elapsed is not None else None, sampled=not always, **fields
+        )
+
+
+def init_app(app: Flask):
+    """Install request tracing, /metrics and the profiler controls"""
+    if not TELEMETRY_ENABLED:
+        return
+
+    app.json = TracingJSONProvider(app)
+    dispatch = app.full_dispatch_request
+    # Bound once: every attribute lookup here is paid by every request
+    perf_counter = time.perf_counter
+    draw = random.random
+    current_request = request._get_current_object
+    local = _local
+    traced_threads = _traced_threads
+    sampler = profiler
+    # Below this draw a request is in at least one sample
+    sampled_below = max(REQUEST_SAMPLE_RATE, TRACE_SAMPLE_RATE, ACCESS_LOG_SAMPLE_RATE)
+
+    def record(sample: float, response, status: int, elapsed, trace):
+        """Histogram, phases and access log line of a sampled or failed
+        request (elapsed is None if it was not timed)"""
+        req = current_request()
+        rule = req.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        if sample < REQUEST_SAMPLE_RATE:
+            REQUEST_LATENCY.observe((req.method, route, status), elapsed)
+        # Shed and fenced requests are counted by admission and fencing
+        # metrics instead of the always-logged 5xx path
+        always = (elapsed is not None and elapsed >= ACCESS_LOG_SLOW_SECONDS) or (
+            status >= 500 and not getattr(response, 'shed', False))
+        logged = always or sample < ACCESS_LOG_SAMPLE_RATE
+        if logged or trace is not None:
+            finish_sampled(req, route, status, response, elapsed, trace, logged, always)
+
+    def sampled_dispatch(sample: float):
+        """traced_dispatch for a request in a sample or while profiling"""
+        start = perf_counter()
+        trace = None
+        if sample < TRACE_SAMPLE_RATE:
+            trace = local.trace = {}
+            traced_threads.add(threading.get_ident())
+        profiled = sampler.running
+        if profiled:
+            _active_threads.add(threading.get_ident())
+        response = None
+        try:
+            response = dispatch()
+            return response
+        finally:
+            if trace is not None:
+                local.trace = None
+                traced_threads.discard(threading.get_ident())
+            if profiled:
+                _active_threads.discard(threading.get_ident())
+            elapsed = perf_counter() - start
+            # An unhandled exception becomes a 500 after this returns
+            status = response.status_code if response is not None else 500
+            record(sample, response, status, elapsed, trace)
+
+    def traced_dispatch():
+        """full_dispatch_request (view plus after_request hooks), measured"""
+        # One draw decides every sample, so traced requests are also in the
+        # histogram and sampled access log lines carry phases
+        sample = draw()
+        if sample < sampled_below or sampler.running:
+            return sampled_dispatch(sample)
+        # Everything else is not timed, only checked for failure
+        try:
+            response = dispatch()
+        except BaseException:
+            record(sample, None, 500, None, None)
+            raise
+        if response.status_code >= 500:
+            record(sample, response, response.status_code, None, None)
+        return response
+
+    # One call per request instead of before/after/teardown hooks
+    app.full_dispatch_request = traced_dispatch
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/debug/profiler', methods=['GET', 'POST', 'DELETE'])
+    def profiler_control():
+        """POST starts sampling, DELETE stops it, GET returns folded stacks"""
+        if not warmup.authorized(request.headers.get('X-Warmup-Token', '')):
+            return jsonify({'error': 'Not found'}), 404
+        if request.method == 'POST':
+            profiler.start(request.args.get('interval_ms', type=float))
+            return jsonify({'profiling': True, 'interval_ms': profiler.interval * 1000}), 200
+        if request.method == 'DELETE':
+            profiler.stop()
+            return jsonify({'profiling': False, 'samples': profiler.samples}), 200
+        body = profiler.folded()
+        if request.args.get('reset') == 'true':
+            profiler.reset()
+        return app.response_class(body, mimetype='text/plain')
+
+    if PROFILER_ENABLED:
+        profiler.start()
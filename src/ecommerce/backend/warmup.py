@@ -0,0 +1,139 @@
+"""
+Post-promotion warm-up
+A promoted replica starts with only what WAL replay touched in its buffer
+cache, and the DR tasks' pools hold connections that the promotion's
+restart broke. The failover orchestrator calls POST /api/internal/warmup
+on the DR ALB before moving DNS, so the first customers do not pay for
+either:
+
+- every process that answers re-validates its pools (db.prefill_pools) and
+  fills the catalog response cache
+- a call with {"prewarm": true} also loads the hot tables and their indexes
+  into shared_buffers with pg_prewarm (migration 0008), up to
+  WARMUP_BUFFER_SHARE of shared_buffers and WARMUP_PREWARM_SECONDS, so it
+  returns well inside the ALB and gunicorn timeouts. An advisory lock keeps
+  concurrent calls from reading the same relations twice.
+
+The endpoint only exists when WARMUP_TOKEN is set, and callers must send it
+in the X-Warmup-Token header. The same token guards telemetry's
+/debug/profiler.
+"""
+import os
+import hmac
+import time
+import socket
+import threading
+
+WARMUP_TOKEN = os.environ.get('WARMUP_TOKEN', '')
+# Tables in the order they are loaded; each table's indexes go first
+WARMUP_RELATIONS = [
+    name.strip() for name in os.environ.get(
+        'WARMUP_RELATIONS',
+        'products,stock_shards,cart_reservations,idempotency_keys,orders,order_items'
+    ).split(',') if name.strip()
+]
+WARMUP_BUFFER_SHARE = float(os.environ.get('WARMUP_BUFFER_SHARE', '0.5'))
+WARMUP_PREWARM_SECONDS = float(os.environ.get('WARMUP_PREWARM_SECONDS', '40'))
+# Repeat calls within this window return the previous result
+WARMUP_MIN_INTERVAL_SECONDS = float(os.environ.get('WARMUP_MIN_INTERVAL_SECONDS', '30'))
+
+PREWARM_LOCK_KEY = 727276
+
+_lock = threading.Lock()
+_last = {'at': 0.0, 'result': None}
+
+
+def authorized(token: str) -> bool:
+    """Whether an X-Warmup-Token value matches WARMUP_TOKEN (never if it is unset)"""
+    return bool(WARMUP_TOKEN) and hmac.compare_digest(token, WARMUP_TOKEN)
+
+
+def hot_relations(conn, tables: list = None) -> list:
+    """[(relation, kind, bytes)] for the tables and their indexes, in load order"""
+    tables = tables or WARMUP_RELATIONS
+    with conn.cursor() as cur:
+        cur.execute('''
+            SELECT c.relname, c.relkind, pg_relation_size(c.oid)
+            FROM unnest(%s::text[]) WITH ORDINALITY AS t(name, ord)
+            JOIN pg_class tc ON tc.oid = to_regclass(t.name)
+            JOIN LATERAL (
+                SELECT i.indexrelid AS oid, 0 AS pos FROM pg_index i WHERE i.indrelid = tc.oid
+                UNION ALL
+                SELECT tc.oid, 1
+            ) r ON true
+            JOIN pg_class c ON c.oid = r.oid
+            ORDER BY t.ord, r.pos, c.relname
+        ''', (tables,))
+        rows = cur.fetchall()
+    conn.rollback()
+    return [(name, 'index' if kind == 'i' else 'table', int(size)) for name, kind, size in rows]
+
+
+def prewarm(conn, relations: list = None) -> dict:
+    """Load relations into shared_buffers within the byte and time budgets"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_try_advisory_lock(%s)', (PREWARM_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return {'skipped': 'another process is prewarming'}
+        try:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm')")
+            if not cur.fetchone()[0]:
+                return {'skipped': 'pg_prewarm is not installed (migration 0008)'}
+            cur.execute("SELECT pg_size_bytes(current_setting('shared_buffers'))")
+            budget = int(int(cur.fetchone()[0]) * WARMUP_BUFFER_SHARE)
+            conn.rollback()
+
+            deadline = time.monotonic() + WARMUP_PREWARM_SECONDS
+            loaded, skipped, total = [], [], 0
+            for name, kind, size in relations if relations is not None else hot_relations(conn):
+                if total + size > budget or time.monotonic() >= deadline:
+                    skipped.append(name)
+                    continue
+                cur.execute('SELECT pg_prewarm(%s::regclass)', (name,))
+                blocks = cur.fetchone()[0]
+                conn.rollback()
+                loaded.append({'relation': name, 'kind': kind, 'blocks': blocks})
+                total += size
+            return {'loaded': loaded, 'skipped': skipped, 'bytes': total, 'budget_bytes': budget}
+        finally:
+            conn.rollback()
+            cur.execute('SELECT pg_advisory_unlock(%s)', (PREWARM_LOCK_KEY,))
+            conn.rollback()
+
+
+def run(get_conn, release_conn, prefill_pools, fill_catalog, with_prewarm: bool = False) -> dict:
+    """Warm this process; every step is reported, none aborts the rest"""
+    with _lock:
+        if not with_prewarm and _last['result'] and time.monotonic() - _last['at'] < WARMUP_MIN_INTERVAL_SECONDS:
+            return dict(_last['result'], repeat=True)
+
+        start = time.monotonic()
+        result = {'host': socket.gethostname(), 'pid': os.getpid()}
+
+        try:
+            result['pools'] = prefill_pools()
+        except Exception as e:
+            result['pools'] = {'error': str(e)}
+
+        conn = get_conn()
+        if conn is None:
+            result['error'] = 'Database connection failed'
+        else:
+            try:
+                if with_prewarm:
+                    try:
+                        result['prewarm'] = prewarm(conn)
+                    except Exception as e:
+                        result['prewarm'] = {'error': str(e)}
+                try:
+                    fill_catalog(conn)
+                    result['catalog'] = 'cached'
+                except Exception as e:
+                    result['catalog'] = {'error': str(e)}
+            finally:
+                release_conn(conn)
+
+        result['seconds'] = round(time.monotonic() - start, 3)
+        _last.update({'at': time.monotonic(), 'result': result})
+        return result
@@ -5,6 +5,8 @@ import axios from 'axios';
 import Link from 'next/link';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || '';
+// Static catalog snapshot (e.g. https://cdn.example.com/catalog/us-east-1); falls back to the API
+const CATALOG_URL = process.env.NEXT_PUBLIC_CATALOG_URL || '';
 
 interface Product {
     id: number;
@@ -26,11 +28,32 @@ export default function Home() {
         fetchProducts();
     }, []);
 
+    const fetchSnapshot = async () => {
+        const manifest = (await axios.get(`${CATALOG_URL}/manifest.json`)).data;
+        const pages = await Promise.all(
+            manifest.pages.map((page: { path: string }) => axios.get(`${CATALOG_URL}/${page.path}`))
+        );
+        // Same listing as /api/products: in stock, ordered by name
+        const all: Product[] = pages.flatMap(page => page.data.products);
+        return {
+            products: all.filter(p => p.stock > 0).sort((a, b) => a.name.localeCompare(b.name)),
+            region: manifest.region
+        };
+    };
+
     const fetchProducts = async () => {
         try {
-            const response = await axios.get(`${API_URL}/api/products`);
-            setProducts(response.data.products);
-            setRegion(response.data.region);
+            let data;
+            try {
+                data = CATALOG_URL ? await fetchSnapshot() : null;
+            } catch (err) {
+                data = null;
+            }
+            if (!data) {
+                data = (await axios.get(`${API_URL}/api/products`)).data;
+            }
+            setProducts(data.products);
+            setRegion(data.region);
             setLoading(false);
         } catch (err) {
             setError('Failed to load products. Please try again later.');
@@ -197,6 +197,20 @@ resource "aws_ecr_replication_configuration" "cross_region" {
   }
 }
 
+# Shared secret for the backend's POST /api/internal/warmup, which the failover
+# orchestrator calls on the DR ALB before moving DNS
+resource "random_password" "warmup_token" {
+  length  = 40
+  special = false
+}
+
+# The orchestrators record the active region in this parameter in the
+# control plane and mirror it into both application regions, where backend
+# tasks read it (through their VPC's SSM endpoint) to fence writes
+locals {
+  active_region_parameter = "/${var.project_name}/active-region"
+}
+
 # -----------------------------------------------------------------------------
 # Compute - Primary Region (us-east-1)
 # -----------------------------------------------------------------------------
@@ -231,8 +245,18 @@ module "compute_primary" {
   # Database
   db_secret_arn      = module.database_primary.secret_arn
   
-  # S3
+  # S3 (order events are shipped to the regional bucket through the S3
+  # gateway endpoint; cross-region replication copies them to the DR bucket
+  # for replay after failover)
   s3_bucket_name     = module.storage.primary_bucket_id
+  outbox_bucket_name = module.storage.primary_bucket_id
+  
+  warmup_token       = random_password.warmup_token.result
+  
+  # Write fencing while the DR region is active
+  active_region_parameter = local.active_region_parameter
+  write_fencing_mode      = var.write_fencing_mode
+  peer_alb_dns            = module.compute_dr.alb_dns_name
 
   depends_on = [module.networking_primary, module.database_primary, module.storage]
 }
@@ -268,11 +292,23 @@ module "compute_dr" {
   min_tasks          = var.dr_min_tasks
   max_tasks          = var.dr_max_tasks
   
-  # Database
+  # Database - the local instance is a replica until promoted. It is the
+  # only instance here, so there is no separate reader: db_reader_secret_arn
+  # stays unset and the read/write routing metrics count what really happens
   db_secret_arn      = module.database_dr.secret_arn
   
   # S3
   s3_bucket_name     = module.storage.dr_bucket_id
+  
+  warmup_token       = random_password.warmup_token.result
+  
+  # Read-only until promotion; optionally queue checkouts for replay
+  queue_checkouts_while_read_only = var.dr_queue_checkouts_while_read_only
+  
+  # Write fencing while the primary region is active
+  active_region_parameter = local.active_region_parameter
+  write_fencing_mode      = var.write_fencing_mode
+  peer_alb_dns            = module.compute_primary.alb_dns_name
 
   depends_on = [module.networking_dr, module.database_dr, module.storage]
 }
@@ -357,6 +393,9 @@ module "control_plane" {
   # DR Configuration
   rto_target_minutes   = var.rto_target_minutes
   rpo_target_seconds   = var.rpo_target_seconds
+  auto_failover_mode   = var.auto_failover_mode
+  warmup_token         = random_password.warmup_token.result
+  lambda_snapstart     = var.control_plane_lambda_snapstart
   
   # Notifications
   notification_email   = var.notification_email
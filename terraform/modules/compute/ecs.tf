@@ -69,6 +69,23 @@ resource "aws_iam_role_policy_attachment" "ecs_execution" {
   policy_arn = "arn:aws:iam::aws:policy/service-role/AmazonECSTaskExecutionRolePolicy"
 }
 
+# Shared secret for POST /api/internal/warmup; ECS injects it into the
+# container at start, so it never appears in the task definition
+resource "aws_secretsmanager_secret" "warmup_token" {
+  name = "${var.project_name}-${var.region_name}-warmup-token"
+
+  recovery_window_in_days = 7
+
+  tags = {
+    Name = "${var.project_name}-${var.region_name}-warmup-token"
+  }
+}
+
+resource "aws_secretsmanager_secret_version" "warmup_token" {
+  secret_id     = aws_secretsmanager_secret.warmup_token.id
+  secret_string = var.warmup_token
+}
+
 # Additional policy for Secrets Manager
 resource "aws_iam_role_policy" "ecs_execution_secrets" {
   name = "${var.project_name}-${var.region_name}-ecs-secrets"
@@ -81,7 +98,7 @@ resource "aws_iam_role_policy" "ecs_execution_secrets" {
       Action = [
         "secretsmanager:GetSecretValue"
       ]
-      Resource = var.db_secret_arn
+      Resource = [var.db_secret_arn, aws_secretsmanager_secret.warmup_token.arn]
     }]
   })
 }
@@ -121,7 +138,7 @@ resource "aws_iam_role_policy" "ecs_task_secrets" {
       Action = [
         "secretsmanager:GetSecretValue"
       ]
-      Resource = var.db_secret_arn
+      Resource = compact([var.db_secret_arn, var.db_reader_secret_arn])
     }]
   })
 }
@@ -149,6 +166,64 @@ resource "aws_iam_role_policy" "ecs_task_s3" {
   })
 }
 
+# Order outbox shipping to the regional bucket (replicated to the DR bucket)
+resource "aws_iam_role_policy" "ecs_task_outbox" {
+  count = var.outbox_bucket_name != "" ? 1 : 0
+  name  = "${var.project_name}-${var.region_name}-ecs-outbox"
+  role  = aws_iam_role.ecs_task.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect = "Allow"
+      Action = [
+        "s3:PutObject",
+        "s3:GetObject",
+        "s3:ListBucket"
+      ]
+      Resource = [
+        "arn:aws:s3:::${var.outbox_bucket_name}",
+        "arn:aws:s3:::${var.outbox_bucket_name}/order-outbox/*"
+      ]
+    }]
+  })
+}
+
+# This region's copy of the active region parameter; the failover and
+# failback orchestrators keep it in step with the control plane's
+resource "aws_ssm_parameter" "active_region" {
+  count = var.active_region_parameter != "" ? 1 : 0
+  name  = var.active_region_parameter
+  type  = "String"
+  value = var.initial_active_region
+
+  tags = {
+    Name = "${var.project_name}-${var.region_name}-active-region"
+  }
+
+  lifecycle {
+    ignore_changes = [value]
+  }
+}
+
+# Active region lookup for write fencing
+resource "aws_iam_role_policy" "ecs_task_active_region" {
+  count = var.active_region_parameter != "" ? 1 : 0
+  name  = "${var.project_name}-${var.region_name}-ecs-active-region"
+  role  = aws_iam_role.ecs_task.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect = "Allow"
+      Action = [
+        "ssm:GetParameter"
+      ]
+      Resource = aws_ssm_parameter.active_region[0].arn
+    }]
+  })
+}
+
 # -----------------------------------------------------------------------------
 # ECS Task Definition - Frontend
 # -----------------------------------------------------------------------------
@@ -231,6 +306,10 @@ resource "aws_ecs_task_definition" "backend" {
       protocol      = "tcp"
     }]
 
+    # Past gunicorn's 30s graceful_timeout, so in-flight requests finish
+    # before SIGKILL
+    stopTimeout = 40
+
     environment = [
       {
         name  = "AWS_REGION"
@@ -247,6 +326,45 @@ resource "aws_ecs_task_definition" "backend" {
       {
         name  = "DB_SECRET"
         value = var.db_secret_arn
+      },
+      {
+        name  = "DB_READER_SECRET"
+        value = var.db_reader_secret_arn
+      },
+      {
+        name  = "MIGRATE_ON_START"
+        value = tostring(var.migrate_on_start)
+      },
+      {
+        name  = "MAX_REPLICA_LAG_SECONDS"
+        value = tostring(var.max_replica_lag_seconds)
+      },
+      {
+        name  = "OUTBOX_SINK"
+        value = var.outbox_bucket_name != "" ? "s3://${var.outbox_bucket_name}/order-outbox/" : ""
+      },
+      {
+        name  = "DEGRADED_ORDER_QUEUE"
+        value = var.queue_checkouts_while_read_only ? "/tmp/queued-checkouts.jsonl" : ""
+      },
+      {
+        name  = "ACTIVE_REGION_PARAM"
+        value = var.active_region_parameter
+      },
+      {
+        name  = "FENCING_MODE"
+        value = var.write_fencing_mode
+      },
+      {
+        name  = "FENCING_PEER_URL"
+        value = var.peer_alb_dns != "" ? "http://${var.peer_alb_dns}" : ""
+      }
+    ]
+
+    secrets = [
+      {
+        name      = "WARMUP_TOKEN"
+        valueFrom = aws_secretsmanager_secret_version.warmup_token.arn
       }
     ]
 
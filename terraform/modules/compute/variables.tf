@@ -86,7 +86,67 @@ variable "db_secret_arn" {
   type        = string
 }
 
+variable "db_reader_secret_arn" {
+  description = "ARN of credentials secret for the local read replica (empty = reads use the writer)"
+  type        = string
+  default     = ""
+}
+
+variable "max_replica_lag_seconds" {
+  description = "Replica staleness above which catalog reads fall back to the writer"
+  type        = number
+  default     = 30
+}
+
 variable "s3_bucket_name" {
   description = "S3 bucket name for application"
   type        = string
 }
+
+variable "outbox_bucket_name" {
+  description = "Bucket in this region that order outbox events are shipped to; S3 replication copies them to the DR bucket (empty = disabled)"
+  type        = string
+  default     = ""
+}
+
+variable "warmup_token" {
+  description = "Shared secret for POST /api/internal/warmup, stored in this region's Secrets Manager and injected as WARMUP_TOKEN"
+  type        = string
+  sensitive   = true
+}
+
+variable "queue_checkouts_while_read_only" {
+  description = "Queue keyed checkouts on the task's disk while the writer is read-only"
+  type        = bool
+  default     = false
+}
+
+variable "active_region_parameter" {
+  description = "SSM parameter holding the active region (empty = write fencing disabled)"
+  type        = string
+  default     = ""
+}
+
+variable "initial_active_region" {
+  description = "Value of the active region parameter when it is first created"
+  type        = string
+  default     = "us-east-1"
+}
+
+variable "migrate_on_start" {
+  description = "Apply pending schema migrations when a backend task starts and its database is a writer"
+  type        = bool
+  default     = true
+}
+
+variable "write_fencing_mode" {
+  description = "What tasks do with writes while this region is passive: reject, forward or off"
+  type        = string
+  default     = "reject"
+}
+
+variable "peer_alb_dns" {
+  description = "The other region's ALB, where fenced writes are forwarded (needs internet egress)"
+  type        = string
+  default     = ""
+}
@@ -0,0 +1,55 @@
+"""
+Lazily built, cached AWS clients for the control-plane lambdas
+boto3 is imported and each service model loaded on first use instead of at
+module import, so an invocation only pays for the services it calls, and a
+client is built once per execution environment instead of once per step.
+
+Under SnapStart (AWS_LAMBDA_INITIALIZATION_TYPE=snap-start) prime() builds
+a handler's clients during init, so they are restored from the snapshot
+rather than built on the invocation that needs them.
+"""
+import os
+import threading
+
+SNAPSHOT_INIT = os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'snap-start'
+
+# boto3's default session is not safe to build clients from concurrently
+_lock = threading.Lock()
+_clients = {}
+_tables = {}
+
+
+def client(service: str, region: str = None):
+    """Cached boto3 client (the function's own region unless given)"""
+    key = (service, region)
+    cached = _clients.get(key)
+    if cached is None:
+        with _lock:
+            cached = _clients.get(key)
+            if cached is None:
+                import boto3
+                cached = _clients[key] = boto3.client(service, region_name=region)
+    return cached
+
+
+def table(name: str):
+    """Cached DynamoDB Table resource"""
+    cached = _tables.get(name)
+    if cached is None:
+        with _lock:
+            cached = _tables.get(name)
+            if cached is None:
+                import boto3
+                cached = _tables[name] = boto3.resource('dynamodb').Table(name)
+    return cached
+
+
+def prime(clients: list, tables: list = ()):
+    """Build (service, region) clients and tables now, during a SnapStart init"""
+    if not SNAPSHOT_INIT:
+        return
+    for service, region in clients:
+        client(service, region)
+    for name in tables:
+        if name:
+            table(name)
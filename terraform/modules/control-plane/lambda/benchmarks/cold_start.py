@@ -0,0 +1,177 @@
+"""
+Lambda Cold Start Benchmark
+Reports init cost and memory for each control-plane handler, so every
+release can be compared with the last.
+
+Local (default): imports each handler in fresh interpreters, as the
+Lambda init phase does, and times it, then times building the clients a
+first invocation needs (deferred out of init by aws_clients) and records
+peak RSS. --snapstart sets AWS_LAMBDA_INITIALIZATION_TYPE=snap-start, so
+the clients are built during init, as they would be for the snapshot.
+No AWS access needed (the clients are built, never called):
+    python benchmarks/cold_start.py --runs 10 --release v1.4.0 --output cold-starts.jsonl
+
+Deployed (--deployed): CloudWatch Logs Insights over the functions' REPORT
+lines, giving real cold starts (Init Duration) and Max Memory Used:
+    python benchmarks/cold_start.py --deployed --project dr-platform --days 7
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Packaged next to every handler (see control-plane main.tf)
+BACKEND_DIR = os.path.join(LAMBDA_DIR, '..', '..', '..', '..', 'src', 'ecommerce', 'backend')
+
+HANDLERS = {
+    'health_checker': 'health-checker',
+    'failover_orchestrator': 'failover-orchestrator',
+    'failback_orchestrator': 'failback-orchestrator',
+}
+
+# Runs in a fresh interpreter per sample; prints one JSON line
+CHILD = '''
+import sys, json, time, resource, importlib
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+init = time.perf_counter() - start
+modules = len(sys.modules)
+start = time.perf_counter()
+import aws_clients
+for service, region in module.CLIENTS:
+    aws_clients.client(service, region)
+aws_clients.table(module.DR_STATE_TABLE)
+first_use = time.perf_counter() - start
+print(json.dumps({
+    'init_seconds': init,
+    'first_use_seconds': first_use,
+    'modules_at_init': modules,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+'''
+
+
+def child_env(snapstart: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join([LAMBDA_DIR, os.path.abspath(BACKEND_DIR)]),
+        'AWS_LAMBDA_FUNCTION_NAME': 'cold-start-benchmark',
+        'AWS_REGION': 'us-east-2',
+        'AWS_DEFAULT_REGION': 'us-east-2',
+        'DR_STATE_TABLE': 'cold-start-benchmark',
+        # Static keys stop the credential chain before it probes instance metadata
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_EC2_METADATA_DISABLED': 'true',
+    })
+    if snapstart:
+        env['AWS_LAMBDA_INITIALIZATION_TYPE'] = 'snap-start'
+    else:
+        env.pop('AWS_LAMBDA_INITIALIZATION_TYPE', None)
+    return env
+
+
+def measure_local(handler: str, runs: int, snapstart: bool) -> dict:
+    """Median and max over runs fresh imports of one handler"""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', CHILD, handler],
+            env=child_env(snapstart), capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+
+    def ms(key, fn):
+        return round(fn(s[key] for s in samples) * 1000, 1)
+
+    return {
+        'handler': handler,
+        'runs': runs,
+        'snapstart': snapstart,
+        'init_ms_p50': ms('init_seconds', statistics.median),
+        'init_ms_max': ms('init_seconds', max),
+        'first_use_ms_p50': ms('first_use_seconds', statistics.median),
+        'modules_at_init': samples[0]['modules_at_init'],
+        'max_rss_mb': round(max(s['max_rss_mb'] for s in samples), 1)
+    }
+
+
+INSIGHTS_QUERY = '''
+filter @type = "REPORT"
+| stats count(*) as invocations,
+        count(@initDuration) as cold_starts,
+        pct(@initDuration, 50) as init_ms_p50,
+        pct(@initDuration, 99) as init_ms_p99,
+        max(@initDuration) as init_ms_max,
+        max(@maxMemoryUsed / 1000 / 1000) as max_memory_mb,
+        max(@memorySize / 1000 / 1000) as memory_size_mb
+'''
+
+
+def measure_deployed(handler: str, project: str, region: str, days: float) -> dict:
+    """Cold start statistics from the function's REPORT log lines"""
+    import boto3
+
+    logs = boto3.client('logs', region_name=region)
+    end = int(time.time())
+    query_id = logs.start_query(
+        logGroupName=f"/aws/lambda/{project}-{HANDLERS[handler]}",
+        startTime=end - int(days * 86400),
+        endTime=end,
+        queryString=INSIGHTS_QUERY
+    )['queryId']
+    while True:
+        response = logs.get_query_results(queryId=query_id)
+        if response['status'] not in ('Scheduled', 'Running'):
+            break
+        time.sleep(1)
+    result = {'handler': handler, 'days': days}
+    for row in response.get('results', [])[:1]:
+        for field in row:
+            value = field['value']
+            result[field['field']] = round(float(value), 1) if '.' in value else int(value)
+    return result
+
+
+def git_release() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--tags', '--always', '--dirty'],
+            cwd=LAMBDA_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure control-plane Lambda cold starts')
+    parser.add_argument('--handlers', default=','.join(HANDLERS))
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--snapstart', action='store_true', help='Simulate a SnapStart init (clients primed)')
+    parser.add_argument('--deployed', action='store_true', help='Query CloudWatch Logs instead of importing locally')
+    parser.add_argument('--project', default='dr-platform')
+    parser.add_argument('--region', default='us-east-2', help='Control-plane region')
+    parser.add_argument('--days', type=float, default=7)
+    parser.add_argument('--release', default=None, help='Label stored with the results (default: git describe)')
+    parser.add_argument('--output', help='Append results as JSON lines to this file')
+    args = parser.parse_args()
+
+    release = args.release or git_release()
+    results = []
+    for handler in args.handlers.split(','):
+        if args.deployed:
+            result = measure_deployed(handler, args.project, args.region, args.days)
+        else:
+            result = measure_local(handler, args.runs, args.snapstart)
+        result.update({'release': release, 'mode': 'deployed' if args.deployed else 'local'})
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
@@ -4,9 +4,14 @@ Executes the failback sequence from DR back to primary region
 """
 import os
 import json
-import boto3
+import time
 from datetime import datetime, timezone
 
+import aws_clients
+import rollups
+from lease import LeaseLost, single_flight
+from structured_logging import get_logger, set_context, flush_after
+
 # Environment variables
 PRIMARY_REGION = os.environ.get('PRIMARY_REGION', 'us-east-1')
 DR_REGION = os.environ.get('DR_REGION', 'us-west-2')
@@ -26,26 +31,54 @@ SSM_ACTIVE_REGION_PARAM = os.environ.get('SSM_ACTIVE_REGION_PARAM', '')
 DR_STATE_TABLE = os.environ.get('DR_STATE_TABLE', '')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN', '')
 
-# Initialize clients
-sns = boto3.client('sns')
-dynamodb = boto3.resource('dynamodb')
+# Step statuses that close a step opened with STARTED
+STEP_END_STATUSES = ('COMPLETED', 'FAILED', 'SKIPPED')
+
+# Built on first use (or during a SnapStart init); see aws_clients
+CLIENTS = [
+    ('sns', None), ('route53', None), ('rds', PRIMARY_REGION), ('ecs', PRIMARY_REGION),
+    ('ecs', DR_REGION), ('ssm', None), ('ssm', PRIMARY_REGION), ('ssm', DR_REGION)
+]
+aws_clients.prime(CLIENTS, [DR_STATE_TABLE, rollups.DR_ROLLUP_TABLE])
+log = get_logger('failback_orchestrator', target_region=PRIMARY_REGION)
+_step_started = {}
+# Lease held by the current run; state writes are fenced by its token
+_lease = None
 
 
 def log_step(step_name: str, status: str, details: str = ""):
-    """Log failback step to DynamoDB and console"""
+    """Log failback step to DynamoDB and the structured log
+
+    A step that closes one opened with STARTED carries its duration as a
+    StepDuration metric (Embedded Metric Format) on the same log line.
+    """
     timestamp = datetime.now(timezone.utc).isoformat()
-    print(f"[{timestamp}] {step_name}: {status} - {details}")
+    level = 'ERROR' if status == 'FAILED' else 'INFO'
+    if status == 'STARTED':
+        _step_started[step_name] = time.monotonic()
+    if status in STEP_END_STATUSES and step_name in _step_started:
+        log.metric(
+            'StepDuration', time.monotonic() - _step_started.pop(step_name), 'Seconds',
+            {'Orchestrator': 'failback', 'Step': step_name},
+            msg='step', level=level, step=step_name, status=status, details=details
+        )
+    elif level == 'ERROR':
+        log.error('step', step=step_name, status=status, details=details)
+    else:
+        log.info('step', step=step_name, status=status, details=details)
     
     try:
-        table = dynamodb.Table(DR_STATE_TABLE)
-        table.put_item(Item={
+        _lease.put_item({
             'state_key': f'failback_step_{step_name}',
             'timestamp': timestamp,
             'status': status,
             'details': details
         })
+    except LeaseLost:
+        # Superseded by a newer run: stop before this step touches anything
+        raise
     except Exception as e:
-        print(f"Error logging step: {e}")
+        log.error('Error logging step', step=step_name, error=str(e))
 
 
 def verify_primary_health() -> dict:
@@ -54,7 +87,7 @@ def verify_primary_health() -> dict:
     
     try:
         # Check primary RDS
-        rds = boto3.client('rds', region_name=PRIMARY_REGION)
+        rds = aws_clients.client('rds', PRIMARY_REGION)
         response = rds.describe_db_instances(DBInstanceIdentifier=PRIMARY_DB_IDENTIFIER)
         
         if not response['DBInstances']:
@@ -67,7 +100,7 @@ def verify_primary_health() -> dict:
             return {'success': False, 'error': f'Primary DB not available: {db_status}'}
         
         # Check primary ECS
-        ecs = boto3.client('ecs', region_name=PRIMARY_REGION)
+        ecs = aws_clients.client('ecs', PRIMARY_REGION)
         services = ecs.describe_services(
             cluster=PRIMARY_ECS_CLUSTER,
             services=[PRIMARY_BACKEND_SERVICE, PRIMARY_FRONTEND_SERVICE]
@@ -91,7 +124,7 @@ def update_dns_to_primary() -> dict:
     log_step("update_dns", "STARTED", f"Switching DNS to {PRIMARY_ALB_DNS}")
     
     try:
-        route53 = boto3.client('route53')
+        route53 = aws_clients.client('route53')
         
         # Update the A record to point to primary ALB
         route53.change_resource_record_sets(
@@ -126,7 +159,7 @@ def scale_dr_services(desired_count: int = 1) -> dict:
     log_step("scale_dr_down", "STARTED", f"Scaling DR to {desired_count} tasks")
     
     try:
-        ecs = boto3.client('ecs', region_name=DR_REGION)
+        ecs = aws_clients.client('ecs', DR_REGION)
         
         # Scale backend
         ecs.update_service(
@@ -151,24 +184,41 @@ def scale_dr_services(desired_count: int = 1) -> dict:
 
 
 def update_active_region(region: str) -> dict:
-    """Update SSM parameter for active region"""
+    """Update SSM parameter for active region
+
+    The control-plane copy (this function's region) is the record; the
+    copies in both application regions are what backend tasks read to fence
+    writes in the passive region. A region whose SSM cannot be reached
+    (the failed one) is reported but does not fail the step.
+    """
     log_step("update_ssm", "STARTED", f"Setting active region to {region}")
     
     try:
-        ssm = boto3.client('ssm', region_name=PRIMARY_REGION)
-        ssm.put_parameter(
+        aws_clients.client('ssm').put_parameter(
             Name=SSM_ACTIVE_REGION_PARAM,
             Value=region,
             Type='String',
             Overwrite=True
         )
-        
-        log_step("update_ssm", "COMPLETED", f"Active region set to {region}")
-        return {'success': True, 'message': f'Active region: {region}'}
-        
     except Exception as e:
         log_step("update_ssm", "FAILED", str(e))
         return {'success': False, 'error': str(e)}
+    
+    mirrors = {}
+    for mirror_region in (PRIMARY_REGION, DR_REGION):
+        try:
+            aws_clients.client('ssm', mirror_region).put_parameter(
+                Name=SSM_ACTIVE_REGION_PARAM,
+                Value=region,
+                Type='String',
+                Overwrite=True
+            )
+            mirrors[mirror_region] = 'updated'
+        except Exception as e:
+            mirrors[mirror_region] = f'failed: {e}'
+    
+    log_step("update_ssm", "COMPLETED", f"Active region set to {region} (mirrors: {mirrors})")
+    return {'success': True, 'message': f'Active region: {region}', 'mirrors': mirrors}
 
 
 def recreate_replication() -> dict:
@@ -190,35 +240,55 @@ def recreate_replication() -> dict:
 def update_failback_state(status: str, details: dict):
     """Update overall failback state in DynamoDB"""
     try:
-        table = dynamodb.Table(DR_STATE_TABLE)
-        table.put_item(Item={
+        _lease.put_item({
             'state_key': 'failback_state',
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'status': status,
             'active_region': PRIMARY_REGION if status == 'COMPLETED' else DR_REGION,
             'details': json.dumps(details, default=str)
         })
+        # Fenced by the write above: a superseded run is not counted
+        if status != 'IN_PROGRESS':
+            rollups.record_orchestration('failback', status, details.get('duration_seconds'))
     except Exception as e:
-        print(f"Error updating failback state: {e}")
+        log.error('Error updating failback state', status=status, error=str(e))
 
 
 def send_notification(subject: str, message: str):
     """Send SNS notification"""
     try:
         if SNS_TOPIC_ARN:
-            sns.publish(
+            aws_clients.client('sns').publish(
                 TopicArn=SNS_TOPIC_ARN,
                 Subject=subject[:100],
                 Message=message
             )
     except Exception as e:
-        print(f"Error sending notification: {e}")
+        log.error('Error sending notification', subject=subject, error=str(e))
 
 
+@flush_after
 def lambda_handler(event, context):
-    """Main Lambda handler for failback orchestration"""
+    """Main Lambda handler for failback orchestration
+
+    Runs are single-flight: an invocation that finds a failback already in
+    flight (a retry, a second click) waits for it and returns its result.
+    """
+    run_id = getattr(context, 'aws_request_id', None)
+    set_context(run_id=run_id)
+    return single_flight(
+        aws_clients.table(DR_STATE_TABLE), 'failback', run_id or 'manual',
+        lambda lease: run_failback(event, lease), context
+    )
+
+
+def run_failback(event, lease):
+    """Execute the failback steps while holding lease"""
+    global _lease
+    _lease = lease
     start_time = datetime.now(timezone.utc)
-    print(f"Failback started at {start_time.isoformat()}")
+    _step_started.clear()
+    log.info('failback started', reason=event.get('reason', 'Manual trigger'))
     
     # Initialize results
     results = {
@@ -265,6 +335,7 @@ def lambda_handler(event, context):
         results['status'] = 'COMPLETED'
         
         update_failback_state('COMPLETED', results)
+        log.metric('FailbackDuration', duration, 'Seconds', {'Outcome': 'COMPLETED'}, msg='failback completed')
         
         # Send success notification
         send_notification(
@@ -283,11 +354,26 @@ def lambda_handler(event, context):
             'body': json.dumps(results, default=str)
         }
         
+    except LeaseLost as e:
+        # A newer run owns the failback now and reports its outcome; writing
+        # FAILED state or paging on-call from here would contradict it
+        results['status'] = 'SUPERSEDED'
+        results['error'] = str(e)
+        log.warning('failback superseded by a newer run', error=str(e), steps=list(results['steps']))
+        return {
+            'statusCode': 409,
+            'body': json.dumps(results, default=str)
+        }
+        
     except Exception as e:
         results['status'] = 'FAILED'
         results['error'] = str(e)
         
         update_failback_state('FAILED', results)
+        log.metric(
+            'FailbackDuration', (datetime.now(timezone.utc) - start_time).total_seconds(), 'Seconds',
+            {'Outcome': 'FAILED'}, msg='failback failed', level='ERROR', error=str(e)
+        )
         
         send_notification(
             "❌ DR Failback Failed",
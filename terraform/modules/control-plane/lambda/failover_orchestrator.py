@@ -4,10 +4,17 @@ Executes the failover sequence from primary to DR region
 """
 import os
 import json
-import boto3
 import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+import aws_clients
+import rollups
+from lease import LeaseLost, single_flight
+from synthetic_prober import probe_regions, emit_metrics, without_samples, passing
+from structured_logging import get_logger, set_context, flush_after
+
 # Environment variables
 PRIMARY_REGION = os.environ.get('PRIMARY_REGION', 'us-east-1')
 DR_REGION = os.environ.get('DR_REGION', 'us-west-2')
@@ -23,27 +30,75 @@ DR_ALB_ZONE_ID = os.environ.get('DR_ALB_ZONE_ID', '')
 SSM_ACTIVE_REGION_PARAM = os.environ.get('SSM_ACTIVE_REGION_PARAM', '')
 DR_STATE_TABLE = os.environ.get('DR_STATE_TABLE', '')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN', '')
+# Secret holding the token shared with the backend's POST /api/internal/warmup;
+# warm-up is skipped without it
+WARMUP_TOKEN_SECRET_ARN = os.environ.get('WARMUP_TOKEN_SECRET_ARN', '')
+# Calls spread over the DR ALB so every task and worker process gets one
+WARMUP_CALLS = int(os.environ.get('WARMUP_CALLS', '32'))
+WARMUP_CONCURRENCY = int(os.environ.get('WARMUP_CONCURRENCY', '8'))
+WARMUP_STEADY_TIMEOUT_SECONDS = float(os.environ.get('WARMUP_STEADY_TIMEOUT_SECONDS', '120'))
+# Journey p50 may move this much between two rounds and still count as steady
+WARMUP_STEADY_TOLERANCE = float(os.environ.get('WARMUP_STEADY_TOLERANCE', '0.2'))
+# Backend tasks re-read the active region every FENCING_REFRESH_SECONDS (5s);
+# checkouts sent sooner after the DR copy changes may still be fenced
+FENCING_PROPAGATION_SECONDS = float(os.environ.get('FENCING_PROPAGATION_SECONDS', '10'))
+# Warm-up ends this long before the RTO runs out, however warm DR is, to
+# leave time for DNS, the active-region update and validation
+RTO_TARGET_SECONDS = float(os.environ.get('RTO_TARGET_SECONDS', '300'))
+CUTOVER_RESERVE_SECONDS = float(os.environ.get('CUTOVER_RESERVE_SECONDS', '60'))
+
+# Step statuses that close a step opened with STARTED
+STEP_END_STATUSES = ('COMPLETED', 'FAILED', 'SKIPPED')
 
-# Initialize clients
-sns = boto3.client('sns')
-dynamodb = boto3.resource('dynamodb')
+# Built on first use (or during a SnapStart init); see aws_clients
+CLIENTS = [
+    ('sns', None), ('route53', None), ('rds', DR_REGION), ('ecs', DR_REGION), ('ssm', None),
+    ('ssm', PRIMARY_REGION), ('ssm', DR_REGION), ('secretsmanager', None)
+]
+aws_clients.prime(CLIENTS, [DR_STATE_TABLE, rollups.DR_ROLLUP_TABLE])
+log = get_logger('failover_orchestrator', target_region=DR_REGION)
+_step_started = {}
+# Lease held by the current run; state writes are fenced by its token
+_lease = None
+# When the DR region's copy of the active region first named DR in this run
+_dr_fence_opened_at = None
+# Read from WARMUP_TOKEN_SECRET_ARN on first use
+_warmup_token = None
 
 
 def log_step(step_name: str, status: str, details: str = ""):
-    """Log failover step to DynamoDB and console"""
+    """Log failover step to DynamoDB and the structured log
+
+    A step that closes one opened with STARTED carries its duration as a
+    StepDuration metric (Embedded Metric Format) on the same log line.
+    """
     timestamp = datetime.now(timezone.utc).isoformat()
-    print(f"[{timestamp}] {step_name}: {status} - {details}")
+    level = 'ERROR' if status == 'FAILED' else 'INFO'
+    if status == 'STARTED':
+        _step_started[step_name] = time.monotonic()
+    if status in STEP_END_STATUSES and step_name in _step_started:
+        log.metric(
+            'StepDuration', time.monotonic() - _step_started.pop(step_name), 'Seconds',
+            {'Orchestrator': 'failover', 'Step': step_name},
+            msg='step', level=level, step=step_name, status=status, details=details
+        )
+    elif level == 'ERROR':
+        log.error('step', step=step_name, status=status, details=details)
+    else:
+        log.info('step', step=step_name, status=status, details=details)
     
     try:
-        table = dynamodb.Table(DR_STATE_TABLE)
-        table.put_item(Item={
+        _lease.put_item({
             'state_key': f'failover_step_{step_name}',
             'timestamp': timestamp,
             'status': status,
             'details': details
         })
+    except LeaseLost:
+        # Superseded by a newer run: stop before this step touches anything
+        raise
     except Exception as e:
-        print(f"Error logging step: {e}")
+        log.error('Error logging step', step=step_name, error=str(e))
 
 
 def promote_dr_database() -> dict:
@@ -51,7 +106,7 @@ def promote_dr_database() -> dict:
     log_step("promote_database", "STARTED", f"Promoting {DR_DB_IDENTIFIER}")
     
     try:
-        rds = boto3.client('rds', region_name=DR_REGION)
+        rds = aws_clients.client('rds', DR_REGION)
         
         # Check current status
         response = rds.describe_db_instances(DBInstanceIdentifier=DR_DB_IDENTIFIER)
@@ -88,7 +143,7 @@ def scale_dr_services(desired_count: int = 2) -> dict:
     log_step("scale_services", "STARTED", f"Scaling to {desired_count} tasks")
     
     try:
-        ecs = boto3.client('ecs', region_name=DR_REGION)
+        ecs = aws_clients.client('ecs', DR_REGION)
         
         # Scale backend
         ecs.update_service(
@@ -121,12 +176,161 @@ def scale_dr_services(desired_count: int = 2) -> dict:
         return {'success': False, 'error': str(e)}
 
 
+def warmup_token() -> str:
+    """The backend's warm-up token, read once per execution environment"""
+    global _warmup_token
+    if _warmup_token is None:
+        _warmup_token = aws_clients.client('secretsmanager').get_secret_value(
+            SecretId=WARMUP_TOKEN_SECRET_ARN
+        )['SecretString']
+    return _warmup_token
+
+
+def _warmup_call(prewarm: bool, token: str, deadline: float) -> dict:
+    """POST /api/internal/warmup on the DR ALB; the answering process's report"""
+    # The prewarm call is bounded by WARMUP_PREWARM_SECONDS in the backend
+    timeout = min(55 if prewarm else 10, deadline - time.monotonic())
+    if timeout <= 0:
+        raise TimeoutError('Warm-up time budget spent')
+    req = urllib.request.Request(
+        f"http://{DR_ALB_DNS}/api/internal/warmup",
+        data=json.dumps({'prewarm': prewarm}).encode('utf-8'),
+        method='POST'
+    )
+    req.add_header('Content-Type', 'application/json')
+    req.add_header('X-Warmup-Token', token)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _journey_p50(summary: dict) -> float:
+    """Median journey time: the sum of the step medians"""
+    return sum(step.get('p50', 0) for step in summary['steps'].values())
+
+
+def open_dr_writes() -> dict:
+    """Point the DR region's copy of the active-region parameter at DR
+
+    Runs right after promotion, so the warm-up and validation checkouts sent
+    to the DR ALB are not fenced while DNS still points at the primary. The
+    control-plane record and the primary's copy move in update_active_region.
+    A failure is reported but does not stop the failover; update_active_region
+    writes the copy again.
+    """
+    global _dr_fence_opened_at
+    log_step("open_dr_writes", "STARTED", f"Setting active region to {DR_REGION} in {DR_REGION}")
+    
+    try:
+        aws_clients.client('ssm', DR_REGION).put_parameter(
+            Name=SSM_ACTIVE_REGION_PARAM,
+            Value=DR_REGION,
+            Type='String',
+            Overwrite=True
+        )
+    except Exception as e:
+        log_step("open_dr_writes", "FAILED", str(e))
+        return {'success': False, 'error': str(e)}
+    _dr_fence_opened_at = time.monotonic()
+    log_step("open_dr_writes", "COMPLETED", f"DR tasks take writes within {FENCING_PROPAGATION_SECONDS:.0f}s")
+    return {'success': True}
+
+
+def await_dr_fence():
+    """Sleep until DR tasks have had FENCING_PROPAGATION_SECONDS to see DR as active"""
+    if _dr_fence_opened_at is None:
+        return
+    remaining = _dr_fence_opened_at + FENCING_PROPAGATION_SECONDS - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+def warm_up_dr(budget_deadline: float) -> dict:
+    """Warm the promoted database and the DR tasks before DNS moves
+
+    One call prewarms the database, then WARMUP_CALLS spread over the ALB
+    refill each process's pools and catalog cache. Journey rounds then run
+    until the journey p50 holds steady; the time from the start of the step
+    is reported as TimeToSteadyState. Warm-up never fails the failover: a
+    cold region is still better than none, so every call and round stops at
+    budget_deadline (time.monotonic()) and the cutover goes ahead.
+    """
+    log_step("warm_up", "STARTED", f"Warming {DR_ALB_DNS}")
+    if not (DR_ALB_DNS and WARMUP_TOKEN_SECRET_ARN):
+        log_step("warm_up", "SKIPPED", "No DR ALB or warm-up token configured")
+        return {'success': True, 'message': 'Skipped'}
+    start = time.monotonic()
+    if budget_deadline <= start:
+        log_step("warm_up", "SKIPPED", "No time left in the RTO budget")
+        return {'success': False, 'message': 'Skipped: RTO budget spent'}
+    
+    try:
+        token = warmup_token()
+        result = {'budget_seconds': round(budget_deadline - start, 1)}
+        try:
+            result['prewarm'] = _warmup_call(True, token, budget_deadline).get('prewarm')
+        except Exception as e:
+            result['prewarm'] = {'error': str(e)}
+        
+        processes, errors = set(), []
+        with ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY) as pool:
+            futures = [pool.submit(_warmup_call, False, token, budget_deadline) for _ in range(WARMUP_CALLS)]
+            for future in futures:
+                try:
+                    report = future.result()
+                    processes.add((report['host'], report['pid']))
+                except Exception as e:
+                    errors.append(str(e))
+        result.update({'processes': len(processes), 'call_errors': len(errors)})
+        
+        # The journeys check out, which DR tasks fence until they see DR active
+        await_dr_fence()
+        rounds, previous, steady_at = [], None, None
+        deadline = min(start + WARMUP_STEADY_TIMEOUT_SECONDS, budget_deadline)
+        while time.monotonic() < deadline:
+            _lease.check()
+            summary = without_samples(probe_regions({DR_REGION: (DR_ALB_DNS, True)}))[DR_REGION]
+            p50 = _journey_p50(summary)
+            rounds.append(round(p50, 4))
+            if (passing(summary) and previous
+                    and abs(p50 - previous) <= WARMUP_STEADY_TOLERANCE * previous):
+                steady_at = time.monotonic() - start
+                break
+            previous = p50 if passing(summary) else None
+        result['journey_p50_by_round'] = rounds
+        result['time_to_steady_state_seconds'] = round(steady_at, 1) if steady_at is not None else None
+        
+        if steady_at is not None:
+            log.metric(
+                'TimeToSteadyState', steady_at, 'Seconds', {'Orchestrator': 'failover'},
+                msg='dr warm', rounds=len(rounds), processes=len(processes)
+            )
+            log_step(
+                "warm_up", "COMPLETED",
+                f"{len(processes)} processes warmed; steady after {steady_at:.1f}s, "
+                f"journey p50 {rounds[0]}s -> {rounds[-1]}s"
+            )
+        else:
+            log_step(
+                "warm_up", "FAILED",
+                f"{len(processes)} processes warmed; no steady state within "
+                f"{time.monotonic() - start:.0f}s, proceeding to cutover (journey p50 by round: {rounds})"
+            )
+        result['success'] = steady_at is not None
+        return result
+        
+    except LeaseLost:
+        raise
+    except Exception as e:
+        log_step("warm_up", "FAILED", str(e))
+        return {'success': False, 'error': str(e)}
+
+
 def update_dns_to_dr() -> dict:
     """Update Route 53 DNS to point to DR region"""
     log_step("update_dns", "STARTED", f"Switching DNS to {DR_ALB_DNS}")
     
     try:
-        route53 = boto3.client('route53')
+        route53 = aws_clients.client('route53')
         
         # Update the A record to point to DR ALB
         route53.change_resource_record_sets(
@@ -157,58 +361,137 @@ def update_dns_to_dr() -> dict:
 
 
 def update_active_region(region: str) -> dict:
-    """Update SSM parameter for active region"""
+    """Update SSM parameter for active region
+
+    The control-plane copy (this function's region) is the record; the
+    copies in both application regions are what backend tasks read to fence
+    writes in the passive region. A region whose SSM cannot be reached
+    (the failed one) is reported but does not fail the step.
+    """
+    global _dr_fence_opened_at
     log_step("update_ssm", "STARTED", f"Setting active region to {region}")
     
     try:
-        ssm = boto3.client('ssm', region_name=PRIMARY_REGION)
-        ssm.put_parameter(
+        aws_clients.client('ssm').put_parameter(
             Name=SSM_ACTIVE_REGION_PARAM,
             Value=region,
             Type='String',
             Overwrite=True
         )
+    except Exception as e:
+        log_step("update_ssm", "FAILED", str(e))
+        return {'success': False, 'error': str(e)}
+    
+    mirrors = {}
+    for mirror_region in (PRIMARY_REGION, DR_REGION):
+        try:
+            aws_clients.client('ssm', mirror_region).put_parameter(
+                Name=SSM_ACTIVE_REGION_PARAM,
+                Value=region,
+                Type='String',
+                Overwrite=True
+            )
+            mirrors[mirror_region] = 'updated'
+            if mirror_region == region and _dr_fence_opened_at is None:
+                _dr_fence_opened_at = time.monotonic()
+        except Exception as e:
+            mirrors[mirror_region] = f'failed: {e}'
+    
+    log_step("update_ssm", "COMPLETED", f"Active region set to {region} (mirrors: {mirrors})")
+    return {'success': True, 'message': f'Active region: {region}', 'mirrors': mirrors}
+
+
+def validate_dr_journeys() -> dict:
+    """Run the synthetic browse and checkout journeys against the DR ALB
+
+    Goes to the ALB directly, so the result does not wait on DNS caches.
+    Waits first until the DR tasks can have seen DR as active, so the
+    checkout is not fenced. A failure is reported but does not undo the
+    failover.
+    """
+    log_step("validate_journeys", "STARTED", f"Probing {DR_ALB_DNS}")
+    
+    try:
+        await_dr_fence()
+        results = probe_regions({DR_REGION: (DR_ALB_DNS, True)})
+        emit_metrics(log, results)
+        summary = without_samples(results).get(DR_REGION)
+        if summary is None:
+            log_step("validate_journeys", "SKIPPED", "No DR ALB configured")
+            return {'success': True, 'message': 'Skipped'}
         
-        log_step("update_ssm", "COMPLETED", f"Active region set to {region}")
-        return {'success': True, 'message': f'Active region: {region}'}
+        latency = {name: step.get('p50') for name, step in summary['steps'].items()}
+        details = f"{summary['success_rate']:.0%} of journeys completed; p50 {json.dumps(latency)}"
+        if passing(summary):
+            log_step("validate_journeys", "COMPLETED", details)
+        else:
+            log_step("validate_journeys", "FAILED", details)
+        return {'success': passing(summary), 'journeys': summary}
         
+    except LeaseLost:
+        raise
     except Exception as e:
-        log_step("update_ssm", "FAILED", str(e))
+        log_step("validate_journeys", "FAILED", str(e))
         return {'success': False, 'error': str(e)}
 
 
 def update_failover_state(status: str, details: dict):
     """Update overall failover state in DynamoDB"""
     try:
-        table = dynamodb.Table(DR_STATE_TABLE)
-        table.put_item(Item={
+        _lease.put_item({
             'state_key': 'failover_state',
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'status': status,
             'active_region': DR_REGION if status == 'COMPLETED' else PRIMARY_REGION,
             'details': json.dumps(details, default=str)
         })
+        # Fenced by the write above: a superseded run is not counted
+        if status != 'IN_PROGRESS':
+            rollups.record_orchestration('failover', status, details.get('duration_seconds'))
     except Exception as e:
-        print(f"Error updating failover state: {e}")
+        log.error('Error updating failover state', status=status, error=str(e))
 
 
 def send_notification(subject: str, message: str):
     """Send SNS notification"""
     try:
         if SNS_TOPIC_ARN:
-            sns.publish(
+            aws_clients.client('sns').publish(
                 TopicArn=SNS_TOPIC_ARN,
                 Subject=subject[:100],
                 Message=message
             )
     except Exception as e:
-        print(f"Error sending notification: {e}")
+        log.error('Error sending notification', subject=subject, error=str(e))
 
 
+@flush_after
 def lambda_handler(event, context):
-    """Main Lambda handler for failover orchestration"""
+    """Main Lambda handler for failover orchestration
+
+    Runs are single-flight: an invocation that finds a failover already in
+    flight (a retry, a second click) waits for it and returns its result.
+    """
+    run_id = getattr(context, 'aws_request_id', None)
+    set_context(run_id=run_id)
+    return single_flight(
+        aws_clients.table(DR_STATE_TABLE), 'failover', run_id or 'manual',
+        lambda lease: run_failover(event, lease), context
+    )
+
+
+def run_failover(event, lease):
+    """Execute the failover steps while holding lease"""
+    global _lease, _dr_fence_opened_at
+    _lease = lease
+    _dr_fence_opened_at = None
     start_time = datetime.now(timezone.utc)
-    print(f"Failover started at {start_time.isoformat()}")
+    started = time.monotonic()
+    _step_started.clear()
+    log.info(
+        'failover started', reason=event.get('reason', 'Manual trigger'),
+        trigger=event.get('trigger', 'manual')
+    )
     
     # Initialize results
     results = {
@@ -237,14 +520,24 @@ def lambda_handler(event, context):
         if not results['steps']['promote_database']['success']:
             raise Exception("Failed to promote database")
         
-        # Step 3: Update DNS to DR
+        # Step 3: Let DR tasks take writes, so warm-up checkouts are not fenced
+        results['steps']['open_dr_writes'] = open_dr_writes()
+        
+        # Step 4: Warm the database and DR tasks (failures do not stop the
+        # failover) with what the RTO leaves after the cutover steps
+        results['steps']['warm_up'] = warm_up_dr(started + RTO_TARGET_SECONDS - CUTOVER_RESERVE_SECONDS)
+        
+        # Step 5: Update DNS to DR
         results['steps']['update_dns'] = update_dns_to_dr()
         if not results['steps']['update_dns']['success']:
             raise Exception("Failed to update DNS")
         
-        # Step 4: Update active region parameter
+        # Step 6: Update active region parameter
         results['steps']['update_active_region'] = update_active_region(DR_REGION)
         
+        # Step 7: Check that users can browse and check out in DR
+        results['steps']['validate_journeys'] = validate_dr_journeys()
+        
         # Calculate duration
         end_time = datetime.now(timezone.utc)
         duration = (end_time - start_time).total_seconds()
@@ -254,6 +547,7 @@ def lambda_handler(event, context):
         results['status'] = 'COMPLETED'
         
         update_failover_state('COMPLETED', results)
+        log.metric('FailoverDuration', duration, 'Seconds', {'Outcome': 'COMPLETED'}, msg='failover completed')
         
         # Send success notification
         send_notification(
@@ -270,11 +564,26 @@ def lambda_handler(event, context):
             'body': json.dumps(results, default=str)
         }
         
+    except LeaseLost as e:
+        # A newer run owns the failover now and reports its outcome; writing
+        # FAILED state or paging on-call from here would contradict it
+        results['status'] = 'SUPERSEDED'
+        results['error'] = str(e)
+        log.warning('failover superseded by a newer run', error=str(e), steps=list(results['steps']))
+        return {
+            'statusCode': 409,
+            'body': json.dumps(results, default=str)
+        }
+        
     except Exception as e:
         results['status'] = 'FAILED'
         results['error'] = str(e)
         
         update_failover_state('FAILED', results)
+        log.metric(
+            'FailoverDuration', (datetime.now(timezone.utc) - start_time).total_seconds(), 'Seconds',
+            {'Outcome': 'FAILED'}, msg='failover failed', level='ERROR', error=str(e)
+        )
         
         send_notification(
             "❌ DR Failover Failed",
@@ -1,14 +1,34 @@
 """
 Health Checker Lambda Function
 Monitors the health of primary and DR regions
+
+Every run also drives synthetic user journeys (synthetic_prober.py)
+through both regions: browsing everywhere, checkout in the active region.
+
+On scheduled runs it also evaluates the auto-failover policy: when a
+quorum of independent probes (this function's ALB probe and journeys,
+RDS instance status, Route 53's multi-region checkers) has seen the primary down for
+FAILOVER_CONSECUTIVE_FAILURES runs in a row and the DR region is ready
+(replica available, DR ALB healthy and browsable, and the replication lag
+recorded before the failures began within FAILOVER_MAX_LAG_SECONDS), it
+invokes the failover orchestrator asynchronously unless an orchestration
+already holds the lease (see lease.py). AUTO_FAILOVER_MODE is off, dry_run (record and notify only)
+or enabled.
+
+Each run is also folded into the dashboard rollups (rollups.py).
 """
 import os
 import json
-import boto3
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import urllib.request
 import urllib.error
 
+import aws_clients
+import lease
+import rollups
+from synthetic_prober import probe_regions, emit_metrics, without_samples, passing
+from structured_logging import get_logger, set_context, flush_after
+
 # Environment variables
 PRIMARY_REGION = os.environ.get('PRIMARY_REGION', 'us-east-1')
 DR_REGION = os.environ.get('DR_REGION', 'us-west-2')
@@ -18,10 +38,37 @@ DR_STATE_TABLE = os.environ.get('DR_STATE_TABLE', '')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN', '')
 PRIMARY_DB_IDENTIFIER = os.environ.get('PRIMARY_DB_IDENTIFIER', '')
 DR_DB_IDENTIFIER = os.environ.get('DR_DB_IDENTIFIER', '')
+PRIMARY_HEALTH_CHECK_ID = os.environ.get('PRIMARY_HEALTH_CHECK_ID', '')
+PROBE_ENABLED = os.environ.get('PROBE_ENABLED', 'true') == 'true'
+
+# Auto-failover policy
+AUTO_FAILOVER_MODE = os.environ.get('AUTO_FAILOVER_MODE', 'dry_run')
+FAILOVER_FUNCTION_NAME = os.environ.get('FAILOVER_FUNCTION_NAME', '')
+FAILOVER_CONSECUTIVE_FAILURES = int(os.environ.get('FAILOVER_CONSECUTIVE_FAILURES', '3'))
+FAILOVER_QUORUM = int(os.environ.get('FAILOVER_QUORUM', '2'))
+FAILOVER_MAX_LAG_SECONDS = float(os.environ.get('FAILOVER_MAX_LAG_SECONDS', '60'))
+# The lag recorded before a failure streak must be at most this old
+FAILOVER_LAG_MAX_AGE_SECONDS = float(os.environ.get('FAILOVER_LAG_MAX_AGE_SECONDS', '900'))
+# ReplicaLag is published once a minute and lands a minute or two late
+REPLICATION_LAG_WINDOW_SECONDS = int(os.environ.get('REPLICATION_LAG_WINDOW_SECONDS', '300'))
 
-# Initialize clients
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+# Instance states in which the database cannot serve; anything else that is
+# not 'available' (backing-up, modifying, upgrading, ...) is routine and
+# abstains from the failover vote
+RDS_DOWN_STATUSES = {
+    'failed', 'stopped', 'stopping', 'deleting', 'storage-full', 'restore-error',
+    'inaccessible-encryption-credentials', 'inaccessible-encryption-credentials-recoverable',
+    'incompatible-network', 'incompatible-option-group', 'incompatible-parameters',
+    'incompatible-restore', 'insufficient-capacity', 'NOT_FOUND'
+}
+
+# Built on first use (or during a SnapStart init); see aws_clients
+CLIENTS = [
+    ('sns', None), ('lambda', None), ('route53', None), ('rds', PRIMARY_REGION), ('rds', DR_REGION),
+    ('cloudwatch', DR_REGION)
+]
+aws_clients.prime(CLIENTS, [DR_STATE_TABLE, rollups.DR_ROLLUP_TABLE])
+log = get_logger('health_checker')
 
 
 def check_alb_health(alb_dns: str, timeout: int = 5) -> dict:
@@ -54,7 +101,7 @@ def check_alb_health(alb_dns: str, timeout: int = 5) -> dict:
 def check_rds_status(db_identifier: str, region: str) -> dict:
     """Check RDS instance status"""
     try:
-        rds = boto3.client('rds', region_name=region)
+        rds = aws_clients.client('rds', region)
         response = rds.describe_db_instances(DBInstanceIdentifier=db_identifier)
         
         if not response['DBInstances']:
@@ -77,45 +124,77 @@ def check_rds_status(db_identifier: str, region: str) -> dict:
 
 
 def check_replication_lag(dr_db_identifier: str) -> dict:
-    """Check RDS replication lag for read replica"""
+    """Check RDS replication lag for read replica
+
+    Uses the newest ReplicaLag datapoint of the last
+    REPLICATION_LAG_WINDOW_SECONDS. Without one (no datapoints, or the
+    CloudWatch call failed) lag_seconds and healthy are None: the lag is
+    unknown, which is not the same as zero.
+    """
     try:
-        cloudwatch = boto3.client('cloudwatch', region_name=DR_REGION)
+        cloudwatch = aws_clients.client('cloudwatch', DR_REGION)
+        now = datetime.now(timezone.utc)
         response = cloudwatch.get_metric_statistics(
             Namespace='AWS/RDS',
             MetricName='ReplicaLag',
             Dimensions=[
                 {'Name': 'DBInstanceIdentifier', 'Value': dr_db_identifier}
             ],
-            StartTime=datetime.now(timezone.utc).replace(second=0, microsecond=0),
-            EndTime=datetime.now(timezone.utc),
+            StartTime=now - timedelta(seconds=REPLICATION_LAG_WINDOW_SECONDS),
+            EndTime=now,
             Period=60,
             Statistics=['Average']
         )
         
-        datapoints = response.get('Datapoints', [])
+        # Datapoints come back in no particular order
+        datapoints = sorted(response.get('Datapoints', []), key=lambda d: d['Timestamp'])
         if datapoints:
-            lag = datapoints[-1].get('Average', 0)
+            lag = datapoints[-1]['Average']
             return {
                 'healthy': lag < 60,  # Less than 60 seconds lag
-                'lag_seconds': lag
+                'lag_seconds': lag,
+                'measured_at': datapoints[-1]['Timestamp'].isoformat()
             }
         return {
-            'healthy': True,
-            'lag_seconds': 0,
-            'note': 'No datapoints available'
+            'healthy': None,
+            'lag_seconds': None,
+            'note': f'No ReplicaLag datapoints in the last {REPLICATION_LAG_WINDOW_SECONDS}s'
         }
     except Exception as e:
         return {
-            'healthy': False,
-            'lag_seconds': -1,
+            'healthy': None,
+            'lag_seconds': None,
             'error': str(e)
         }
 
 
+def check_route53_health(health_check_id: str) -> dict:
+    """Primary as seen by Route 53's checkers in several AWS regions"""
+    if not health_check_id:
+        return {'healthy': None, 'note': 'No Route 53 health check configured'}
+    try:
+        route53 = aws_clients.client('route53')
+        response = route53.get_health_check_status(HealthCheckId=health_check_id)
+        observations = response.get('HealthCheckObservations', [])
+        if not observations:
+            return {'healthy': None, 'note': 'No observations'}
+        failing = sum(
+            1 for o in observations
+            if not o.get('StatusReport', {}).get('Status', '').startswith('Success')
+        )
+        return {
+            'healthy': failing * 2 < len(observations),
+            'failing_checkers': failing,
+            'checkers': len(observations)
+        }
+    except Exception as e:
+        return {'healthy': None, 'error': str(e)}
+
+
 def update_dr_state(state_data: dict):
     """Update the DR state table in DynamoDB"""
     try:
-        table = dynamodb.Table(DR_STATE_TABLE)
+        table = aws_clients.table(DR_STATE_TABLE)
         timestamp = datetime.now(timezone.utc).isoformat()
         
         # Update health status
@@ -126,7 +205,7 @@ def update_dr_state(state_data: dict):
             'dr_alb_healthy': state_data['dr_alb']['healthy'],
             'primary_db_healthy': state_data['primary_db']['healthy'],
             'dr_db_healthy': state_data['dr_db']['healthy'],
-            'replication_lag_seconds': state_data['replication'].get('lag_seconds', -1),
+            'replication_lag_seconds': rollups.number(state_data['replication']['lag_seconds']),
             'overall_healthy': state_data['overall_healthy'],
             'details': json.dumps(state_data)
         })
@@ -139,27 +218,268 @@ def update_dr_state(state_data: dict):
         
         return True
     except Exception as e:
-        print(f"Error updating DR state: {e}")
+        log.error('Error updating DR state', error=str(e))
         return False
 
 
+def update_rollups(state_data: dict, decision: dict = None):
+    """Add this run to the uptime and lag rollups and replace the status item"""
+    try:
+        journeys = state_data['journeys']
+        active_region = state_data['active_region']
+        active_alb = state_data['primary_alb' if active_region == PRIMARY_REGION else 'dr_alb']
+        active_journeys = journeys.get(active_region)
+        components = {
+            'primary_alb': state_data['primary_alb']['healthy'],
+            'dr_alb': state_data['dr_alb']['healthy'],
+            'primary_db': state_data['primary_db']['healthy'],
+            'dr_db': state_data['dr_db']['healthy'],
+            'replication': state_data['replication'].get('healthy'),
+            'primary_journeys': passing(journeys[PRIMARY_REGION]) if PRIMARY_REGION in journeys else None,
+            'dr_journeys': passing(journeys[DR_REGION]) if DR_REGION in journeys else None,
+            # The application as users see it: the active region serves and checks out
+            'service': active_alb['healthy'] and (active_journeys is None or passing(active_journeys)),
+            'overall': state_data['overall_healthy']
+        }
+        status = {f'{name}_healthy': up for name, up in components.items()}
+        status.update({
+            'active_region': active_region,
+            'replication_lag_seconds': state_data['replication']['lag_seconds'],
+            'primary_journey_success_rate': journeys.get(PRIMARY_REGION, {}).get('success_rate'),
+            'dr_journey_success_rate': journeys.get(DR_REGION, {}).get('success_rate'),
+            'failover_action': decision['action'] if decision else None,
+            'consecutive_failures': decision['consecutive_failures'] if decision else None
+        })
+        rollups.record_health(components, state_data['replication']['lag_seconds'], status)
+    except Exception as e:
+        log.error('Error updating rollups', error=str(e))
+
+
 def send_alert(subject: str, message: str):
     """Send alert via SNS"""
     try:
         if SNS_TOPIC_ARN:
-            sns.publish(
+            aws_clients.client('sns').publish(
                 TopicArn=SNS_TOPIC_ARN,
                 Subject=subject[:100],  # SNS subject limit
                 Message=message
             )
-            print(f"Alert sent: {subject}")
+            log.warning('Alert sent', subject=subject)
     except Exception as e:
-        print(f"Error sending alert: {e}")
+        log.error('Error sending alert', subject=subject, error=str(e))
+
+
+def rds_vote(status: str):
+    """True if the instance status means it cannot serve, False if available, else None"""
+    if status in RDS_DOWN_STATUSES:
+        return True
+    if status == 'available':
+        return False
+    return None
+
+
+def primary_failure_votes(state_data: dict) -> dict:
+    """Each probe's verdict on the primary: True (down), False (up), None (no answer)
 
+    A probe that failed on our side (an AWS API error) abstains rather than
+    voting the primary down, and so does an instance in a routine state
+    such as backing-up or modifying: only RDS_DOWN_STATUSES vote it down.
+    """
+    primary_db = state_data['primary_db']
+    route53 = state_data['route53_primary']
+    # The journeys share this function's vantage point with /health, so
+    # they are one vote: the primary is down for users if either fails
+    journeys = state_data['journeys'].get(PRIMARY_REGION)
+    return {
+        'alb_probe': not state_data['primary_alb']['healthy'] or (journeys is not None and not passing(journeys)),
+        'rds_status': rds_vote(primary_db.get('status')),
+        'route53_checkers': None if route53.get('healthy') is None else not route53['healthy']
+    }
+
+
+def dr_readiness(state_data: dict, lag_before_failure) -> list:
+    """Reasons the DR region cannot take over now (empty if ready)
+
+    Data loss is judged from lag_before_failure (record_failure_streak),
+    not this run's ReplicaLag: with the primary down the replica receives
+    no WAL and its lag grows, or stops being published, by itself.
+    """
+    blockers = []
+    if not state_data['dr_db']['healthy']:
+        blockers.append(f"DR database is {state_data['dr_db'].get('status', 'UNKNOWN')}")
+    if not state_data['dr_alb']['healthy']:
+        blockers.append('DR ALB is not healthy')
+    journeys = state_data['journeys'].get(DR_REGION)
+    if journeys is not None and not passing(journeys):
+        blockers.append(f"DR browse journeys succeed {journeys['success_rate']:.0%} of the time")
+    if lag_before_failure is None:
+        blockers.append(
+            'Replication lag before the failures began is unknown; '
+            'failing over could lose data, decide manually'
+        )
+        return blockers
+    lag = lag_before_failure['lag_seconds']
+    age = (datetime.now(timezone.utc) - datetime.fromisoformat(lag_before_failure['measured_at'])).total_seconds()
+    if age > FAILOVER_LAG_MAX_AGE_SECONDS:
+        blockers.append(
+            f"Replication lag was last known {age:.0f}s ago ({lag:.0f}s); "
+            f"failing over could lose data, decide manually"
+        )
+    elif lag > FAILOVER_MAX_LAG_SECONDS:
+        blockers.append(
+            f"Replication lag was {lag:.0f}s before the failures began, over {FAILOVER_MAX_LAG_SECONDS:.0f}s; "
+            f"failing over would lose data, decide manually"
+        )
+    return blockers
 
+
+def last_orchestration(table):
+    """The most recent failover_state or failback_state item, or None"""
+    items = [
+        table.get_item(Key={'state_key': key}).get('Item')
+        for key in ('failover_state', 'failback_state')
+    ]
+    items = [item for item in items if item]
+    return max(items, key=lambda item: item.get('timestamp', '')) if items else None
+
+
+def record_failure_streak(table, failing: bool, replication: dict) -> tuple:
+    """Count consecutive quorum failures; a passing run resets the streak
+
+    A passing run with a known lag also records it as lag_before_failure,
+    which a failing run leaves alone. Returns (streak, lag_before_failure),
+    the latter None on a passing run or if no lag was ever recorded.
+    """
+    if not failing:
+        updates, values = ['consecutive_failures = :zero'], {':zero': 0}
+        if replication['lag_seconds'] is not None:
+            updates.append('lag_before_failure = :lag, lag_before_failure_at = :at')
+            values[':lag'] = rollups.number(replication['lag_seconds'])
+            values[':at'] = replication.get('measured_at') or datetime.now(timezone.utc).isoformat()
+        table.update_item(
+            Key={'state_key': 'failover_decision'},
+            UpdateExpression='SET ' + ', '.join(updates),
+            ExpressionAttributeValues=values
+        )
+        return 0, None
+    response = table.update_item(
+        Key={'state_key': 'failover_decision'},
+        UpdateExpression='ADD consecutive_failures :one',
+        ExpressionAttributeValues={':one': 1},
+        ReturnValues='ALL_NEW'
+    )
+    item = response['Attributes']
+    lag_before_failure = None
+    if item.get('lag_before_failure') is not None:
+        lag_before_failure = {
+            'lag_seconds': float(item['lag_before_failure']),
+            'measured_at': item['lag_before_failure_at']
+        }
+    return int(item['consecutive_failures']), lag_before_failure
+
+
+def evaluate_failover(state_data: dict, last, run_id: str) -> dict:
+    """Apply the auto-failover policy to this run's health state
+
+    last is the most recent orchestration state item (last_orchestration).
+    """
+    table = aws_clients.table(DR_STATE_TABLE)
+    votes = primary_failure_votes(state_data)
+    down = sorted(name for name, vote in votes.items() if vote)
+    quorum_failed = len(down) >= FAILOVER_QUORUM
+    streak, lag_before_failure = record_failure_streak(table, quorum_failed, state_data['replication'])
+
+    decision = {
+        'mode': AUTO_FAILOVER_MODE,
+        'votes': votes,
+        'down': down,
+        'consecutive_failures': streak,
+        'lag_before_failure': lag_before_failure,
+        'action': 'none',
+        'reasons': []
+    }
+    if last and last.get('active_region', PRIMARY_REGION) != PRIMARY_REGION:
+        decision['reasons'].append(f"Active region is {last['active_region']}")
+    elif not quorum_failed:
+        if down:
+            decision['reasons'].append(f"{len(down)} of {FAILOVER_QUORUM} probes needed for quorum")
+    elif streak < FAILOVER_CONSECUTIVE_FAILURES:
+        decision['action'] = 'watch'
+        decision['reasons'].append(f"{streak} of {FAILOVER_CONSECUTIVE_FAILURES} consecutive failures")
+    elif lease.current(table):
+        decision['action'] = 'locked'
+        decision['reasons'].append('An orchestration already holds the lease')
+    else:
+        blockers = dr_readiness(state_data, lag_before_failure)
+        # A run still IN_PROGRESS without a live lease has died
+        if last and last['state_key'] == 'failover_state' and last.get('status') in ('IN_PROGRESS', 'FAILED'):
+            blockers.append(f"Last failover is {last['status']}; manual intervention required")
+        if blockers:
+            decision['action'] = 'blocked'
+            decision['reasons'] = blockers
+        elif AUTO_FAILOVER_MODE != 'enabled':
+            decision['action'] = 'dry_run'
+            decision['reasons'].append('Policy would fail over now')
+        else:
+            decision['action'] = 'failover'
+            decision['reasons'].append(f"Invoked {FAILOVER_FUNCTION_NAME}")
+            try:
+                # The orchestrator takes the lease itself; a duplicate invoke
+                # attaches to the run already in flight
+                aws_clients.client('lambda').invoke(
+                    FunctionName=FAILOVER_FUNCTION_NAME,
+                    InvocationType='Event',
+                    Payload=json.dumps({
+                        'reason': f"Auto-failover: primary down ({', '.join(down)}) "
+                                  f"for {streak} consecutive checks",
+                        'trigger': 'health_checker',
+                        'decision_run': run_id
+                    }).encode('utf-8')
+                )
+            except Exception as e:
+                decision['action'] = 'error'
+                decision['reasons'].append(f"Invoking {FAILOVER_FUNCTION_NAME} failed: {e}")
+
+    table.update_item(
+        Key={'state_key': 'failover_decision'},
+        UpdateExpression='SET #ts = :ts, #action = :action, details = :details',
+        ExpressionAttributeNames={'#ts': 'timestamp', '#action': 'action'},
+        ExpressionAttributeValues={
+            ':ts': datetime.now(timezone.utc).isoformat(),
+            ':action': decision['action'],
+            ':details': json.dumps(decision)
+        }
+    )
+    return decision
+
+
+def notify_decision(decision: dict):
+    """Alert when the streak first reaches the threshold or an action is taken"""
+    action = decision['action']
+    if action in ('none', 'watch', 'locked'):
+        return
+    # dry_run and blocked repeat every run while the outage lasts
+    if action in ('dry_run', 'blocked') and decision['consecutive_failures'] != FAILOVER_CONSECUTIVE_FAILURES:
+        return
+    subjects = {
+        'failover': "🔄 DR Auto-Failover Triggered",
+        'dry_run': "🧪 DR Auto-Failover (dry run): would fail over",
+        'blocked': "⚠️ DR Auto-Failover Blocked",
+        'error': "❌ DR Auto-Failover Could Not Start"
+    }
+    send_alert(
+        subjects[action],
+        f"Primary region ({PRIMARY_REGION}) failing probes: {', '.join(decision['down'])} "
+        f"for {decision['consecutive_failures']} consecutive checks.\n\n"
+        + "\n".join(decision['reasons'])
+    )
+
+
+@flush_after
 def lambda_handler(event, context):
     """Main Lambda handler"""
-    print(f"Health check started at {datetime.now(timezone.utc).isoformat()}")
+    set_context(run_id=getattr(context, 'aws_request_id', None))
+    log.debug('Health check started')
     
     # Check all components
     primary_alb = check_alb_health(PRIMARY_ALB_DNS)
@@ -167,13 +487,30 @@ def lambda_handler(event, context):
     primary_db = check_rds_status(PRIMARY_DB_IDENTIFIER, PRIMARY_REGION)
     dr_db = check_rds_status(DR_DB_IDENTIFIER, DR_REGION)
     replication = check_replication_lag(DR_DB_IDENTIFIER)
+    route53_primary = check_route53_health(PRIMARY_HEALTH_CHECK_ID)
+    
+    try:
+        last = last_orchestration(aws_clients.table(DR_STATE_TABLE))
+    except Exception as e:
+        log.error('Error reading orchestration state', error=str(e))
+        last = None
+    active_region = last.get('active_region', PRIMARY_REGION) if last else PRIMARY_REGION
+    
+    # Browse in both regions; check out only where the database is writable
+    journeys = {}
+    if PROBE_ENABLED:
+        journeys = probe_regions({
+            PRIMARY_REGION: (PRIMARY_ALB_DNS, active_region == PRIMARY_REGION),
+            DR_REGION: (DR_ALB_DNS, active_region == DR_REGION)
+        })
+        emit_metrics(log, journeys)
     
     # Determine overall health
     overall_healthy = (
         primary_alb['healthy'] and
         primary_db['healthy'] and
         dr_db['healthy'] and
-        replication.get('healthy', True)
+        replication['healthy'] is not False
     )
     
     state_data = {
@@ -183,19 +520,43 @@ def lambda_handler(event, context):
         'primary_db': primary_db,
         'dr_db': dr_db,
         'replication': replication,
+        'route53_primary': route53_primary,
+        'active_region': active_region,
+        'journeys': without_samples(journeys),
         'overall_healthy': overall_healthy
     }
     
     # Update DynamoDB state
     update_dr_state(state_data)
     
+    # Only scheduled runs decide; the failover workflow calls this function
+    # too and starts the orchestrator itself
+    decision = None
+    if AUTO_FAILOVER_MODE != 'off' and event.get('source') == 'aws.events':
+        try:
+            decision = evaluate_failover(state_data, last, getattr(context, 'aws_request_id', 'manual'))
+            state_data['failover_decision'] = decision
+            if decision['action'] != 'none':
+                log.metric(
+                    'FailoverDecision', 1, 'Count', {'Action': decision['action']},
+                    msg='failover decision', level='WARNING',
+                    reasons=decision['reasons'], down=decision['down'],
+                    consecutive_failures=decision['consecutive_failures']
+                )
+            notify_decision(decision)
+        except Exception as e:
+            log.error('Error evaluating failover policy', error=str(e))
+    
+    update_rollups(state_data, decision)
+    
     # Send alerts if unhealthy
     if not primary_alb['healthy']:
         send_alert(
             "🚨 DR Alert: Primary ALB Unhealthy",
             f"Primary ALB at {PRIMARY_ALB_DNS} is not responding.\n\n"
             f"Details: {json.dumps(primary_alb, indent=2)}\n\n"
-            f"Consider initiating failover if issue persists."
+            f"Auto-failover ({AUTO_FAILOVER_MODE}): "
+            f"{decision['action'] if decision else 'not evaluated'}"
         )
     
     if not primary_db['healthy']:
@@ -206,7 +567,20 @@ def lambda_handler(event, context):
             f"Details: {json.dumps(primary_db, indent=2)}"
         )
     
-    if replication.get('lag_seconds', 0) > 300:  # 5 minutes
+    active_journeys = state_data['journeys'].get(active_region)
+    if active_journeys is not None and not passing(active_journeys):
+        failing_steps = {
+            name: step.get('statuses') for name, step in active_journeys['steps'].items() if step['errors']
+        }
+        send_alert(
+            "🚨 DR Alert: Synthetic Journeys Failing",
+            f"Only {active_journeys['success_rate']:.0%} of synthetic journeys completed "
+            f"in the active region ({active_region}).\n\n"
+            f"Failing steps (HTTP statuses): {json.dumps(failing_steps)}\n\n"
+            f"Details: {json.dumps(active_journeys, indent=2)}"
+        )
+    
+    if (replication['lag_seconds'] or 0) > 300:  # 5 minutes
         send_alert(
             "⚠️ DR Warning: High Replication Lag",
             f"Replication lag is {replication['lag_seconds']} seconds.\n\n"
@@ -214,7 +588,25 @@ def lambda_handler(event, context):
             f"RPO may be at risk."
         )
     
-    print(f"Health check completed. Overall healthy: {overall_healthy}")
+    # One EMF line per run replaces the completion message; healthy runs
+    # need nothing else in the log stream
+    values = {
+        'PrimaryAlbHealthy': int(primary_alb['healthy']),
+        'DrAlbHealthy': int(dr_alb['healthy']),
+        'PrimaryDbHealthy': int(primary_db['healthy']),
+        'DrDbHealthy': int(dr_db['healthy']),
+        'OverallHealthy': int(overall_healthy),
+        'ConsecutiveFailures': decision['consecutive_failures'] if decision else 0
+    }
+    # No datapoint rather than a fake 0 or -1 when the lag is unknown
+    if replication['lag_seconds'] is not None:
+        values['ReplicationLag'] = replication['lag_seconds']
+    log.metrics(
+        values,
+        {'ReplicationLag': 'Seconds'},
+        msg='Health check completed',
+        level='INFO' if overall_healthy else 'WARNING'
+    )
     
     return {
         'statusCode': 200,
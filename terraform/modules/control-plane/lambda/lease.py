@@ -0,0 +1,269 @@
+"""
+Orchestration Lease
+Single-flight lock for the failover and failback orchestrators, kept as the
+orchestration_lease item in the DR state table.
+
+- Acquire is a conditional write: it succeeds only if no run holds a live
+  lease, and it bumps fencing_token.
+- The holder heartbeats every LEASE_TTL_SECONDS / 3. A run that stops
+  heartbeating (timed out, crashed) loses the lease after
+  LEASE_TTL_SECONDS, and the next caller takes it over.
+- State writes go through Lease.put_item, which refuses to overwrite an
+  item written under a newer token. A superseded run therefore stops at
+  its next step instead of racing the run that replaced it.
+- A caller that finds the same operation in flight waits for that run and
+  returns its result instead of starting new work.
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from structured_logging import get_logger
+
+LEASE_KEY = 'orchestration_lease'
+LEASE_TTL_SECONDS = int(os.environ.get('LEASE_TTL_SECONDS', '60'))
+LEASE_POLL_SECONDS = float(os.environ.get('LEASE_POLL_SECONDS', '5'))
+# Leave this much of the invocation to return a result after waiting
+WAIT_MARGIN_SECONDS = 15
+
+log = get_logger('lease')
+
+
+class LeaseLost(Exception):
+    """Another run took over the lease; this run must stop"""
+
+
+def _conditional_failed(e: ClientError) -> bool:
+    return e.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+
+class Lease:
+    """A held orchestration lease"""
+
+    def __init__(self, table, owner: str, operation: str, token: int, expires_at: int,
+                 ttl: int = LEASE_TTL_SECONDS):
+        self.table = table
+        self.owner = owner
+        self.operation = operation
+        self.token = token
+        self.expires_at = expires_at
+        self.ttl = ttl
+        self.lost = False
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def _owned(self) -> dict:
+        return {
+            'ConditionExpression': '#owner = :owner AND fencing_token = :token',
+            'ExpressionAttributeNames': {'#owner': 'owner'},
+            'ExpressionAttributeValues': {':owner': self.owner, ':token': self.token}
+        }
+
+    def renew(self) -> bool:
+        """Extend the lease; False once another run has taken it"""
+        expires_at = int(time.time()) + self.ttl
+        condition = self._owned()
+        condition['ExpressionAttributeValues'].update({
+            ':expires': expires_at,
+            ':ts': datetime.now(timezone.utc).isoformat()
+        })
+        try:
+            self.table.update_item(
+                Key={'state_key': LEASE_KEY},
+                UpdateExpression='SET expires_at = :expires, heartbeat_at = :ts',
+                **condition
+            )
+        except ClientError as e:
+            if not _conditional_failed(e):
+                raise
+            self.lost = True
+            return False
+        self.expires_at = expires_at
+        return True
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    log.error('lease taken over', owner=self.owner, fencing_token=self.token)
+                    return
+            except Exception as e:
+                # Keep trying; check() fails the run once the lease runs out
+                log.warning('lease heartbeat failed', owner=self.owner, error=str(e))
+
+    def start_heartbeat(self):
+        self.thread = threading.Thread(target=self._heartbeat, daemon=True, name='lease-heartbeat')
+        self.thread.start()
+
+    def check(self):
+        """Raise LeaseLost unless this run still holds the lease"""
+        if self.lost or time.time() >= self.expires_at:
+            self.lost = True
+            raise LeaseLost(f"{self.operation} run {self.owner} lost lease {self.token}")
+
+    def put_item(self, item: dict):
+        """put_item fenced by this lease's token"""
+        self.check()
+        try:
+            self.table.put_item(
+                Item=dict(item, fencing_token=self.token),
+                ConditionExpression='attribute_not_exists(fencing_token) OR fencing_token <= :token',
+                ExpressionAttributeValues={':token': self.token}
+            )
+        except ClientError as e:
+            if not _conditional_failed(e):
+                raise
+            self.lost = True
+            raise LeaseLost(f"{item['state_key']} was written by a newer run than {self.token}")
+
+    def release(self, result):
+        """Publish the run's result for waiters and free the lease"""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        condition = self._owned()
+        condition['ExpressionAttributeNames']['#status'] = 'status'
+        condition['ExpressionAttributeNames']['#result'] = 'result'
+        condition['ExpressionAttributeValues'].update({
+            ':done': 'DONE',
+            ':result': json.dumps(result, default=str),
+            ':ts': datetime.now(timezone.utc).isoformat(),
+            ':now': int(time.time())
+        })
+        try:
+            self.table.update_item(
+                Key={'state_key': LEASE_KEY},
+                UpdateExpression='SET #status = :done, #result = :result, finished_at = :ts, expires_at = :now',
+                **condition
+            )
+        except ClientError as e:
+            if not _conditional_failed(e):
+                raise
+            log.warning('lease already taken over at release', owner=self.owner, fencing_token=self.token)
+
+
+def read(table):
+    """The lease item, or None if no run has ever held it"""
+    return table.get_item(Key={'state_key': LEASE_KEY}, ConsistentRead=True).get('Item')
+
+
+def is_live(item) -> bool:
+    return bool(item) and item.get('status') == 'RUNNING' and item.get('expires_at', 0) > time.time()
+
+
+def current(table):
+    """The lease item if a run holds it right now, else None"""
+    item = read(table)
+    return item if is_live(item) else None
+
+
+def acquire(table, owner: str, operation: str, ttl: int = LEASE_TTL_SECONDS):
+    """Take the lease if it is free, finished or expired; None if held"""
+    now = int(time.time())
+    try:
+        response = table.update_item(
+            Key={'state_key': LEASE_KEY},
+            UpdateExpression=(
+                'SET #owner = :owner, operation = :operation, #status = :running, '
+                'started_at = :ts, heartbeat_at = :ts, expires_at = :expires '
+                'REMOVE #result, finished_at ADD fencing_token :one'
+            ),
+            ConditionExpression='attribute_not_exists(state_key) OR #status = :done OR expires_at < :now',
+            ExpressionAttributeNames={'#owner': 'owner', '#status': 'status', '#result': 'result'},
+            ExpressionAttributeValues={
+                ':owner': owner,
+                ':operation': operation,
+                ':running': 'RUNNING',
+                ':done': 'DONE',
+                ':ts': datetime.now(timezone.utc).isoformat(),
+                ':expires': now + ttl,
+                ':now': now,
+                ':one': 1
+            },
+            ReturnValues='ALL_NEW'
+        )
+    except ClientError as e:
+        if _conditional_failed(e):
+            return None
+        raise
+    item = response['Attributes']
+    return Lease(table, owner, operation, int(item['fencing_token']), int(item['expires_at']), ttl)
+
+
+def wait_for_result(table, holder: dict, deadline: float):
+    """Wait for the run holding the lease to finish
+
+    Returns its result, None if it died without one (so the caller may
+    take over) or the operation changed, and a 202 response at deadline.
+    """
+    token = int(holder['fencing_token'])
+    while time.time() < deadline:
+        time.sleep(LEASE_POLL_SECONDS)
+        item = read(table)
+        if not item or item.get('operation') != holder['operation'] or int(item['fencing_token']) < token:
+            return None
+        if item.get('status') == 'DONE':
+            if item.get('result') in (None, 'null'):
+                return {
+                    'statusCode': 500,
+                    'body': json.dumps({'status': 'FAILED', 'error': 'In-flight run ended without a result'})
+                }
+            return json.loads(item['result'])
+        if not is_live(item):
+            return None
+    return {
+        'statusCode': 202,
+        'body': json.dumps({
+            'status': 'IN_PROGRESS',
+            'operation': holder['operation'],
+            'owner': holder['owner'],
+            'fencing_token': token
+        }, default=str)
+    }
+
+
+def single_flight(table, operation: str, owner: str, run, context=None):
+    """Run run(lease) under the lease, or return the in-flight run's result"""
+    if context is not None:
+        deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - WAIT_MARGIN_SECONDS
+    else:
+        deadline = time.time() + 900
+    while True:
+        lease = acquire(table, owner, operation)
+        if lease:
+            log.info('lease acquired', operation=operation, owner=owner, fencing_token=lease.token)
+            lease.start_heartbeat()
+            result = None
+            try:
+                result = run(lease)
+                return result
+            finally:
+                lease.release(result)
+
+        holder = current(table)
+        if holder is None:
+            # Finished or expired between the two reads; try again
+            continue
+        if holder['operation'] != operation:
+            log.warning('conflicting run in flight', operation=operation, in_flight=holder['operation'])
+            return {
+                'statusCode': 409,
+                'body': json.dumps({
+                    'status': 'CONFLICT',
+                    'in_flight': holder['operation'],
+                    'owner': holder['owner']
+                })
+            }
+
+        log.info(
+            'attached to in-flight run', operation=operation, owner=holder['owner'],
+            fencing_token=int(holder['fencing_token'])
+        )
+        result = wait_for_result(table, holder, deadline)
+        if result is not None:
+            return result
+        log.warning('in-flight run ended without a result; taking over', owner=holder['owner'])
@@ -0,0 +1,136 @@
+"""
+DR Status Rollups
+Compact, incrementally updated aggregates for the dashboard, kept in the
+DR rollup table (hash key series, range key period) so each view is one
+get_item or query instead of re-reading the details blobs in the DR state
+table.
+
+Series:
+- status / current: the latest health check as flat attributes.
+- health#hour / 2026-10-19T13 and health#day / 2026-10-19: per component
+  <component>_checks and <component>_up counters (uptime), plus a
+  replication lag histogram (lag_samples, lag_sum, lag_le_<bound>).
+- orchestration / 2026-10 and orchestration / total: per operation
+  <operation>_completed, <operation>_failed and <operation>_seconds_total
+  (sum of completed durations, so mean RTO is one division), plus the last
+  run's status and duration. 'total' sorts after every month.
+
+Writers only ADD to counters, so concurrent runs never lose an update and
+nothing is read back. Hourly items expire after ROLLUP_HOURLY_RETENTION_DAYS
+and daily ones after ROLLUP_DAILY_RETENTION_DAYS (DynamoDB TTL on
+expires_at); orchestration rollups are kept.
+"""
+import os
+import time
+from decimal import Decimal
+from datetime import datetime, timezone
+
+import aws_clients
+
+DR_ROLLUP_TABLE = os.environ.get('DR_ROLLUP_TABLE', '')
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOURLY_RETENTION_DAYS', '14'))
+ROLLUP_DAILY_RETENTION_DAYS = int(os.environ.get('ROLLUP_DAILY_RETENTION_DAYS', '400'))
+
+# Upper bounds (seconds) of the replication lag histogram buckets; lags
+# above the last bound land in lag_le_inf
+LAG_BUCKETS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 900, 3600)
+
+STATUS_KEY = {'series': 'status', 'period': 'current'}
+HEALTH_GRANULARITIES = {
+    'hour': ('%Y-%m-%dT%H', ROLLUP_HOURLY_RETENTION_DAYS),
+    'day': ('%Y-%m-%d', ROLLUP_DAILY_RETENTION_DAYS)
+}
+ORCHESTRATION_SERIES = 'orchestration'
+ORCHESTRATION_TOTAL = 'total'
+
+
+def number(value):
+    """A float or int as DynamoDB accepts it (the resource API rejects floats); None passes through"""
+    return Decimal(str(round(value, 3))) if isinstance(value, float) else value
+
+
+def lag_bucket(lag_seconds: float) -> str:
+    for bound in LAG_BUCKETS:
+        if lag_seconds <= bound:
+            return f'lag_le_{bound}'
+    return 'lag_le_inf'
+
+
+def health_series(granularity: str) -> str:
+    return f'health#{granularity}'
+
+
+def period(granularity: str, when: datetime) -> str:
+    return when.strftime(HEALTH_GRANULARITIES[granularity][0])
+
+
+def record_health(components: dict, lag_seconds: float, status: dict, now: datetime = None):
+    """Fold one health check into the hourly and daily rollups
+
+    components maps name -> True (up), False (down) or None (not measured,
+    not counted). lag_seconds None (not measured) is left out of the
+    histogram. status is stored as the current status item.
+    """
+    if not DR_ROLLUP_TABLE:
+        return
+    now = now or datetime.now(timezone.utc)
+    table = aws_clients.table(DR_ROLLUP_TABLE)
+
+    adds = []
+    values = {':one': 1}
+    for name, up in components.items():
+        if up is None:
+            continue
+        adds.append(f'{name}_checks :one')
+        if up:
+            adds.append(f'{name}_up :one')
+    if lag_seconds is not None and lag_seconds >= 0:
+        adds += ['lag_samples :one', 'lag_sum :lag', f'{lag_bucket(lag_seconds)} :one']
+        values[':lag'] = number(float(lag_seconds))
+
+    for granularity, (_, retention_days) in HEALTH_GRANULARITIES.items():
+        table.update_item(
+            Key={'series': health_series(granularity), 'period': period(granularity, now)},
+            UpdateExpression=f"ADD {', '.join(adds)} SET expires_at = :expires",
+            ExpressionAttributeValues={**values, ':expires': int(time.time()) + retention_days * 86400}
+        )
+
+    table.put_item(Item={
+        **STATUS_KEY,
+        'timestamp': now.isoformat(),
+        **{name: number(value) for name, value in status.items() if value is not None}
+    })
+
+
+def record_orchestration(operation: str, status: str, duration_seconds: float = None, now: datetime = None):
+    """Count a finished failover or failback in its month and in the totals
+
+    Only completed runs add to <operation>_seconds_total, so the mean RTO is
+    <operation>_seconds_total / <operation>_completed.
+    """
+    if not DR_ROLLUP_TABLE:
+        return
+    now = now or datetime.now(timezone.utc)
+    table = aws_clients.table(DR_ROLLUP_TABLE)
+    completed = status == 'COMPLETED' and duration_seconds is not None
+    adds = [f"{operation}_{'completed' if completed else 'failed'} :one"]
+    values = {
+        ':one': 1,
+        ':at': now.isoformat(),
+        ':status': status
+    }
+    sets = [f'last_{operation}_at = :at', f'last_{operation}_status = :status']
+    if completed:
+        adds.append(f'{operation}_seconds_total :seconds')
+        sets.append(f'last_{operation}_seconds = :seconds')
+        values[':seconds'] = number(float(duration_seconds))
+        remove = ''
+    else:
+        remove = f' REMOVE last_{operation}_seconds'
+
+    for key in (now.strftime('%Y-%m'), ORCHESTRATION_TOTAL):
+        table.update_item(
+            Key={'series': ORCHESTRATION_SERIES, 'period': key},
+            UpdateExpression=f"ADD {', '.join(adds)} SET {', '.join(sets)}{remove}",
+            ExpressionAttributeValues=values
+        )
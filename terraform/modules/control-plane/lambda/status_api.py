@@ -0,0 +1,162 @@
+"""
+DR Status API Lambda Function
+Read API for the dashboard over the rollups (rollups.py), served through a
+Lambda function URL. Every route is a single get_item or query; the
+response carries ready-to-plot values, so the dashboard aggregates
+nothing.
+
+    GET /status                               latest health check
+    GET /uptime?granularity=hour&periods=24   uptime % per component, lag percentiles
+    GET /orchestrations?months=12             failover/failback counts, mean RTO
+"""
+import os
+import json
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+import aws_clients
+import rollups
+from structured_logging import get_logger, set_context, flush_after
+
+# Longest range one request may ask for
+STATUS_API_MAX_PERIODS = int(os.environ.get('STATUS_API_MAX_PERIODS', '400'))
+# Rollups change once a minute (health checker schedule)
+STATUS_API_CACHE_SECONDS = int(os.environ.get('STATUS_API_CACHE_SECONDS', '30'))
+
+LAG_PERCENTILES = (50, 90, 99)
+ORCHESTRATIONS = ('failover', 'failback')
+
+aws_clients.prime([], [rollups.DR_ROLLUP_TABLE])
+log = get_logger('status_api')
+
+
+def plain(value):
+    """DynamoDB Decimals as ints or floats for JSON"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def lag_percentiles(item: dict) -> dict:
+    """Percentiles from the item's lag histogram, as bucket upper bounds
+
+    None when the percentile falls beyond the last bucket.
+    """
+    samples = int(item.get('lag_samples', 0))
+    if not samples:
+        return {}
+    result = {'lag_mean_seconds': round(float(item['lag_sum']) / samples, 3)}
+    for pct in LAG_PERCENTILES:
+        needed = samples * pct / 100
+        seen = 0
+        result[f'lag_p{pct}_seconds'] = None
+        for bound in rollups.LAG_BUCKETS:
+            seen += int(item.get(f'lag_le_{bound}', 0))
+            if seen >= needed:
+                result[f'lag_p{pct}_seconds'] = bound
+                break
+    return result
+
+
+def health_period(item: dict) -> dict:
+    uptime = {}
+    for name, checks in item.items():
+        if name.endswith('_checks') and checks:
+            component = name[:-len('_checks')]
+            uptime[component] = round(100 * int(item.get(f'{component}_up', 0)) / int(checks), 3)
+    return {'period': item['period'], 'uptime_percent': uptime, **lag_percentiles(item)}
+
+
+def orchestration_period(item: dict) -> dict:
+    result = {'period': item['period']}
+    for operation in ORCHESTRATIONS:
+        completed = int(item.get(f'{operation}_completed', 0))
+        total_seconds = float(item.get(f'{operation}_seconds_total', 0))
+        result[operation] = {
+            'completed': completed,
+            'failed': int(item.get(f'{operation}_failed', 0)),
+            'mean_seconds': round(total_seconds / completed, 1) if completed else None,
+            'last_at': item.get(f'last_{operation}_at'),
+            'last_status': item.get(f'last_{operation}_status'),
+            'last_seconds': plain(item.get(f'last_{operation}_seconds'))
+        }
+    return result
+
+
+def get_status(params: dict) -> dict:
+    item = aws_clients.table(rollups.DR_ROLLUP_TABLE).get_item(Key=rollups.STATUS_KEY).get('Item')
+    if not item:
+        return None
+    return {name: plain(value) for name, value in item.items() if name not in rollups.STATUS_KEY}
+
+
+def get_uptime(params: dict) -> dict:
+    granularity = params.get('granularity', 'hour')
+    if granularity not in rollups.HEALTH_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(rollups.HEALTH_GRANULARITIES)}")
+    periods = max(1, min(int(params.get('periods', '24')), STATUS_API_MAX_PERIODS))
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    start = rollups.period(granularity, datetime.now(timezone.utc) - step * (periods - 1))
+    items = aws_clients.table(rollups.DR_ROLLUP_TABLE).query(
+        KeyConditionExpression='#series = :series AND #period >= :start',
+        ExpressionAttributeNames={'#series': 'series', '#period': 'period'},
+        ExpressionAttributeValues={':series': rollups.health_series(granularity), ':start': start}
+    )['Items']
+    return {'granularity': granularity, 'periods': [health_period(item) for item in items]}
+
+
+def get_orchestrations(params: dict) -> dict:
+    months = max(1, min(int(params.get('months', '12')), STATUS_API_MAX_PERIODS))
+    # Newest first: the 'total' item sorts after every month
+    items = aws_clients.table(rollups.DR_ROLLUP_TABLE).query(
+        KeyConditionExpression='#series = :series',
+        ExpressionAttributeNames={'#series': 'series'},
+        ExpressionAttributeValues={':series': rollups.ORCHESTRATION_SERIES},
+        ScanIndexForward=False,
+        Limit=months + 1
+    )['Items']
+    total = next((item for item in items if item['period'] == rollups.ORCHESTRATION_TOTAL), {'period': 'total'})
+    return {
+        'total': orchestration_period(total),
+        'months': [orchestration_period(item) for item in items if item is not total][:months]
+    }
+
+
+ROUTES = {
+    '/status': get_status,
+    '/uptime': get_uptime,
+    '/orchestrations': get_orchestrations
+}
+
+
+def respond(status_code: int, body: dict, cache: bool = False) -> dict:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Cache-Control': f'max-age={STATUS_API_CACHE_SECONDS}' if cache else 'no-store'
+        },
+        'body': json.dumps(body, default=plain)
+    }
+
+
+@flush_after
+def lambda_handler(event, context):
+    """Function URL handler (payload format 2.0)"""
+    set_context(run_id=getattr(context, 'aws_request_id', None))
+    method = event.get('requestContext', {}).get('http', {}).get('method', 'GET')
+    route = ROUTES.get(event.get('rawPath', '/').rstrip('/') or '/')
+    if route is None:
+        return respond(404, {'error': 'Not found', 'routes': sorted(ROUTES)})
+    if method != 'GET':
+        return respond(405, {'error': 'Method not allowed'})
+    try:
+        body = route(event.get('queryStringParameters') or {})
+    except ValueError as e:
+        return respond(400, {'error': str(e)})
+    except Exception as e:
+        log.error('Error reading rollups', path=event.get('rawPath'), error=str(e))
+        return respond(500, {'error': 'Could not read DR status'})
+    if body is None:
+        return respond(404, {'error': 'No health check recorded yet'})
+    return respond(200, body, cache=True)
@@ -0,0 +1,182 @@
+"""
+Synthetic Transaction Prober
+Runs scripted user journeys against a region's ALB and reports per-step
+latency percentiles and the journey success rate:
+
+    list_products -> view_product -> add_to_cart -> place_order
+
+The checkout steps buy one unit of the marked test SKU (products.synthetic,
+migration 0007), whose orders the backend purges after a day. They only
+run against the active region: the standby's database is a read replica,
+so there the journey stops after browsing.
+
+Latencies are also emitted as EMF value arrays (JourneyStepLatency, by
+Region and Step), so CloudWatch can chart p50/p99 over any period.
+"""
+import os
+import json
+import time
+import uuid
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+PROBE_JOURNEYS = int(os.environ.get('PROBE_JOURNEYS', '5'))
+PROBE_TIMEOUT_SECONDS = float(os.environ.get('PROBE_TIMEOUT_SECONDS', '5'))
+PROBE_PRODUCT_ID = int(os.environ.get('PROBE_PRODUCT_ID', '2000000000'))
+# Share of journeys that must complete for a region to count as working
+PROBE_MIN_SUCCESS_RATE = float(os.environ.get('PROBE_MIN_SUCCESS_RATE', '0.8'))
+
+BROWSE_STEPS = ('list_products', 'view_product')
+CHECKOUT_STEPS = ('add_to_cart', 'place_order')
+
+
+def _request(base_url: str, method: str, path: str, body: dict = None, headers: dict = None) -> tuple:
+    """(status, parsed JSON body or None, seconds); status 0 on network errors"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(f"{base_url}{path}", data=data, method=method)
+    req.add_header('Accept', 'application/json')
+    req.add_header('User-Agent', 'dr-synthetic-prober')
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    for name, value in (headers or {}).items():
+        req.add_header(name, value)
+
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(req, timeout=PROBE_TIMEOUT_SECONDS) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    except Exception:
+        return 0, None, time.monotonic() - start
+    seconds = time.monotonic() - start
+    try:
+        return status, json.loads(raw), seconds
+    except ValueError:
+        return status, None, seconds
+
+
+def run_journey(alb_dns: str, checkout: bool) -> dict:
+    """One scripted visit; stops at the first failing step"""
+    base_url = f"http://{alb_dns}"
+    steps = {}
+    journey = {'ok': False, 'steps': steps}
+
+    def step(name, expected, method, path, body=None, headers=None):
+        status, data, seconds = _request(base_url, method, path, body, headers)
+        ok = status == expected
+        steps[name] = {'status': status, 'seconds': seconds, 'ok': ok}
+        if not ok:
+            journey['failed_step'] = name
+        return data if ok else None
+
+    data = step('list_products', 200, 'GET', '/api/products')
+    if data is None:
+        return journey
+    if step('view_product', 200, 'GET', f'/api/products/{PROBE_PRODUCT_ID}') is None:
+        return journey
+    if checkout:
+        cart = step('add_to_cart', 200, 'POST', '/api/cart', {'product_id': PROBE_PRODUCT_ID, 'quantity': 1})
+        if cart is None:
+            return journey
+        order = step(
+            'place_order', 201, 'POST', '/api/orders',
+            {'cart_id': cart['cart_id'], 'items': [{'product_id': PROBE_PRODUCT_ID, 'quantity': 1}]},
+            {'Idempotency-Key': f'synthetic-{uuid.uuid4()}'}
+        )
+        if order is None:
+            return journey
+    journey['ok'] = True
+    return journey
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(journeys: list, checkout: bool) -> dict:
+    """Success rate and per-step latency percentiles for one region"""
+    steps = {}
+    for name in BROWSE_STEPS + (CHECKOUT_STEPS if checkout else ()):
+        samples = [j['steps'][name] for j in journeys if name in j['steps']]
+        latencies = [s['seconds'] for s in samples]
+        steps[name] = {
+            'count': len(samples),
+            'errors': sum(1 for s in samples if not s['ok']),
+            'statuses': sorted({s['status'] for s in samples if not s['ok']}),
+            'latencies': latencies
+        }
+        if latencies:
+            steps[name].update({
+                'p50': round(percentile(latencies, 50), 4),
+                'p90': round(percentile(latencies, 90), 4),
+                'p99': round(percentile(latencies, 99), 4),
+                'max': round(max(latencies), 4)
+            })
+    return {
+        'checkout': checkout,
+        'journeys': len(journeys),
+        'success_rate': sum(1 for j in journeys if j['ok']) / len(journeys) if journeys else 0.0,
+        'steps': steps
+    }
+
+
+def passing(summary: dict) -> bool:
+    return summary['success_rate'] >= PROBE_MIN_SUCCESS_RATE
+
+
+def probe_regions(targets: dict, journeys: int = PROBE_JOURNEYS) -> dict:
+    """Run journeys concurrently in every region
+
+    targets maps region -> (alb_dns, checkout); regions without an ALB
+    are skipped.
+    """
+    targets = {region: target for region, target in targets.items() if target[0]}
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(targets) * journeys) as pool:
+        futures = {
+            region: [pool.submit(run_journey, alb_dns, checkout) for _ in range(journeys)]
+            for region, (alb_dns, checkout) in targets.items()
+        }
+        return {
+            region: summarize([f.result() for f in region_futures], targets[region][1])
+            for region, region_futures in futures.items()
+        }
+
+
+def emit_metrics(log, results: dict):
+    """One EMF line per region and step, carrying every latency sample"""
+    for region, summary in results.items():
+        log.metrics(
+            {'JourneySuccessRate': summary['success_rate']},
+            {'JourneySuccessRate': 'None'},
+            {'Region': region},
+            msg='synthetic journeys', level='INFO' if summary['success_rate'] == 1 else 'WARNING',
+            journeys=summary['journeys'], checkout=summary['checkout']
+        )
+        for name, step in summary['steps'].items():
+            if not step['latencies']:
+                continue
+            log.metrics(
+                {'JourneyStepLatency': step['latencies'], 'JourneyStepErrors': step['errors']},
+                {'JourneyStepLatency': 'Seconds', 'JourneyStepErrors': 'Count'},
+                {'Region': region, 'Step': name},
+                msg='synthetic step', level='DEBUG' if not step['errors'] else 'WARNING',
+                statuses=step['statuses']
+            )
+
+
+def without_samples(results: dict) -> dict:
+    """Results with the raw latency lists dropped, for state rows and alerts"""
+    return {
+        region: dict(summary, steps={
+            name: {k: v for k, v in step.items() if k != 'latencies'}
+            for name, step in summary['steps'].items()
+        })
+        for region, summary in results.items()
+    }
@@ -93,6 +93,53 @@ variable "rpo_target_seconds" {
   default = 60
 }
 
+variable "auto_failover_mode" {
+  description = "Health checker auto-failover policy: off, dry_run (notify only) or enabled"
+  type        = string
+  default     = "dry_run"
+
+  validation {
+    condition     = contains(["off", "dry_run", "enabled"], var.auto_failover_mode)
+    error_message = "auto_failover_mode must be off, dry_run or enabled."
+  }
+}
+
+variable "failover_consecutive_failures" {
+  description = "Consecutive failing health checks (one per minute) before auto-failover"
+  type        = number
+  default     = 3
+}
+
+variable "failover_quorum" {
+  description = "Independent probes (ALB probe, RDS status, Route 53 checkers) that must see the primary down"
+  type        = number
+  default     = 2
+}
+
+variable "synthetic_probes_enabled" {
+  description = "Run synthetic browse/checkout journeys from the health checker"
+  type        = bool
+  default     = true
+}
+
+variable "synthetic_probe_journeys" {
+  description = "Concurrent synthetic journeys per region per health check"
+  type        = number
+  default     = 5
+}
+
+variable "lambda_snapstart" {
+  description = "Run the lambdas from SnapStart snapshots (callers invoke the published version)"
+  type        = bool
+  default     = false
+}
+
+variable "warmup_token" {
+  description = "Shared secret for the backend's POST /api/internal/warmup, stored in Secrets Manager for the failover orchestrator"
+  type        = string
+  sensitive   = true
+}
+
 variable "sns_topic_arn" {
   type    = string
   default = ""
@@ -144,6 +191,33 @@ resource "aws_dynamodb_table" "dr_state" {
   }
 }
 
+# Dashboard rollups (see lambda/rollups.py): one item per series and period
+resource "aws_dynamodb_table" "dr_rollups" {
+  name         = "${var.project_name}-dr-rollups"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "series"
+  range_key    = "period"
+
+  attribute {
+    name = "series"
+    type = "S"
+  }
+
+  attribute {
+    name = "period"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.project_name}-dr-rollups-table"
+  }
+}
+
 # -----------------------------------------------------------------------------
 # SSM Parameter - Active Region
 # -----------------------------------------------------------------------------
@@ -162,6 +236,27 @@ resource "aws_ssm_parameter" "active_region" {
   }
 }
 
+# -----------------------------------------------------------------------------
+# Secrets Manager - Warm-up Token
+# -----------------------------------------------------------------------------
+
+# Read by the failover orchestrator at run time, so the token is not in the
+# function's configuration
+resource "aws_secretsmanager_secret" "warmup_token" {
+  name = "${var.project_name}-control-plane-warmup-token"
+
+  recovery_window_in_days = 7
+
+  tags = {
+    Name = "${var.project_name}-control-plane-warmup-token"
+  }
+}
+
+resource "aws_secretsmanager_secret_version" "warmup_token" {
+  secret_id     = aws_secretsmanager_secret.warmup_token.id
+  secret_string = var.warmup_token
+}
+
 # -----------------------------------------------------------------------------
 # Route 53 - Hosted Zone (use existing if domain is configured)
 # -----------------------------------------------------------------------------
@@ -291,7 +386,10 @@ resource "aws_iam_role_policy" "lambda_dr_policy" {
           "dynamodb:Query",
           "dynamodb:Scan"
         ]
-        Resource = aws_dynamodb_table.dr_state.arn
+        Resource = [
+          aws_dynamodb_table.dr_state.arn,
+          aws_dynamodb_table.dr_rollups.arn
+        ]
       },
       {
         Effect = "Allow"
@@ -306,7 +404,12 @@ resource "aws_iam_role_policy" "lambda_dr_policy" {
           "ssm:GetParameter",
           "ssm:PutParameter"
         ]
-        Resource = aws_ssm_parameter.active_region.arn
+        # Mirrored into the application regions for the backend's write fencing
+        Resource = [
+          aws_ssm_parameter.active_region.arn,
+          "arn:aws:ssm:${var.primary_region}:*:parameter${aws_ssm_parameter.active_region.name}",
+          "arn:aws:ssm:${var.dr_region}:*:parameter${aws_ssm_parameter.active_region.name}"
+        ]
       },
       {
         Effect = "Allow"
@@ -328,16 +431,34 @@ resource "aws_iam_role_policy" "lambda_dr_policy" {
         Effect = "Allow"
         Action = [
           "route53:ChangeResourceRecordSets",
-          "route53:GetHealthCheck"
+          "route53:GetHealthCheck",
+          "route53:GetHealthCheckStatus"
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = [
+          aws_lambda_function.failover_orchestrator.arn,
+          "${aws_lambda_function.failover_orchestrator.arn}:*"
+        ]
+      },
       {
         Effect = "Allow"
         Action = [
           "cloudwatch:GetMetricStatistics"
         ]
         Resource = "*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "secretsmanager:GetSecretValue"
+        ]
+        Resource = aws_secretsmanager_secret.warmup_token.arn
       }
     ]
   })
@@ -347,23 +468,149 @@ resource "aws_iam_role_policy" "lambda_dr_policy" {
 # Lambda Functions
 # -----------------------------------------------------------------------------
 
+# The lambdas share the backend's structured logging module, the lazy AWS
+# client cache, the dashboard rollups, the orchestration lease and the
+# synthetic journeys
+locals {
+  structured_logging_source = "${path.module}/../../../src/ecommerce/backend/structured_logging.py"
+  aws_clients_source        = "${path.module}/lambda/aws_clients.py"
+  rollups_source            = "${path.module}/lambda/rollups.py"
+  lease_source              = "${path.module}/lambda/lease.py"
+  synthetic_prober_source   = "${path.module}/lambda/synthetic_prober.py"
+}
+
 # Package Lambda functions
 data "archive_file" "health_checker" {
   type        = "zip"
-  source_file = "${path.module}/lambda/health_checker.py"
   output_path = "${path.module}/lambda/health_checker.zip"
+
+  source {
+    content  = file("${path.module}/lambda/health_checker.py")
+    filename = "health_checker.py"
+  }
+
+  source {
+    content  = file(local.structured_logging_source)
+    filename = "structured_logging.py"
+  }
+
+  source {
+    content  = file(local.aws_clients_source)
+    filename = "aws_clients.py"
+  }
+
+  source {
+    content  = file(local.rollups_source)
+    filename = "rollups.py"
+  }
+
+  source {
+    content  = file(local.lease_source)
+    filename = "lease.py"
+  }
+
+  source {
+    content  = file(local.synthetic_prober_source)
+    filename = "synthetic_prober.py"
+  }
 }
 
 data "archive_file" "failover_orchestrator" {
   type        = "zip"
-  source_file = "${path.module}/lambda/failover_orchestrator.py"
   output_path = "${path.module}/lambda/failover_orchestrator.zip"
+
+  source {
+    content  = file("${path.module}/lambda/failover_orchestrator.py")
+    filename = "failover_orchestrator.py"
+  }
+
+  source {
+    content  = file(local.structured_logging_source)
+    filename = "structured_logging.py"
+  }
+
+  source {
+    content  = file(local.aws_clients_source)
+    filename = "aws_clients.py"
+  }
+
+  source {
+    content  = file(local.rollups_source)
+    filename = "rollups.py"
+  }
+
+  source {
+    content  = file(local.lease_source)
+    filename = "lease.py"
+  }
+
+  source {
+    content  = file(local.synthetic_prober_source)
+    filename = "synthetic_prober.py"
+  }
 }
 
 data "archive_file" "failback_orchestrator" {
   type        = "zip"
-  source_file = "${path.module}/lambda/failback_orchestrator.py"
   output_path = "${path.module}/lambda/failback_orchestrator.zip"
+
+  source {
+    content  = file("${path.module}/lambda/failback_orchestrator.py")
+    filename = "failback_orchestrator.py"
+  }
+
+  source {
+    content  = file(local.structured_logging_source)
+    filename = "structured_logging.py"
+  }
+
+  source {
+    content  = file(local.aws_clients_source)
+    filename = "aws_clients.py"
+  }
+
+  source {
+    content  = file(local.rollups_source)
+    filename = "rollups.py"
+  }
+
+  source {
+    content  = file(local.lease_source)
+    filename = "lease.py"
+  }
+}
+
+data "archive_file" "status_api" {
+  type        = "zip"
+  output_path = "${path.module}/lambda/status_api.zip"
+
+  source {
+    content  = file("${path.module}/lambda/status_api.py")
+    filename = "status_api.py"
+  }
+
+  source {
+    content  = file(local.structured_logging_source)
+    filename = "structured_logging.py"
+  }
+
+  source {
+    content  = file(local.aws_clients_source)
+    filename = "aws_clients.py"
+  }
+
+  source {
+    content  = file(local.rollups_source)
+    filename = "rollups.py"
+  }
+}
+
+# A SnapStart snapshot only exists for published versions, so with it
+# enabled every caller invokes the version this apply published
+locals {
+  health_checker_invoke_arn        = var.lambda_snapstart ? aws_lambda_function.health_checker.qualified_arn : aws_lambda_function.health_checker.arn
+  failover_orchestrator_invoke_arn = var.lambda_snapstart ? aws_lambda_function.failover_orchestrator.qualified_arn : aws_lambda_function.failover_orchestrator.arn
+  failback_orchestrator_invoke_arn = var.lambda_snapstart ? aws_lambda_function.failback_orchestrator.qualified_arn : aws_lambda_function.failback_orchestrator.arn
 }
 
 # Health Checker Lambda
@@ -373,10 +620,18 @@ resource "aws_lambda_function" "health_checker" {
   role             = aws_iam_role.lambda_execution.arn
   handler          = "health_checker.lambda_handler"
   source_code_hash = data.archive_file.health_checker.output_base64sha256
-  runtime          = "python3.11"
+  runtime          = "python3.12"
+  publish          = var.lambda_snapstart
   timeout          = 60
   memory_size      = 256
 
+  dynamic "snap_start" {
+    for_each = var.lambda_snapstart ? [1] : []
+    content {
+      apply_on = "PublishedVersions"
+    }
+  }
+
   environment {
     variables = {
       PRIMARY_REGION       = var.primary_region
@@ -384,9 +639,20 @@ resource "aws_lambda_function" "health_checker" {
       PRIMARY_ALB_DNS      = var.primary_alb_dns
       DR_ALB_DNS           = var.dr_alb_dns
       DR_STATE_TABLE       = aws_dynamodb_table.dr_state.name
+      DR_ROLLUP_TABLE      = aws_dynamodb_table.dr_rollups.name
       SNS_TOPIC_ARN        = aws_sns_topic.dr_alerts.arn
       PRIMARY_DB_IDENTIFIER = var.primary_db_identifier
       DR_DB_IDENTIFIER      = var.dr_db_identifier
+      PRIMARY_HEALTH_CHECK_ID = var.domain_name != "" ? aws_route53_health_check.primary_alb[0].id : ""
+
+      AUTO_FAILOVER_MODE            = var.auto_failover_mode
+      FAILOVER_FUNCTION_NAME        = local.failover_orchestrator_invoke_arn
+      FAILOVER_CONSECUTIVE_FAILURES = tostring(var.failover_consecutive_failures)
+      FAILOVER_QUORUM               = tostring(var.failover_quorum)
+      FAILOVER_MAX_LAG_SECONDS      = tostring(var.rpo_target_seconds)
+
+      PROBE_ENABLED  = tostring(var.synthetic_probes_enabled)
+      PROBE_JOURNEYS = tostring(var.synthetic_probe_journeys)
     }
   }
 
@@ -402,10 +668,18 @@ resource "aws_lambda_function" "failover_orchestrator" {
   role             = aws_iam_role.lambda_execution.arn
   handler          = "failover_orchestrator.lambda_handler"
   source_code_hash = data.archive_file.failover_orchestrator.output_base64sha256
-  runtime          = "python3.11"
+  runtime          = "python3.12"
+  publish          = var.lambda_snapstart
   timeout          = 900  # 15 minutes for failover
   memory_size      = 256
 
+  dynamic "snap_start" {
+    for_each = var.lambda_snapstart ? [1] : []
+    content {
+      apply_on = "PublishedVersions"
+    }
+  }
+
   environment {
     variables = {
       PRIMARY_REGION          = var.primary_region
@@ -421,7 +695,10 @@ resource "aws_lambda_function" "failover_orchestrator" {
       DR_ALB_ZONE_ID          = var.dr_alb_zone_id
       SSM_ACTIVE_REGION_PARAM = aws_ssm_parameter.active_region.name
       DR_STATE_TABLE          = aws_dynamodb_table.dr_state.name
+      DR_ROLLUP_TABLE         = aws_dynamodb_table.dr_rollups.name
       SNS_TOPIC_ARN           = aws_sns_topic.dr_alerts.arn
+      WARMUP_TOKEN_SECRET_ARN = aws_secretsmanager_secret_version.warmup_token.arn
+      RTO_TARGET_SECONDS      = tostring(var.rto_target_minutes * 60)
     }
   }
 
@@ -430,6 +707,14 @@ resource "aws_lambda_function" "failover_orchestrator" {
   }
 }
 
+# Auto-failover invokes asynchronously; a retried event must not start a
+# second failover (the health checker decides again next minute instead)
+resource "aws_lambda_function_event_invoke_config" "failover_orchestrator" {
+  function_name          = aws_lambda_function.failover_orchestrator.function_name
+  qualifier              = var.lambda_snapstart ? aws_lambda_function.failover_orchestrator.version : null
+  maximum_retry_attempts = 0
+}
+
 # Failback Orchestrator Lambda
 resource "aws_lambda_function" "failback_orchestrator" {
   filename         = data.archive_file.failback_orchestrator.output_path
@@ -437,10 +722,18 @@ resource "aws_lambda_function" "failback_orchestrator" {
   role             = aws_iam_role.lambda_execution.arn
   handler          = "failback_orchestrator.lambda_handler"
   source_code_hash = data.archive_file.failback_orchestrator.output_base64sha256
-  runtime          = "python3.11"
+  runtime          = "python3.12"
+  publish          = var.lambda_snapstart
   timeout          = 900  # 15 minutes for failback
   memory_size      = 256
 
+  dynamic "snap_start" {
+    for_each = var.lambda_snapstart ? [1] : []
+    content {
+      apply_on = "PublishedVersions"
+    }
+  }
+
   environment {
     variables = {
       PRIMARY_REGION            = var.primary_region
@@ -459,6 +752,7 @@ resource "aws_lambda_function" "failback_orchestrator" {
       PRIMARY_ALB_ZONE_ID       = var.primary_alb_zone_id
       SSM_ACTIVE_REGION_PARAM   = aws_ssm_parameter.active_region.name
       DR_STATE_TABLE            = aws_dynamodb_table.dr_state.name
+      DR_ROLLUP_TABLE           = aws_dynamodb_table.dr_rollups.name
       SNS_TOPIC_ARN             = aws_sns_topic.dr_alerts.arn
     }
   }
@@ -468,6 +762,85 @@ resource "aws_lambda_function" "failback_orchestrator" {
   }
 }
 
+# Dashboard read API over the rollups; callers sign requests (SigV4)
+# The status API is reachable from outside through its function URL, so it
+# runs with its own role: read-only on the rollups and its own log group
+resource "aws_iam_role" "status_api" {
+  name = "${var.project_name}-status-api-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action = "sts:AssumeRole"
+      Effect = "Allow"
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+
+  tags = {
+    Name = "${var.project_name}-status-api-role"
+  }
+}
+
+resource "aws_iam_role_policy" "status_api" {
+  name = "${var.project_name}-status-api-policy"
+  role = aws_iam_role.status_api.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = [
+          "arn:aws:logs:*:*:log-group:/aws/lambda/${var.project_name}-status-api",
+          "arn:aws:logs:*:*:log-group:/aws/lambda/${var.project_name}-status-api:*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:Query"
+        ]
+        Resource = aws_dynamodb_table.dr_rollups.arn
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_function" "status_api" {
+  filename         = data.archive_file.status_api.output_path
+  function_name    = "${var.project_name}-status-api"
+  role             = aws_iam_role.status_api.arn
+  handler          = "status_api.lambda_handler"
+  source_code_hash = data.archive_file.status_api.output_base64sha256
+  runtime          = "python3.12"
+  timeout          = 10
+  memory_size      = 256
+
+  environment {
+    variables = {
+      DR_ROLLUP_TABLE = aws_dynamodb_table.dr_rollups.name
+    }
+  }
+
+  tags = {
+    Name = "${var.project_name}-status-api"
+  }
+}
+
+resource "aws_lambda_function_url" "status_api" {
+  function_name      = aws_lambda_function.status_api.function_name
+  authorization_type = "AWS_IAM"
+}
+
 # -----------------------------------------------------------------------------
 # CloudWatch Event Rule - Health Checker Schedule
 # -----------------------------------------------------------------------------
@@ -485,13 +858,14 @@ resource "aws_cloudwatch_event_rule" "health_check_schedule" {
 resource "aws_cloudwatch_event_target" "health_check" {
   rule      = aws_cloudwatch_event_rule.health_check_schedule.name
   target_id = "health-checker"
-  arn       = aws_lambda_function.health_checker.arn
+  arn       = local.health_checker_invoke_arn
 }
 
 resource "aws_lambda_permission" "health_check_eventbridge" {
   statement_id  = "AllowEventBridge"
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.health_checker.function_name
+  qualifier     = var.lambda_snapstart ? aws_lambda_function.health_checker.version : null
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.health_check_schedule.arn
 }
@@ -563,7 +937,10 @@ resource "aws_iam_role_policy" "step_functions_policy" {
         Resource = [
           aws_lambda_function.health_checker.arn,
           aws_lambda_function.failover_orchestrator.arn,
-          aws_lambda_function.failback_orchestrator.arn
+          aws_lambda_function.failback_orchestrator.arn,
+          "${aws_lambda_function.health_checker.arn}:*",
+          "${aws_lambda_function.failover_orchestrator.arn}:*",
+          "${aws_lambda_function.failback_orchestrator.arn}:*"
         ]
       },
       {
@@ -587,7 +964,7 @@ resource "aws_sfn_state_machine" "failover" {
     States = {
       CheckPrimaryHealth = {
         Type     = "Task"
-        Resource = aws_lambda_function.health_checker.arn
+        Resource = local.health_checker_invoke_arn
         Next     = "EvaluateHealth"
         Catch = [{
           ErrorEquals = ["States.ALL"]
@@ -608,7 +985,7 @@ resource "aws_sfn_state_machine" "failover" {
       }
       InitiateFailover = {
         Type     = "Task"
-        Resource = aws_lambda_function.failover_orchestrator.arn
+        Resource = local.failover_orchestrator_invoke_arn
         Next     = "FailoverComplete"
         Catch = [{
           ErrorEquals = ["States.ALL"]
@@ -646,7 +1023,7 @@ resource "aws_sfn_state_machine" "failback" {
     States = {
       InitiateFailback = {
         Type     = "Task"
-        Resource = aws_lambda_function.failback_orchestrator.arn
+        Resource = local.failback_orchestrator_invoke_arn
         Next     = "FailbackComplete"
         Catch = [{
           ErrorEquals = ["States.ALL"]
@@ -693,6 +1070,16 @@ output "dr_state_table_name" {
   value       = aws_dynamodb_table.dr_state.name
 }
 
+output "dr_rollup_table_name" {
+  description = "DynamoDB table holding the dashboard rollups"
+  value       = aws_dynamodb_table.dr_rollups.name
+}
+
+output "status_api_url" {
+  description = "Function URL of the DR status read API (IAM-authenticated)"
+  value       = aws_lambda_function_url.status_api.function_url
+}
+
 output "active_region_parameter" {
   description = "SSM parameter for active region"
   value       = aws_ssm_parameter.active_region.name
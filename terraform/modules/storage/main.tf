@@ -211,6 +211,9 @@ resource "aws_s3_bucket_replication_configuration" "primary_to_dr" {
   role   = aws_iam_role.replication.arn
   bucket = aws_s3_bucket.primary.id
 
+  # Also carries order-outbox/: the primary's backends ship order events to
+  # their own bucket (the task subnets only reach same-region S3) and this
+  # rule copies them to the DR bucket, where failover replays them
   rule {
     id     = "replicate-all-objects"
     status = "Enabled"
@@ -88,6 +88,11 @@ output "dr_state_table" {
   value       = module.control_plane.dr_state_table_name
 }
 
+output "status_api_url" {
+  description = "DR status read API for the dashboard (IAM-authenticated function URL)"
+  value       = module.control_plane.status_api_url
+}
+
 output "health_checker_function" {
   description = "Health checker Lambda function name"
   value       = module.control_plane.health_checker_function_name
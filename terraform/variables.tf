@@ -154,6 +154,30 @@ variable "rpo_target_seconds" {
   default     = 30
 }
 
+variable "auto_failover_mode" {
+  description = "Automatic failover from health checks: off, dry_run (notify only) or enabled"
+  type        = string
+  default     = "dry_run"
+}
+
+variable "dr_queue_checkouts_while_read_only" {
+  description = "Accept keyed checkouts in DR before promotion and place them once the database is writable"
+  type        = bool
+  default     = false
+}
+
+variable "write_fencing_mode" {
+  description = "What backend tasks do with writes that reach the passive region: reject, forward (to the active region; needs internet egress from the task subnets) or off"
+  type        = string
+  default     = "reject"
+}
+
+variable "control_plane_lambda_snapstart" {
+  description = "Start the control-plane lambdas from SnapStart snapshots to cut cold starts"
+  type        = bool
+  default     = false
+}
+
 variable "replication_lag_alarm_threshold" {
   description = "RDS replication lag alarm threshold in seconds"
   type        = number